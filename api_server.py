@@ -0,0 +1,194 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import sys
+import time
+
+import asyncpg
+
+# Impor dari file proyek
+from utils.logger import setup_logging
+import config # Impor config untuk akses variabel
+from database import get_db_pool, close_db_pool, SCRIPT_CATALOG_CHANNEL
+from migrations import run_migrations
+from script_api import ScriptAPI
+
+log = logging.getLogger(__name__)
+
+def configure_logging():
+    """Setup logging dengan opsi dari config (dipanggil di proses utama dan tiap worker)."""
+    setup_logging(
+        level=config.LOG_LEVEL,
+        use_queue=config.LOG_QUEUE,
+        json_output=config.LOG_JSON,
+        sample_rates=config.LOG_SAMPLE_RATES,
+        queue_size=config.LOG_QUEUE_SIZE,
+    )
+
+# --- Tier API Terpisah ---
+# Menjalankan /get_script di N proses worker yang berbagi port lewat SO_REUSEPORT,
+# terpisah dari event loop bot Discord. Tiap worker punya pool asyncpg dan katalog
+# sendiri; katalog diisi dari tabel script_catalog yang dipublikasikan bot
+# (CATALOG_PUBLISH=true) dan di-update lewat LISTEN/NOTIFY.
+
+async def catalog_listener_loop(api: ScriptAPI, pool):
+    """Menjaga koneksi LISTEN ke channel katalog dan reload katalog saat ada NOTIFY."""
+    changed = asyncio.Event()
+    listener_conn = None
+
+    def on_notify(connection, pid, channel, payload):
+        changed.set()
+
+    try:
+        while True:
+            if listener_conn is None or listener_conn.is_closed():
+                try:
+                    listener_conn = await asyncpg.connect(config.SUPABASE_DB_URL)
+                    await listener_conn.add_listener(SCRIPT_CATALOG_CHANNEL, on_notify)
+                    changed.set() # Reload sekali setelah (re)connect supaya tidak ada NOTIFY yang terlewat
+                except Exception as e:
+                    log.error(f"Worker API: gagal LISTEN ke channel katalog: {e}")
+                    listener_conn = None
+            try:
+                await asyncio.wait_for(changed.wait(), timeout=config.API_CATALOG_RELOAD_SECONDS)
+            except asyncio.TimeoutError:
+                pass # Reload penuh berkala sebagai cadangan
+            changed.clear()
+            await api.load_catalog_db()
+    finally:
+        if listener_conn is not None and not listener_conn.is_closed():
+            await listener_conn.close()
+
+async def run_worker(worker_id: int):
+    """Satu proses worker API: pool sendiri, katalog sendiri, socket SO_REUSEPORT."""
+    started = time.perf_counter()
+    pool = await get_db_pool(config.SUPABASE_DB_URL)
+    if not pool:
+        log.critical(f"Worker API {worker_id}: gagal membuat database pool.")
+        return
+    pool_done = time.perf_counter()
+    if not await run_migrations(pool):
+        log.critical(f"Worker API {worker_id}: migrasi database gagal.")
+        await close_db_pool(pool)
+        return
+    migrations_done = time.perf_counter()
+
+    # Socket baru dibuka setelah hangat: dengan SO_REUSEPORT kernel langsung membagi
+    # koneksi ke worker yang listen, jadi worker dingin tidak boleh ikut menerima request
+    api = ScriptAPI(pool)
+    await asyncio.gather(api.load_catalog_db(), api.warm_up_with_retry())
+    warm_done = time.perf_counter()
+    listener_task = asyncio.create_task(catalog_listener_loop(api, pool))
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    # Socket yang diwariskan (WEB_LISTEN_FD) dipakai bersama semua worker hasil fork
+    if await api.start("0.0.0.0", config.WEB_SERVER_PORT, reuse_port=config.WEB_LISTEN_FD is None, listen_fd=config.WEB_LISTEN_FD):
+        listen_done = time.perf_counter()
+        log.info(
+            f"Worker API {worker_id} (PID {os.getpid()}) siap dalam {listen_done - started:.2f} detik "
+            f"(pool {pool_done - started:.2f}, migrasi {migrations_done - pool_done:.2f}, "
+            f"katalog+warm-up {warm_done - migrations_done:.2f}, listen {listen_done - warm_done:.2f})."
+        )
+        await stop_event.wait()
+
+    log.info(f"Worker API {worker_id} berhenti...")
+    listener_task.cancel()
+    try:
+        await listener_task
+    except asyncio.CancelledError:
+        pass
+    await api.drain()
+    await close_db_pool(pool)
+
+# Worker yang berjalan selama ini sebelum mati tidak dianggap crash loop (backoff direset)
+WORKER_STABLE_SECONDS = 60
+
+def worker_main(worker_id: int):
+    # Handler sinyal supervisor ikut ter-fork; worker memasang handler sendiri di run_worker
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    configure_logging()
+    asyncio.run(run_worker(worker_id))
+
+def main():
+    workers = config.API_WORKERS or os.cpu_count() or 1
+    log.info(f"Memulai api_server dengan {workers} worker di port {config.WEB_SERVER_PORT}...")
+    if workers == 1:
+        asyncio.run(run_worker(0))
+        return
+
+    processes = {}
+    started_at = {}  # worker_id -> waktu start (monotonic)
+    failures = {}    # worker_id -> jumlah crash beruntun
+    respawn_at = {}  # worker_id -> waktu restart berikutnya (menunggu backoff)
+    stopping = False
+    gave_up = False
+
+    def spawn(worker_id: int):
+        process = multiprocessing.Process(target=worker_main, args=(worker_id,), name=f"api-worker-{worker_id}")
+        process.start()
+        processes[worker_id] = process
+        started_at[worker_id] = time.monotonic()
+
+    def handle_stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for process in processes.values():
+            if process.is_alive():
+                process.terminate() # SIGTERM: worker berhenti dengan rapi
+
+    signal.signal(signal.SIGTERM, handle_stop)
+    signal.signal(signal.SIGINT, handle_stop)
+
+    for worker_id in range(workers):
+        spawn(worker_id)
+
+    # Supervisor: jalankan ulang worker yang mati dengan backoff eksponensial (1, 2, 4, ... detik).
+    # Worker yang crash terus (mis. database mati, config salah) tidak di-restart tanpa henti:
+    # setelah API_WORKER_MAX_RESTARTS crash beruntun api_server berhenti dengan exit code 1,
+    # supaya platform (Koyeb/systemd) yang menangani dan errornya terlihat.
+    while not stopping:
+        time.sleep(1)
+        now = time.monotonic()
+        for worker_id, process in list(processes.items()):
+            if process.is_alive() or stopping:
+                continue
+            if worker_id in respawn_at:
+                if now >= respawn_at[worker_id]:
+                    del respawn_at[worker_id]
+                    spawn(worker_id)
+                continue
+            # Worker yang sempat berjalan stabil dihitung sebagai crash pertama lagi
+            if now - started_at[worker_id] >= WORKER_STABLE_SECONDS:
+                failures[worker_id] = 0
+            failures[worker_id] = failures.get(worker_id, 0) + 1
+            if failures[worker_id] > config.API_WORKER_MAX_RESTARTS:
+                log.critical(f"Worker API {worker_id} crash {failures[worker_id]} kali berturut-turut "
+                             f"(exit code {process.exitcode}), api_server berhenti.")
+                gave_up = True
+                handle_stop(signal.SIGTERM, None)
+                break
+            delay = min(config.API_WORKER_RESTART_MAX_DELAY, 2 ** (failures[worker_id] - 1))
+            respawn_at[worker_id] = now + delay
+            log.warning(f"Worker API {worker_id} berhenti (exit code {process.exitcode}), "
+                        f"dijalankan ulang dalam {delay:.0f} detik (crash ke-{failures[worker_id]})...")
+
+    for process in processes.values():
+        process.join(timeout=config.WEB_DRAIN_READY_DELAY + config.WEB_DRAIN_TIMEOUT + 5) # Beri waktu worker drain
+    log.info("api_server selesai.")
+    if gave_up:
+        sys.exit(1)
+
+# --- Menjalankan API Server ---
+if __name__ == "__main__":
+    configure_logging()
+    if not config.SUPABASE_DB_URL:
+        log.critical("Environment variable SUPABASE_DB_URL tidak ditemukan!")
+    else:
+        main()
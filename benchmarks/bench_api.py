@@ -0,0 +1,392 @@
+"""Benchmark / load test untuk API lisensi (/get_script).
+
+Menjalankan aiohttp app milik WebserverCog secara lokal dengan pengganti
+(stand-in) database dan channel Discord palsu, lalu mengirim campuran request
+(valid, invalid, salah script) secara konkuren dan melaporkan req/s serta
+latency p50/p95/p99. Hasil disimpan ke JSON supaya bisa dibandingkan dengan
+baseline sebelumnya.
+
+Contoh:
+    python -m benchmarks.bench_api --requests 20000 --concurrency 100
+    python -m benchmarks.bench_api --db-latency-ms 5 --baseline bench_baseline.json
+    python -m benchmarks.bench_api --dsn postgresql://localhost/bench   # Postgres lokal
+    python -m benchmarks.bench_api --request-format form --no-keepalive # Format ringkas, koneksi baru per request
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import string
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Dict, List
+from urllib.parse import urlencode
+
+# Env var wajib dari config.py; nilai dummy cukup untuk benchmark lokal
+for _name, _value in {
+    "TOKEN": "bench",
+    "SUPABASE_DB_URL": "postgresql://bench",
+    "ADMIN_ROLE_ID": "1",
+    "SALES_ROLE_ID": "2",
+    "SCRIPT_CHANNEL_ID": "3",
+    "PURCHASE_LOG_CHANNEL_ID": "4",
+    "PURCHASED_LICENSE_ROLE_ID": "5",
+    "RATE_LIMIT_ENABLED": "false", # Semua request benchmark datang dari 127.0.0.1
+}.items():
+    os.environ.setdefault(_name, _value)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aiohttp # noqa: E402
+import discord # noqa: E402
+from aiohttp import web # noqa: E402
+
+import config # noqa: E402
+import database # noqa: E402
+import migrations # noqa: E402
+from cogs.webserver_cog import WebserverCog # noqa: E402
+from utils.fast_json import get_json_codec # noqa: E402
+from utils.license_keys import license_key_digest # noqa: E402
+
+# --- Stand-in Database ---
+
+class FakeConnection:
+    """Pengganti koneksi asyncpg untuk query yang dipakai jalur /get_script."""
+
+    def __init__(self, pool: "FakePool"):
+        self.pool = pool
+        self.prepared = {}
+
+    async def _roundtrip(self):
+        self.pool.queries += 1
+        if self.pool.latency:
+            await asyncio.sleep(self.pool.latency)
+
+    async def fetchrow(self, sql, *args):
+        await self._roundtrip()
+        # Digest selalu parameter key terakhir (lihat database.license_key_args)
+        script_name = self.pool.licenses.get(args[-1])
+        return {"script_name": script_name, "expires_at": None} if script_name is not None else None
+
+    async def fetch(self, sql, *args):
+        await self._roundtrip()
+        return [{"key_hash": digest, "script_name": self.pool.licenses[digest], "expires_at": None}
+                for digest in args[-1] if digest in self.pool.licenses]
+
+    async def fetchval(self, sql, *args):
+        await self._roundtrip()
+        return None
+
+class _FakeAcquire:
+    def __init__(self, pool: "FakePool"):
+        self.pool = pool
+
+    async def __aenter__(self):
+        await self.pool.semaphore.acquire()
+        return FakeConnection(self.pool)
+
+    async def __aexit__(self, *exc):
+        self.pool.semaphore.release()
+
+class FakePool:
+    """Pengganti asyncpg.Pool: dict in-memory dengan latency per query dan batas koneksi."""
+
+    def __init__(self, licenses: Dict[str, str], latency_ms: float, max_size: int):
+        # Seperti tabel licenses: diindeks dengan digest key, bukan plaintext
+        self.licenses = {license_key_digest(key): script for key, script in licenses.items()}
+        self.latency = latency_ms / 1000
+        self.max_size = max_size
+        self.semaphore = asyncio.Semaphore(max_size)
+        self.queries = 0
+
+    def acquire(self):
+        return _FakeAcquire(self)
+
+    def get_size(self):
+        return self.max_size
+
+    def get_idle_size(self):
+        return self.semaphore._value
+
+    def get_max_size(self):
+        return self.max_size
+
+    async def close(self):
+        pass
+
+# --- Stand-in Discord ---
+
+class FakeAttachment:
+    def __init__(self, attachment_id: int, filename: str):
+        self.id = attachment_id
+        self.filename = filename
+        self.url = f"https://cdn.discordapp.com/attachments/3/{attachment_id}/{filename}"
+
+class FakeMessage:
+    def __init__(self, message_id: int, attachments: List[FakeAttachment]):
+        self.id = message_id
+        self.attachments = attachments
+
+class FakeScriptChannel(discord.TextChannel):
+    """Channel script palsu: history() dari list pesan in-memory, dengan latency per halaman."""
+
+    def __init__(self, messages: List[FakeMessage], page_latency_ms: float):
+        self.id = config.SCRIPT_CHANNEL_ID
+        self.messages = messages # Urut dari yang terlama
+        self.page_latency = page_latency_ms / 1000
+        self.history_calls = 0
+
+    async def history(self, *, limit=100, oldest_first=None, **kwargs):
+        self.history_calls += 1
+        messages = self.messages if oldest_first else list(reversed(self.messages))
+        if limit is not None:
+            messages = messages[:limit]
+        for index, message in enumerate(messages):
+            if index % 100 == 0 and self.page_latency: # Satu request API per 100 pesan
+                await asyncio.sleep(self.page_latency)
+            yield message
+
+class FakeBot:
+    def __init__(self, channel: FakeScriptChannel):
+        self.channel = channel
+
+    def get_channel(self, channel_id):
+        return self.channel if channel_id == self.channel.id else None
+
+    async def fetch_channel(self, channel_id):
+        return self.get_channel(channel_id)
+
+# --- Data Uji ---
+
+def random_key() -> str:
+    return "".join(random.choices(string.ascii_uppercase + string.digits, k=16))
+
+def build_fixtures(args):
+    scripts = [f"script_{i}.lua" for i in range(args.scripts)]
+    licenses = {random_key(): random.choice(scripts) for _ in range(args.licenses)}
+    messages = []
+    for message_id in range(1, args.channel_messages + 1):
+        # Script diletakkan di pesan-pesan terbaru, sisanya pesan tanpa attachment
+        script_index = args.channel_messages - message_id
+        attachments = [FakeAttachment(10_000 + message_id, scripts[script_index])] if script_index < len(scripts) else []
+        messages.append(FakeMessage(message_id, attachments))
+    return scripts, licenses, messages
+
+def build_request_mix(args, scripts: List[str], licenses: Dict[str, str]):
+    """Membuat daftar (jenis, body) sesuai bobot campuran request."""
+    keys = list(licenses)
+    kinds = ["valid", "invalid", "wrong_script"]
+    weights = [args.valid_ratio, args.invalid_ratio, args.wrong_script_ratio]
+    requests = []
+    for kind in random.choices(kinds, weights=weights, k=args.requests):
+        if kind == "valid":
+            key = random.choice(keys[:args.hot_keys] if args.hot_keys else keys)
+            body = {"license_key": key, "script_request": licenses[key]}
+        elif kind == "invalid":
+            body = {"license_key": random_key(), "script_request": random.choice(scripts)}
+        else:
+            key = random.choice(keys)
+            wrong = [s for s in scripts if s != licenses[key]] or scripts
+            body = {"license_key": key, "script_request": random.choice(wrong)}
+        requests.append((kind, body))
+    return requests
+
+# --- Load Generator ---
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def send_request(session: aiohttp.ClientSession, url: str, body: dict, request_format: str):
+    """Request /get_script dalam format json (default), form (urlencoded) atau header (GET)."""
+    if request_format == "form":
+        # Body dienkode sendiri (seperti klien ringkas), bukan lewat FormData aiohttp yang lambat
+        return session.post(url, data=urlencode(body), headers={"Content-Type": "application/x-www-form-urlencoded"})
+    if request_format == "header":
+        return session.get(url, headers={"X-License-Key": body["license_key"], "X-Script-Request": body["script_request"]})
+    return session.post(url, json=body)
+
+async def drive_load(url: str, requests, concurrency: int, request_format: str = "json", keepalive: bool = True):
+    latencies: Dict[str, List[float]] = {}
+    statuses: Dict[str, int] = {}
+    errors = 0
+    connections = 0
+    queue = iter(requests)
+
+    async def on_connection_create_end(session, context, params):
+        nonlocal connections
+        connections += 1
+
+    async def worker(session: aiohttp.ClientSession):
+        nonlocal errors
+        for kind, body in queue:
+            start = time.perf_counter()
+            try:
+                async with send_request(session, url, body, request_format) as resp:
+                    text = await resp.text()
+                    outcome = str(resp.status) if resp.status == 200 else text
+            except Exception:
+                errors += 1
+                continue
+            latencies.setdefault(kind, []).append(time.perf_counter() - start)
+            statuses[outcome] = statuses.get(outcome, 0) + 1
+
+    trace = aiohttp.TraceConfig()
+    trace.on_connection_create_end.append(on_connection_create_end)
+    connector = aiohttp.TCPConnector(limit=concurrency, force_close=not keepalive)
+    async with aiohttp.ClientSession(connector=connector, trace_configs=[trace]) as session:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return latencies, statuses, errors, elapsed, connections
+
+def summarize(latencies: Dict[str, List[float]]) -> Dict[str, Dict[str, float]]:
+    summary = {}
+    everything = sorted(v for values in latencies.values() for v in values)
+    for kind, values in [("all", everything)] + sorted(latencies.items()):
+        values = sorted(values)
+        summary[kind] = {
+            "count": len(values),
+            "p50_ms": round(percentile(values, 50) * 1000, 3),
+            "p95_ms": round(percentile(values, 95) * 1000, 3),
+            "p99_ms": round(percentile(values, 99) * 1000, 3),
+        }
+    return summary
+
+def compare_with_baseline(result: dict, baseline_path: str):
+    try:
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Baseline '{baseline_path}' tidak bisa dibaca: {e}")
+        return
+
+    def delta(new, old):
+        return f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+
+    print(f"\nPerbandingan dengan baseline {baseline_path} ({baseline.get('timestamp')}):")
+    print(f"  req/s : {result['requests_per_second']:.1f} vs {baseline['requests_per_second']:.1f} ({delta(result['requests_per_second'], baseline['requests_per_second'])})")
+    if "cpu_us_per_request" in baseline:
+        new, old = result["cpu_us_per_request"], baseline["cpu_us_per_request"]
+        print(f"  cpu/req: {new:.1f} us vs {old:.1f} us ({delta(new, old)})")
+    for metric in ("p50_ms", "p95_ms", "p99_ms"):
+        new, old = result["latency"]["all"][metric], baseline["latency"]["all"][metric]
+        print(f"  {metric:6}: {new:.3f} vs {old:.3f} ({delta(new, old)})")
+
+# --- Main ---
+
+async def run(args) -> dict:
+    random.seed(args.seed)
+    scripts, licenses, messages = build_fixtures(args)
+    requests = build_request_mix(args, scripts, licenses)
+
+    pool = None
+    if args.dsn:
+        pool = await database.get_db_pool(args.dsn)
+        if not pool:
+            raise SystemExit("Gagal konek ke Postgres benchmark.")
+        await migrations.run_migrations(pool)
+        bench_digests = [license_key_digest(key) for key in licenses]
+        async with pool.acquire() as connection:
+            await connection.execute("DELETE FROM licenses WHERE key_hash = ANY($1::bytea[]);", bench_digests)
+            await connection.copy_records_to_table(
+                "licenses",
+                records=[(*database.license_key_args(key), script) for key, script in licenses.items()],
+                columns=[*database.LICENSE_KEY_COLUMNS, "script_name"]
+            )
+    else:
+        pool = FakePool(licenses, args.db_latency_ms, args.pool_size)
+
+    channel = FakeScriptChannel(messages, args.discord_latency_ms)
+    cog = WebserverCog(FakeBot(channel), pool)
+    if args.json_decoder:
+        cog.api.json_decoder, cog.api.json_loads, cog.api.json_dumps = get_json_codec(args.json_decoder)
+    if args.catalog:
+        await cog.build_script_catalog()
+    if args.no_cache:
+        database.license_cache.max_size = 0
+        database.license_cache.clear()
+
+    runner = cog.api.make_runner(access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", args.port, backlog=config.API_LISTEN_BACKLOG)
+    await site.start()
+    url = f"http://127.0.0.1:{args.port}/get_script"
+    print(f"Benchmark {args.requests} request ({args.request_format}, keep-alive {'on' if args.keepalive else 'off'}, "
+          f"decoder {cog.api.json_decoder}), konkurensi {args.concurrency}, ke {url}...")
+
+    try:
+        # CPU proses ini = server + klien benchmark; bandingkan antar run dengan klien yang sama
+        cpu_started = time.process_time()
+        latencies, statuses, errors, elapsed, connections = await drive_load(
+            url, requests, args.concurrency, args.request_format, args.keepalive
+        )
+        cpu_used = time.process_time() - cpu_started
+    finally:
+        await runner.cleanup()
+        if args.dsn:
+            async with pool.acquire() as connection:
+                await connection.execute("DELETE FROM licenses WHERE key_hash = ANY($1::bytea[]);", bench_digests)
+            await database.close_db_pool(pool)
+
+    completed = sum(len(v) for v in latencies.values())
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "baseline")},
+        "elapsed_s": round(elapsed, 3),
+        "completed": completed,
+        "errors": errors,
+        "requests_per_second": round(completed / elapsed, 1) if elapsed else 0.0,
+        "cpu_us_per_request": round(cpu_used / completed * 1e6, 1) if completed else 0.0,
+        "connections_opened": connections,
+        "latency": summarize(latencies),
+        "responses": statuses,
+        "db_queries": getattr(pool, "queries", None),
+        "discord_history_calls": channel.history_calls,
+        "license_cache": database.license_cache.stats(),
+    }
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark API lisensi /get_script")
+    parser.add_argument("--requests", type=int, default=10000, help="Total request")
+    parser.add_argument("--concurrency", type=int, default=50, help="Jumlah request paralel")
+    parser.add_argument("--valid-ratio", type=float, default=0.8, help="Bobot request valid")
+    parser.add_argument("--invalid-ratio", type=float, default=0.15, help="Bobot key tidak dikenal")
+    parser.add_argument("--wrong-script-ratio", type=float, default=0.05, help="Bobot key valid untuk script lain")
+    parser.add_argument("--licenses", type=int, default=5000, help="Jumlah lisensi di data uji")
+    parser.add_argument("--hot-keys", type=int, default=0, help="Batasi request valid ke N key pertama (0 = semua)")
+    parser.add_argument("--scripts", type=int, default=10, help="Jumlah file script")
+    parser.add_argument("--channel-messages", type=int, default=500, help="Jumlah pesan di channel script palsu")
+    parser.add_argument("--db-latency-ms", type=float, default=2.0, help="Latency per query stand-in DB")
+    parser.add_argument("--discord-latency-ms", type=float, default=50.0, help="Latency per halaman history Discord palsu")
+    parser.add_argument("--pool-size", type=int, default=config.DB_POOL_MAX_SIZE, help="Batas koneksi stand-in DB")
+    parser.add_argument("--dsn", help="Pakai Postgres lokal (JANGAN database produksi) alih-alih stand-in")
+    parser.add_argument("--no-catalog", dest="catalog", action="store_false", help="Uji jalur fallback scan history")
+    parser.add_argument("--no-cache", action="store_true", help="Nonaktifkan license_cache")
+    parser.add_argument("--request-format", choices=("json", "form", "header"), default="json",
+                        help="Body JSON, form-urlencoded, atau GET dengan header X-License-Key")
+    parser.add_argument("--no-keepalive", dest="keepalive", action="store_false", help="Koneksi baru untuk tiap request")
+    parser.add_argument("--json-decoder", choices=("auto", "orjson", "json"), help="Override API_JSON_DECODER")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--output", default="bench_results.json", help="File JSON hasil")
+    parser.add_argument("--baseline", help="File JSON hasil sebelumnya untuk dibandingkan")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    result = asyncio.run(run(args))
+    print(json.dumps({k: result[k] for k in ("requests_per_second", "cpu_us_per_request", "connections_opened", "completed",
+                                              "errors", "latency", "responses")}, indent=2))
+    with open(args.output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"Hasil disimpan ke {args.output}")
+    if args.baseline:
+        compare_with_baseline(result, args.baseline)
+
+if __name__ == "__main__":
+    main()
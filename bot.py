@@ -3,14 +3,27 @@ from discord.ext import commands
 import asyncio
 import logging
 import os
+import signal
+import time
 
 # Impor dari file proyek
 from utils.logger import setup_logging
 import config # Impor config untuk akses variabel
 from database import get_db_pool, close_db_pool
+from migrations import run_migrations
+from utils.member_cache import MemberLRU
+from utils.metrics import REGISTRY, process_rss_bytes
+
+PROCESS_STARTED = time.perf_counter() # Untuk laporan waktu start sampai on_ready
 
 # Setup logging di awal
-setup_logging()
+setup_logging(
+    level=config.LOG_LEVEL,
+    use_queue=config.LOG_QUEUE,
+    json_output=config.LOG_JSON,
+    sample_rates=config.LOG_SAMPLE_RATES,
+    queue_size=config.LOG_QUEUE_SIZE,
+)
 log = logging.getLogger(__name__)
 
 # --- Kelas Bot Utama (Lebih Ringkas) ---
@@ -19,37 +32,90 @@ class MyBot(commands.Bot):
         intents = discord.Intents.default()
         intents.message_content = True
         intents.members = True
-        super().__init__(command_prefix=config.COMMAND_PREFIX, intents=intents)
+        if config.LEAN_MEMBER_CACHE:
+            # Tidak chunk/menyimpan semua member guild; converter fetch on-demand lewat member_lru
+            super().__init__(
+                command_prefix=config.COMMAND_PREFIX,
+                intents=intents,
+                chunk_guilds_at_startup=False,
+                member_cache_flags=discord.MemberCacheFlags.none(),
+            )
+            self.member_lru = MemberLRU(config.MEMBER_CACHE_MAX)
+        else:
+            super().__init__(command_prefix=config.COMMAND_PREFIX, intents=intents)
+            self.member_lru = None
         self.db_pool = None # Akan diinisialisasi di setup_hook
+        self.startup_reported = False
+        self.close_task = None # Task close() dari SIGTERM; referensi disimpan supaya tidak di-garbage collect
+        REGISTRY.gauge("discord_cached_members", "Jumlah member di cache discord.py + member_lru", self.cached_member_count)
+
+    def cached_member_count(self) -> int:
+        """Member yang tersimpan di memori: cache guild discord.py ditambah member_lru (mode lean)."""
+        count = sum(len(guild.members) for guild in self.guilds)
+        return count + (len(self.member_lru) if self.member_lru is not None else 0)
+
+    def handle_sigterm(self):
+        """Mulai close() sekali saja; SIGTERM berikutnya selama shutdown diabaikan."""
+        if self.close_task is None:
+            log.info("SIGTERM diterima, menutup bot...")
+            self.close_task = asyncio.create_task(self.close())
 
     async def setup_hook(self):
         """Inisialisasi database pool dan load Cogs."""
         log.info("Menjalankan setup_hook...")
+        started = time.perf_counter()
+
+        # SIGTERM (redeploy Koyeb) -> close() supaya webserver sempat drain; default-nya proses langsung mati
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, self.handle_sigterm)
+        except NotImplementedError:
+            pass # Windows
 
-        # 1. Inisialisasi Database Pool
+        # 1. Inisialisasi Database Pool (min_size koneksi dibuka paralel oleh asyncpg)
         log.info("Menginisialisasi koneksi database pool...")
         self.db_pool = await get_db_pool(config.SUPABASE_DB_URL)
         if not self.db_pool:
             log.critical("Gagal membuat database pool. Bot akan dimatikan.")
             await self.close() # Hentikan bot jika DB gagal konek
             return
+        pool_done = time.perf_counter()
 
-        # 2. Load Cogs
+        # 2. Migrasi skema database (aman dijalankan bersamaan dengan worker API)
+        if not await run_migrations(self.db_pool):
+            log.critical("Migrasi database gagal. Bot akan dimatikan.")
+            await self.close()
+            return
+        migrations_done = time.perf_counter()
+
+        # 3. Load Cogs secara paralel (cog tidak bergantung satu sama lain saat load;
+        #    webserver mulai listen di cog_load WebserverCog; katalog di-prefetch jika CATALOG_PUBLISH)
         log.info("Memuat Cogs...")
         initial_extensions = [
+            'cogs.outbox_cog',
             'cogs.license_cog',
             'cogs.webserver_cog',
             # Tambahkan cog lain di sini jika ada
         ]
-        for extension in initial_extensions:
-            try:
-                await self.load_extension(extension)
-                log.info(f"Cog '{extension}' berhasil dimuat.")
-            except Exception as e:
-                log.exception(f"Gagal memuat Cog '{extension}': {e}")
-                # Pertimbangkan untuk menghentikan bot jika cog penting gagal dimuat
+        cog_timings = await asyncio.gather(*(self.load_timed_extension(ext) for ext in initial_extensions))
+        cogs_done = time.perf_counter()
+
+        log.info(
+            f"Setup hook selesai dalam {cogs_done - started:.2f} detik "
+            f"(pool {pool_done - started:.2f}, migrasi {migrations_done - pool_done:.2f}, "
+            f"cogs {cogs_done - migrations_done:.2f}: "
+            + ", ".join(f"{ext} {elapsed:.2f}" for ext, elapsed in zip(initial_extensions, cog_timings)) + ")."
+        )
 
-        log.info("Setup hook selesai.")
+    async def load_timed_extension(self, extension: str) -> float:
+        """Memuat satu Cog dan mengembalikan durasinya (detik)."""
+        started = time.perf_counter()
+        try:
+            await self.load_extension(extension)
+            log.info(f"Cog '{extension}' berhasil dimuat.")
+        except Exception as e:
+            log.exception(f"Gagal memuat Cog '{extension}': {e}")
+            # Pertimbangkan untuk menghentikan bot jika cog penting gagal dimuat
+        return time.perf_counter() - started
 
 
     async def on_ready(self):
@@ -57,6 +123,14 @@ class MyBot(commands.Bot):
         log.info(f'Bot terhubung sebagai {self.user} (ID: {self.user.id})')
         log.info(f'Prefix: {config.COMMAND_PREFIX}')
         log.info('Siap menerima perintah dan request API.')
+        if not self.startup_reported:
+            # on_ready bisa terpanggil lagi saat reconnect; laporan start hanya sekali
+            self.startup_reported = True
+            log.info(
+                f"Start sampai on_ready: {time.perf_counter() - PROCESS_STARTED:.2f} detik, "
+                f"RSS {process_rss_bytes() / 1e6:.1f} MB, {len(self.guilds)} guild, {self.cached_member_count()} member di cache "
+                f"(mode {'lean' if config.LEAN_MEMBER_CACHE else 'penuh'})."
+            )
 
     async def close(self):
         """Membersihkan resource saat bot dimatikan."""
@@ -88,7 +162,8 @@ if __name__ == "__main__":
     elif not config.SUPABASE_DB_URL:
          log.critical("Environment variable SUPABASE_DB_URL tidak ditemukan!")
     # Tambahkan pengecekan env var penting lainnya dari config.py
-    elif not all([config.ADMIN_ROLE_ID, config.SALES_ROLE_ID, config.SCRIPT_CHANNEL_ID, config.PURCHASE_LOG_CHANNEL_ID]):
+    elif not all([config.ADMIN_ROLE_ID, config.SALES_ROLE_ID, config.SCRIPT_CHANNEL_ID, config.PURCHASE_LOG_CHANNEL_ID,
+                  config.PURCHASED_LICENSE_ROLE_ID]):
          log.critical("Satu atau lebih ID Role/Channel penting tidak diatur di environment variables!")
     else:
         bot = MyBot()
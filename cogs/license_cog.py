@@ -1,18 +1,32 @@
 import discord
 from discord.ext import commands
-import random
-import string
-from datetime import datetime, timedelta
+import csv
+import gzip
+import io
+import asyncio
 import logging
+from datetime import datetime, timedelta
+from typing import Annotated, Optional
 
 # Impor dari file lain dalam proyek
-from config import ADMIN_ROLE_ID, SALES_ROLE_ID, PURCHASE_LOG_CHANNEL_ID, UTC_PLUS_7, LICENSE_DURATION_DAYS, PURCHASED_LICENSE_ROLE_ID
+from config import (
+    ADMIN_ROLE_ID, SALES_ROLE_ID, UTC_PLUS_7, LICENSE_DURATION_DAYS, PURCHASED_LICENSE_ROLE_ID, BULK_LICENSE_MAX, PURCHASE_REPORT_MAX_ROWS,
+    LICENSE_SWEEP_INTERVAL_MINUTES, LICENSE_SWEEP_BATCH_SIZE, LICENSE_ARCHIVE_EXPIRED, LICENSE_USAGE_SHARING_IPS
+)
 from database import (
+    sweep_expired_licenses_db,
     add_license,
-    get_sales_limit_db,
-    decrement_sales_limit_db,
-    set_sales_limit_db
+    add_licenses_bulk,
+    add_license_with_sales_limit,
+    SALES_LIMIT_EXHAUSTED,
+    set_sales_limit_db,
+    fetch_purchase_summary_db,
+    fetch_purchase_events_db,
+    fetch_license_usage_report_db
 )
+from cogs.outbox_cog import purchase_log_item, purchase_event_item, license_dm_item, license_file
+from utils.license_keys import generate_license_key, license_key_id
+from utils.member_cache import CachedMemberConverter
 
 log = logging.getLogger(__name__)
 
@@ -20,38 +34,65 @@ class LicenseCog(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
         self.db_pool = bot.db_pool
+        self.duration_days = LICENSE_DURATION_DAYS or None # 0 = lisensi tanpa batas waktu
+        self.sweep_task = None
         log.info("License Cog loaded.")
 
-    async def log_purchase(self, generator: discord.Member, recipient: discord.Member, key: str, script_name: str):
-        """Mengirim log ke channel purchase-log."""
-        try:
-            log_channel = self.bot.get_channel(PURCHASE_LOG_CHANNEL_ID)
-            if not log_channel:
-                log_channel = await self.bot.fetch_channel(PURCHASE_LOG_CHANNEL_ID)
-
-            if log_channel and isinstance(log_channel, discord.TextChannel):
-                embed = discord.Embed(
-                    title="✅ Log Pembelian Lisensi",
-                    color=discord.Color.blue(),
-                    timestamp=datetime.now(UTC_PLUS_7)
-                )
-                embed.add_field(name="Generator", value=f"{generator.mention}", inline=False)
-                embed.add_field(name="Penerima", value=f"{recipient.mention}", inline=False)
-                embed.add_field(name="Script Dilisensikan", value=f"`{script_name}`", inline=False)
-                await log_channel.send(embed=embed)
-            else:
-                log.warning(f"Channel log pembelian (ID: {PURCHASE_LOG_CHANNEL_ID}) tidak ditemukan atau bukan text channel.")
+    async def cog_load(self):
+        """Dipanggil saat Cog dimuat."""
+        if not self.db_pool:
+            return
+        self.sweep_task = asyncio.create_task(self.expired_license_sweep_loop())
+
+    async def cog_unload(self):
+        """Dipanggil saat Cog di-unload (misalnya saat bot dimatikan)."""
+        if self.sweep_task:
+            self.sweep_task.cancel()
 
-        except discord.NotFound:
-            log.error(f"Channel log pembelian (ID: {PURCHASE_LOG_CHANNEL_ID}) tidak ditemukan.")
-        except discord.Forbidden:
-            log.error(f"Bot tidak punya izin mengirim pesan ke channel log pembelian (ID: {PURCHASE_LOG_CHANNEL_ID}).")
-        except Exception as e:
-            log.error(f"Gagal mengirim log pembelian: {e}")
+    async def sweep_expired_licenses(self) -> int:
+        """Menghapus lisensi kedaluwarsa per batch sampai habis; jeda singkat antar batch supaya tidak membebani DB."""
+        total = 0
+        while True:
+            deleted = await sweep_expired_licenses_db(self.db_pool, LICENSE_SWEEP_BATCH_SIZE, LICENSE_ARCHIVE_EXPIRED)
+            if not deleted:
+                break
+            total += deleted
+            if deleted < LICENSE_SWEEP_BATCH_SIZE:
+                break
+            await asyncio.sleep(0.5)
+        return total
+
+    async def expired_license_sweep_loop(self):
+        """Loop background pembersihan lisensi kedaluwarsa."""
+        while True:
+            total = await self.sweep_expired_licenses()
+            if total:
+                log.info(f"{total} lisensi kedaluwarsa dihapus dari tabel licenses.")
+            await asyncio.sleep(LICENSE_SWEEP_INTERVAL_MINUTES * 60)
+
+    async def ensure_outbox(self, ctx: commands.Context) -> bool:
+        """Cek OutboxCog sebelum lisensi disimpan: tanpa outbox, DM lisensi tidak akan pernah terkirim."""
+        if self.bot.get_cog("OutboxCog") is not None:
+            return True
+        log.error(f"OutboxCog tidak dimuat, perintah generate dari {ctx.author} ditolak.")
+        await ctx.send("❌ Kesalahan: Pengiriman lisensi sedang tidak tersedia, lisensi tidak dibuat. Hubungi pengembang.", delete_after=10)
+        return False
+
+    async def deliver(self, items) -> bool:
+        """Menyerahkan log pembelian dan DM lisensi ke OutboxCog (dikirim di background).
+
+        Return False jika OutboxCog hilang setelah ensure_outbox (mis. di-unload saat perintah berjalan).
+        """
+        outbox = self.bot.get_cog("OutboxCog")
+        if outbox is None:
+            log.error("OutboxCog tidak dimuat, log pembelian dan DM lisensi tidak terkirim.")
+            return False
+        await outbox.enqueue(items)
+        return True
 
     @commands.command(name='generate_license', help='Generate lisensi untuk member (!generate_license @member nama_script)')
     @commands.has_any_role(ADMIN_ROLE_ID, SALES_ROLE_ID)
-    async def generate_license(self, ctx: commands.Context, member: discord.Member, script_name: str):
+    async def generate_license(self, ctx: commands.Context, member: Annotated[discord.Member, CachedMemberConverter], script_name: str):
         """Generate lisensi untuk member dan simpan ke Supabase."""
         author_roles_ids = [role.id for role in ctx.author.roles]
         is_admin = ADMIN_ROLE_ID in author_roles_ids
@@ -62,64 +103,187 @@ class LicenseCog(commands.Cog):
             await ctx.send("❌ Kesalahan: Koneksi database tidak tersedia. Hubungi pengembang.", delete_after=10)
             return
 
+        if not await self.ensure_outbox(ctx):
+            return
+
+        license_key = generate_license_key()
+        new_limit = None
+
         if is_sales and not is_admin:
+            # Cek limit, kurangi limit dan simpan lisensi dalam satu round-trip atomik
             sales_user_id_str = str(ctx.author.id)
-            limit = await get_sales_limit_db(self.db_pool, sales_user_id_str)
-            if limit is None:
-                await ctx.send("⚠️ Tidak bisa memeriksa limit Sales Anda saat ini. Hubungi Admin.", delete_after=10)
+            new_limit = await add_license_with_sales_limit(self.db_pool, sales_user_id_str, license_key, script_name, self.duration_days)
+            if new_limit is None:
+                await ctx.send(f"⚠️ Terjadi kesalahan saat menyimpan lisensi untuk '{script_name}'. Limit Anda tidak berkurang, silakan coba lagi.", delete_after=10)
                 return
-            if limit <= 0:
+            if new_limit == SALES_LIMIT_EXHAUSTED:
                 await ctx.send("❌ Anda sudah mencapai batas lisensi yang dapat dibuat!", delete_after=5)
                 return
-            decrement_success = await decrement_sales_limit_db(self.db_pool, sales_user_id_str)
-            if not decrement_success:
-                await ctx.send("❌ Gagal mengurangi limit Anda (kemungkinan limit sudah 0 atau error DB).", delete_after=10)
+            log.info(f"Sales limit untuk {ctx.author} ({sales_user_id_str}) berhasil dikurangi, sisa {new_limit}.")
+        else:
+            save_success = await add_license(self.db_pool, license_key, script_name, self.duration_days)
+            if not save_success:
+                await ctx.send(f"⚠️ Terjadi kesalahan saat menyimpan lisensi '{license_key}' untuk '{script_name}' ke database (kemungkinan kunci sudah ada).", delete_after=10)
                 return
-            log.info(f"Sales limit untuk {ctx.author} ({sales_user_id_str}) berhasil dikurangi.")
 
-        license_key = ''.join(random.choices(string.ascii_uppercase + string.digits, k=16))
+        # Lisensi sudah tersimpan: log pembelian dan DM dikirim worker outbox, perintah langsung selesai
+        delivered = await self.deliver([
+            purchase_log_item(ctx.author, member, script_name, key_ids=[license_key_id(license_key)]),
+            purchase_event_item(ctx.author, member, [license_key], script_name),
+            license_dm_item(ctx.author, member, [license_key], script_name, ctx.channel.id, self.duration_days),
+        ])
+
+        await ctx.message.delete(delay=3)
+        if delivered:
+            confirm_msg = f"✅ Lisensi `{license_key}` untuk `{script_name}` berhasil dibuat dan sedang dikirim ke {member.mention}!"
+        else:
+            confirm_msg = f"⚠️ Lisensi `{license_key}` untuk `{script_name}` berhasil dibuat, tapi DM ke {member.mention} gagal dikirim. Teruskan key ini secara manual."
+        if new_limit is not None:
+            confirm_msg += f" Sisa limit Anda: {new_limit}."
+        await ctx.send(confirm_msg, delete_after=10)
+
+    @commands.command(name='generate_licenses', help='Generate banyak lisensi sekaligus (!generate_licenses @member nama_script jumlah)')
+    @commands.has_any_role(ADMIN_ROLE_ID, SALES_ROLE_ID)
+    async def generate_licenses(self, ctx: commands.Context, member: Annotated[discord.Member, CachedMemberConverter], script_name: str, count: int):
+        """Generate banyak lisensi dalam satu transaksi dan kirim sebagai file."""
+        author_roles_ids = [role.id for role in ctx.author.roles]
+        is_admin = ADMIN_ROLE_ID in author_roles_ids
+        is_sales = SALES_ROLE_ID in author_roles_ids
 
-        save_success = await add_license(self.db_pool, license_key, script_name)
+        if not self.db_pool:
+            log.error(f"Database pool tidak tersedia saat {ctx.author} mencoba generate lisensi bulk.")
+            await ctx.send("❌ Kesalahan: Koneksi database tidak tersedia. Hubungi pengembang.", delete_after=10)
+            return
 
+        if count < 1 or count > BULK_LICENSE_MAX:
+            await ctx.send(f"❌ Jumlah lisensi harus antara 1 dan {BULK_LICENSE_MAX}.", delete_after=10)
+            return
+
+        if not await self.ensure_outbox(ctx):
+            return
+
+        license_keys = set()
+        while len(license_keys) < count:
+            license_keys.add(generate_license_key())
+        license_keys = list(license_keys)
+
+        # Limit sales dikurangi di transaksi yang sama dengan insert
+        sales_user_id_str = str(ctx.author.id) if is_sales and not is_admin else None
+        save_success = await add_licenses_bulk(self.db_pool, license_keys, script_name, sales_user_id_str, self.duration_days)
         if not save_success:
-            await ctx.send(f"⚠️ Terjadi kesalahan saat menyimpan lisensi '{license_key}' untuk '{script_name}' ke database (kemungkinan kunci sudah ada).", delete_after=10)
+            if sales_user_id_str:
+                await ctx.send(f"❌ Gagal membuat {count} lisensi (kemungkinan limit Anda tidak cukup atau error DB).", delete_after=10)
+            else:
+                await ctx.send(f"⚠️ Terjadi kesalahan saat menyimpan {count} lisensi untuk '{script_name}' ke database.", delete_after=10)
             return
 
-        await self.log_purchase(ctx.author, member, license_key, script_name)
+        dm_item = license_dm_item(ctx.author, member, license_keys, script_name, ctx.channel.id, self.duration_days)
+        delivered = await self.deliver([
+            purchase_log_item(ctx.author, member, script_name, count=count),
+            purchase_event_item(ctx.author, member, license_keys, script_name),
+            dm_item,
+        ])
 
-        embed = discord.Embed(title="🎟️ Lisensi Dibuat", color=discord.Color.green())
-        embed.add_field(name="🔑 Kode Lisensi", value=f"`{license_key}`", inline=False)
-        embed.add_field(name="📜 Script", value=f"`{script_name}`", inline=False)
-        embed.set_footer(text=f"Diberikan oleh {ctx.author.display_name}")
+        await ctx.message.delete(delay=3)
+        if delivered:
+            await ctx.send(f"✅ {count} lisensi untuk `{script_name}` berhasil dibuat dan sedang dikirim ke {member.mention}!", delete_after=10)
+            return
+        # Jangan sampai key hilang: kirim file ke pembuat perintah untuk diteruskan manual
+        try:
+            await ctx.author.send(f"⚠️ DM ke {member.mention} gagal, berikut {count} lisensi `{script_name}` untuk diteruskan manual.",
+                                  file=license_file(dm_item[1]))
+            await ctx.send(f"⚠️ {count} lisensi untuk `{script_name}` berhasil dibuat, tapi DM ke {member.mention} gagal. File key dikirim ke DM Anda.", delete_after=15)
+        except discord.HTTPException as e:
+            log.error(f"Gagal mengirim file {count} lisensi ke {ctx.author}: {e}")
+            await ctx.send(f"❌ {count} lisensi untuk `{script_name}` berhasil dibuat, tapi tidak bisa dikirim ke siapa pun. Hubungi admin.", delete_after=15)
 
+    @commands.command(name='purchase_report', help='Riwayat generate lisensi (!purchase_report YYYY-MM-DD YYYY-MM-DD [@sales] [nama_script])')
+    @commands.has_role(ADMIN_ROLE_ID)
+    async def purchase_report(self, ctx: commands.Context, start_date: str, end_date: str,
+                              seller: Optional[discord.Member] = None, script_name: Optional[str] = None):
+        """Ringkasan dan file CSV (gzip) purchase events dalam rentang tanggal (inklusif, UTC+7)."""
         try:
-            await member.send(embed=embed)
-            dm_success = True
-        except discord.Forbidden:
-            dm_success = False
-            await ctx.send(f"⚠️ Tidak bisa mengirim DM ke {member.mention}, pastikan DM terbuka!", delete_after=15)
-        except Exception as e:
-            dm_success = False
-            log.error(f"Gagal mengirim DM lisensi ke {member.id}: {e}")
-            await ctx.send(f"⚠️ Gagal mengirim DM ke {member.mention}.", delete_after=15)
+            start = datetime.strptime(start_date, "%Y-%m-%d").replace(tzinfo=UTC_PLUS_7)
+            end = datetime.strptime(end_date, "%Y-%m-%d").replace(tzinfo=UTC_PLUS_7) + timedelta(days=1)
+        except ValueError:
+            raise commands.BadArgument("Format tanggal harus YYYY-MM-DD")
 
-        await ctx.message.delete(delay=3)
-        confirm_msg = f"✅ Lisensi `{license_key}` untuk `{script_name}` berhasil dibuat dan dikirim ke {member.mention}!"
-        if not dm_success:
-            confirm_msg += " (Gagal kirim DM)"
-        await ctx.send(confirm_msg, delete_after=10)
+        seller_id = seller.id if seller else None
+        summary = await fetch_purchase_summary_db(self.db_pool, start, end, seller_id, script_name)
+        events = await fetch_purchase_events_db(self.db_pool, start, end, seller_id, script_name, limit=PURCHASE_REPORT_MAX_ROWS)
+        if summary is None or events is None:
+            await ctx.send("⚠️ Gagal mengambil riwayat pembelian dari database.", delete_after=10)
+            return
 
-    @generate_license.error
-    async def generate_license_error(self, ctx: commands.Context, error):
-        """Error handler untuk generate_license."""
+        total = sum(row['total'] for row in summary)
+        embed = discord.Embed(
+            title="📊 Riwayat Generate Lisensi",
+            description=f"{start_date} s/d {end_date}: **{total}** lisensi",
+            color=discord.Color.blue()
+        )
+        for row in summary[:20]:
+            embed.add_field(
+                name=f"`{row['script_name']}`",
+                value=f"<@{row['generator_id']}>: {row['total']} lisensi, {row['recipients']} penerima",
+                inline=False
+            )
+        if len(summary) > 20:
+            embed.set_footer(text=f"+{len(summary) - 20} kombinasi sales/script lain (lihat file)")
+        if not events:
+            await ctx.send(embed=embed)
+            return
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(["created_at", "generator_id", "recipient_id", "key_id", "script_name"])
+        for row in events:
+            writer.writerow([row['created_at'].astimezone(UTC_PLUS_7).isoformat(), row['generator_id'], row['recipient_id'], row['key_id'], row['script_name']])
+        data = gzip.compress(buffer.getvalue().encode("utf-8"))
+        content = None
+        if total > len(events):
+            content = f"⚠️ File hanya berisi {len(events)} dari {total} baris (PURCHASE_REPORT_MAX_ROWS)."
+        await ctx.send(content, embed=embed, file=discord.File(io.BytesIO(data), filename=f"purchases_{start_date}_{end_date}.csv.gz"))
+
+    @commands.command(name='license_usage', help='Laporan pemakaian lisensi (!license_usage [hari_tidak_aktif])')
+    @commands.has_role(ADMIN_ROLE_ID)
+    async def license_usage(self, ctx: commands.Context, stale_days: int = 30):
+        """Key paling sering dipakai, key yang dipakai dari banyak IP, dan lisensi yang tidak aktif."""
+        report = await fetch_license_usage_report_db(self.db_pool, limit=10, stale_days=stale_days, sharing_ips=LICENSE_USAGE_SHARING_IPS)
+        if report is None:
+            await ctx.send("⚠️ Gagal mengambil laporan pemakaian dari database.", delete_after=10)
+            return
+
+        def usage_lines(rows) -> str:
+            return "\n".join(
+                f"`{row['key_id']}` {row['script_name'] or '(dihapus)'}: {row['uses']}x, ~{row['ips']} IP, "
+                f"terakhir {row['last_seen'].astimezone(UTC_PLUS_7).strftime('%Y-%m-%d %H:%M')}"
+                for row in rows
+            )[:1024] or "-"
+
+        stale = report['stale']
+        embed = discord.Embed(
+            title="📈 Pemakaian Lisensi",
+            description=(
+                f"{stale['total']} lisensi aktif: **{stale['never_used']}** belum pernah dipakai, "
+                f"**{stale['stale']}** tidak dipakai dalam {stale_days} hari terakhir."
+            ),
+            color=discord.Color.blue()
+        )
+        embed.add_field(name="Paling sering dipakai", value=usage_lines(report['top']), inline=False)
+        embed.add_field(name=f"Dicurigai dibagikan (≥ {LICENSE_USAGE_SHARING_IPS} IP)", value=usage_lines(report['sharing']), inline=False)
+        embed.set_footer(text="Key ditampilkan sebagai key_id (12 karakter hex pertama hash, tidak bisa dibalik ke key); jumlah IP adalah perkiraan. Data tertunda beberapa detik.")
+        await ctx.send(embed=embed)
+
+    async def handle_generate_error(self, ctx: commands.Context, error, usage: str):
+        """Error handler bersama untuk perintah generate."""
         original_error = getattr(error, 'original', error)
-        log.warning(f"Error pada perintah !generate_license oleh {ctx.author}: {error} (Original: {original_error})")
+        log.warning(f"Error pada perintah !{ctx.command} oleh {ctx.author}: {error} (Original: {original_error})")
 
-        if isinstance(error, commands.MissingRequiredArgument):
-            await ctx.send(f"❌ Penggunaan salah. Contoh: `{ctx.prefix}generate_license @NamaMember nama_script`", delete_after=10)
-        elif isinstance(error, commands.MemberNotFound):
+        if isinstance(error, commands.MemberNotFound):
             await ctx.send(f"❌ Member Discord `{error.argument}` tidak ditemukan.", delete_after=10)
-        elif isinstance(error, commands.MissingAnyRole):
+        elif isinstance(error, (commands.MissingRequiredArgument, commands.BadArgument)):
+            await ctx.send(f"❌ Penggunaan salah. Contoh: `{ctx.prefix}{usage}`", delete_after=10)
+        elif isinstance(error, (commands.MissingAnyRole, commands.MissingRole)):
             await ctx.send("❌ Anda tidak memiliki izin untuk menggunakan perintah ini.", delete_after=5)
         else:
             await ctx.send("❌ Terjadi error internal saat memproses perintah.", delete_after=10)
@@ -129,5 +293,25 @@ class LicenseCog(commands.Cog):
         except discord.HTTPException:
             pass
 
+    @generate_license.error
+    async def generate_license_error(self, ctx: commands.Context, error):
+        """Error handler untuk generate_license."""
+        await self.handle_generate_error(ctx, error, "generate_license @NamaMember nama_script")
+
+    @generate_licenses.error
+    async def generate_licenses_error(self, ctx: commands.Context, error):
+        """Error handler untuk generate_licenses."""
+        await self.handle_generate_error(ctx, error, "generate_licenses @NamaMember nama_script jumlah")
+
+    @purchase_report.error
+    async def purchase_report_error(self, ctx: commands.Context, error):
+        """Error handler untuk purchase_report."""
+        await self.handle_generate_error(ctx, error, "purchase_report 2024-01-01 2024-01-31 [@sales] [nama_script]")
+
+    @license_usage.error
+    async def license_usage_error(self, ctx: commands.Context, error):
+        """Error handler untuk license_usage."""
+        await self.handle_generate_error(ctx, error, "license_usage [hari_tidak_aktif]")
+
 async def setup(bot: commands.Bot):
     await bot.add_cog(LicenseCog(bot))
\ No newline at end of file
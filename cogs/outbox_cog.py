@@ -0,0 +1,339 @@
+import discord
+from discord.ext import commands
+import asyncio
+import io
+import json
+import logging
+import random
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+# Impor dari file lain
+from config import (
+    PURCHASE_LOG_CHANNEL_ID, UTC_PLUS_7,
+    OUTBOX_ENABLED, OUTBOX_DM_WORKERS, OUTBOX_POLL_SECONDS, OUTBOX_MAX_ATTEMPTS, OUTBOX_LEASE_SECONDS
+)
+from database import (
+    enqueue_outbox_db, claim_outbox_db, complete_outbox_db, retry_outbox_db,
+    ensure_purchase_event_partitions, archive_purchase_events_db, add_purchase_events_db, redact_purchase_event_keys_db
+)
+from utils.license_keys import license_key_digest
+from utils.metrics import DISCORD_API_CALLS, REGISTRY
+
+log = logging.getLogger(__name__)
+
+OUTBOX_DELIVERIES = REGISTRY.counter("outbox_deliveries_total", "Hasil pengiriman item outbox", ("kind", "result"))
+
+# Jenis item outbox
+PURCHASE_LOG = "purchase_log"
+LICENSE_DM = "license_dm"
+PURCHASE_EVENT = "purchase_event" # Dipindahkan per batch ke tabel purchase_events
+
+# Discord mengizinkan maksimal 10 embed per pesan: log pembelian dikirim per batch
+PURCHASE_LOG_BATCH_SIZE = 10
+PURCHASE_EVENT_BATCH_SIZE = 500
+# Jeda sebelum mencoba lagi pembuatan partisi yang gagal (bukan di setiap polling)
+PARTITION_RETRY_SECONDS = 600
+
+class PermanentDeliveryError(Exception):
+    """Pengiriman tidak akan berhasil walaupun diulang (mis. DM member tertutup)."""
+
+def retry_delay(attempts: int) -> float:
+    """Backoff eksponensial dengan jitter: ~10 detik, 20 detik, ... maksimal 1 jam."""
+    return min(3600.0, 5.0 * (2 ** attempts)) * random.uniform(0.8, 1.2)
+
+def purchase_log_embed(payload: Dict[str, Any]) -> discord.Embed:
+    embed = discord.Embed(
+        title="✅ Log Pembelian Lisensi",
+        color=discord.Color.blue(),
+        timestamp=datetime.fromisoformat(payload["created_at"])
+    )
+    embed.add_field(name="Generator", value=f"<@{payload['generator_id']}>", inline=False)
+    embed.add_field(name="Penerima", value=f"<@{payload['recipient_id']}>", inline=False)
+    embed.add_field(name="Script Dilisensikan", value=f"`{payload['script_name']}`", inline=False)
+    if payload.get("count", 1) > 1:
+        embed.add_field(name="Jumlah Lisensi", value=f"{payload['count']}", inline=False)
+    if payload.get("key_ids"):
+        embed.add_field(name="ID Lisensi", value=", ".join(f"`{key_id}`" for key_id in payload["key_ids"]), inline=False)
+    return embed
+
+def license_dm_embed(payload: Dict[str, Any]) -> discord.Embed:
+    keys = payload["keys"]
+    embed = discord.Embed(title="🎟️ Lisensi Dibuat", color=discord.Color.green())
+    if len(keys) == 1:
+        embed.add_field(name="🔑 Kode Lisensi", value=f"`{keys[0]}`", inline=False)
+    else:
+        embed.add_field(name="🔑 Jumlah Lisensi", value=f"{len(keys)} (lihat file terlampir)", inline=False)
+    embed.add_field(name="📜 Script", value=f"`{payload['script_name']}`", inline=False)
+    if payload.get("duration_days"):
+        embed.add_field(name="⏳ Masa Berlaku", value=f"{payload['duration_days']} hari", inline=False)
+    embed.set_footer(text=f"Diberikan oleh {payload['generator_name']}")
+    return embed
+
+def license_file(payload: Dict[str, Any]) -> discord.File:
+    keys = payload["keys"]
+    keys_bytes = ("\n".join(keys) + "\n").encode("utf-8")
+    return discord.File(io.BytesIO(keys_bytes), filename=f"licenses_{payload['script_name']}_{len(keys)}.txt")
+
+def purchase_log_item(generator: discord.abc.User, recipient: discord.abc.User, script_name: str, count: int = 1,
+                      key_ids: Optional[List[str]] = None) -> Tuple[str, Dict[str, Any]]:
+    return PURCHASE_LOG, {
+        "generator_id": generator.id,
+        "recipient_id": recipient.id,
+        "script_name": script_name,
+        "count": count,
+        "key_ids": key_ids,
+        "created_at": datetime.now(UTC_PLUS_7).isoformat(),
+    }
+
+def purchase_event_item(generator: discord.abc.User, recipient: discord.abc.User, keys: List[str], script_name: str) -> Tuple[str, Dict[str, Any]]:
+    # Hanya digest yang disimpan: item ini berakhir di purchase_events yang disimpan permanen
+    return PURCHASE_EVENT, {
+        "generator_id": generator.id,
+        "recipient_id": recipient.id,
+        "key_hashes": [license_key_digest(key).hex() for key in keys],
+        "script_name": script_name,
+        "created_at": datetime.now(UTC_PLUS_7).isoformat(),
+    }
+
+def license_dm_item(generator: discord.abc.User, recipient: discord.abc.User, keys: List[str], script_name: str, notify_channel_id: int,
+                    duration_days: Optional[int] = None) -> Tuple[str, Dict[str, Any]]:
+    return LICENSE_DM, {
+        "generator_id": generator.id,
+        "generator_name": generator.display_name,
+        "recipient_id": recipient.id,
+        "keys": keys,
+        "script_name": script_name,
+        "notify_channel_id": notify_channel_id,
+        "duration_days": duration_days,
+    }
+
+class OutboxCog(commands.Cog):
+    """Mengirim log pembelian dan DM lisensi di background dari tabel outbox.
+
+    Perintah generate cukup menyimpan item ke outbox (durable) lalu langsung
+    membalas; worker di sini yang melakukan request ke Discord, dengan retry dan
+    backoff. Item yang belum terkirim saat bot restart akan dikirim setelah start.
+    """
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.db_pool = bot.db_pool
+        self.worker_tasks = []
+        self.wakeups: List[asyncio.Event] = []
+        self.inline_tasks = set()
+        self.partitions_checked_on = None
+        self.partitions_retry_at = 0.0
+        log.info("Outbox Cog loaded.")
+
+    async def cog_load(self):
+        """Dipanggil saat Cog dimuat."""
+        if self.db_pool:
+            await ensure_purchase_event_partitions(self.db_pool, datetime.now(UTC_PLUS_7))
+        if not OUTBOX_ENABLED or not self.db_pool:
+            log.info("Outbox tidak aktif: log pembelian dan DM lisensi dikirim langsung di background.")
+            return
+        self.start_worker(self.purchase_log_worker, "outbox-purchase-log")
+        self.start_worker(self.purchase_event_worker, "outbox-purchase-event")
+        for i in range(max(1, OUTBOX_DM_WORKERS)):
+            self.start_worker(self.license_dm_worker, f"outbox-dm-{i}")
+
+    async def cog_unload(self):
+        """Dipanggil saat Cog di-unload (misalnya saat bot dimatikan)."""
+        # Item yang sedang diproses tetap aman di database dan diambil ulang setelah lease habis
+        for task in self.worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self.worker_tasks, return_exceptions=True)
+        self.worker_tasks.clear()
+
+    def start_worker(self, worker, name: str):
+        wakeup = asyncio.Event()
+        self.wakeups.append(wakeup)
+        self.worker_tasks.append(asyncio.create_task(self.worker_loop(worker, wakeup), name=name))
+
+    async def enqueue(self, items: List[Tuple[str, Dict[str, Any]]]):
+        """Menyimpan item ke outbox dan membangunkan worker.
+
+        Jika outbox tidak aktif atau database gagal, item dikirim langsung di
+        background (tidak durable) supaya log/DM tetap tidak hilang.
+        """
+        if OUTBOX_ENABLED and self.worker_tasks and await enqueue_outbox_db(self.db_pool, items):
+            for wakeup in self.wakeups:
+                wakeup.set()
+            return
+        task = asyncio.create_task(self.deliver_inline(items))
+        self.inline_tasks.add(task)
+        task.add_done_callback(self.inline_tasks.discard)
+
+    async def worker_loop(self, worker, wakeup: asyncio.Event):
+        """Mengambil dan memproses item sampai outbox kosong, lalu menunggu wakeup atau polling berikutnya."""
+        await self.bot.wait_until_ready()
+        while True:
+            wakeup.clear()
+            try:
+                processed = await worker()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.exception(f"Error tidak terduga di worker outbox: {e}")
+                processed = False
+            if processed:
+                continue
+            try:
+                await asyncio.wait_for(wakeup.wait(), timeout=OUTBOX_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    async def purchase_log_worker(self) -> bool:
+        """Mengirim sampai 10 log pembelian dalam satu pesan. Return False jika tidak ada item."""
+        rows = await claim_outbox_db(self.db_pool, [PURCHASE_LOG], PURCHASE_LOG_BATCH_SIZE, OUTBOX_LEASE_SECONDS)
+        if not rows:
+            return False
+        ids = [row['id'] for row in rows]
+        try:
+            await self.send_purchase_logs([json.loads(row['payload']) for row in rows])
+        except Exception as e:
+            await self.reschedule(PURCHASE_LOG, ids, max(row['attempts'] for row in rows), e)
+            return True
+        OUTBOX_DELIVERIES.inc(PURCHASE_LOG, "ok", amount=len(ids))
+        await complete_outbox_db(self.db_pool, ids)
+        return True
+
+    async def purchase_event_worker(self) -> bool:
+        """Memindahkan purchase event dari outbox ke purchase_events per batch. Return False jika tidak ada item."""
+        now = datetime.now(UTC_PLUS_7)
+        if self.partitions_checked_on != now.date() and time.monotonic() >= self.partitions_retry_at:
+            # Partisi bulan ini dan bulan depan dibuat sebelum ada insert ke bulan tersebut
+            if await ensure_purchase_event_partitions(self.db_pool, now):
+                self.partitions_checked_on = now.date()
+            else:
+                self.partitions_retry_at = time.monotonic() + PARTITION_RETRY_SECONDS
+            # Key plaintext yang masih ditulis instance versi lama selama rollout
+            while (await redact_purchase_event_keys_db(self.db_pool, PURCHASE_EVENT_BATCH_SIZE) or 0) >= PURCHASE_EVENT_BATCH_SIZE:
+                pass
+        moved = await archive_purchase_events_db(self.db_pool, PURCHASE_EVENT, PURCHASE_EVENT_BATCH_SIZE)
+        if moved:
+            OUTBOX_DELIVERIES.inc(PURCHASE_EVENT, "ok", amount=moved)
+        # Gagal (None): item tetap di outbox, dicoba lagi pada polling berikutnya
+        return bool(moved)
+
+    async def license_dm_worker(self) -> bool:
+        """Mengirim satu DM lisensi. Return False jika tidak ada item."""
+        rows = await claim_outbox_db(self.db_pool, [LICENSE_DM], 1, OUTBOX_LEASE_SECONDS)
+        if not rows:
+            return False
+        row = rows[0]
+        payload = json.loads(row['payload'])
+        try:
+            await self.send_license_dm(payload)
+        except PermanentDeliveryError as e:
+            OUTBOX_DELIVERIES.inc(LICENSE_DM, "failed")
+            await self.handle_dm_failure(payload, e)
+        except Exception as e:
+            if not await self.reschedule(LICENSE_DM, [row['id']], row['attempts'], e):
+                await self.handle_dm_failure(payload, e)
+            return True
+        else:
+            OUTBOX_DELIVERIES.inc(LICENSE_DM, "ok")
+        await complete_outbox_db(self.db_pool, [row['id']])
+        return True
+
+    async def reschedule(self, kind: str, ids: List[int], attempts: int, error: Exception) -> bool:
+        """Menjadwalkan ulang item yang gagal. Return False jika batas percobaan sudah habis."""
+        if attempts >= OUTBOX_MAX_ATTEMPTS:
+            log.error(f"Outbox {kind} {ids} gagal permanen setelah {attempts} percobaan: {error}")
+            OUTBOX_DELIVERIES.inc(kind, "failed", amount=len(ids))
+            await retry_outbox_db(self.db_pool, ids, None, str(error))
+            return False
+        # Kena rate limit Discord: tunggu sesuai retry_after, bukan backoff biasa
+        delay = error.retry_after if isinstance(error, discord.RateLimited) else retry_delay(attempts)
+        log.warning(f"Outbox {kind} {ids} gagal (percobaan {attempts}), dicoba lagi dalam {delay:.0f} detik: {error}")
+        OUTBOX_DELIVERIES.inc(kind, "retry", amount=len(ids))
+        await retry_outbox_db(self.db_pool, ids, delay, str(error))
+        return True
+
+    async def get_log_channel(self) -> discord.TextChannel:
+        log_channel = self.bot.get_channel(PURCHASE_LOG_CHANNEL_ID)
+        if not log_channel:
+            DISCORD_API_CALLS.inc("fetch_channel")
+            log_channel = await self.bot.fetch_channel(PURCHASE_LOG_CHANNEL_ID)
+        if not isinstance(log_channel, discord.TextChannel):
+            raise PermanentDeliveryError(f"Channel log pembelian (ID: {PURCHASE_LOG_CHANNEL_ID}) bukan text channel.")
+        return log_channel
+
+    async def send_purchase_logs(self, payloads: List[Dict[str, Any]]):
+        """Mengirim log ke channel purchase-log, beberapa embed dalam satu pesan."""
+        log_channel = await self.get_log_channel()
+        DISCORD_API_CALLS.inc("send_message")
+        await log_channel.send(embeds=[purchase_log_embed(payload) for payload in payloads])
+
+    async def get_user(self, user_id: int) -> discord.User:
+        user = self.bot.get_user(user_id)
+        if user is None:
+            DISCORD_API_CALLS.inc("fetch_user")
+            try:
+                user = await self.bot.fetch_user(user_id)
+            except discord.NotFound:
+                raise PermanentDeliveryError(f"User {user_id} tidak ditemukan.")
+        return user
+
+    async def send_license_dm(self, payload: Dict[str, Any]):
+        """Mengirim DM lisensi ke penerima (satu key sebagai embed, banyak key sebagai file)."""
+        recipient = await self.get_user(payload["recipient_id"])
+        DISCORD_API_CALLS.inc("send_dm")
+        try:
+            if len(payload["keys"]) == 1:
+                await recipient.send(embed=license_dm_embed(payload))
+            else:
+                await recipient.send(embed=license_dm_embed(payload), file=license_file(payload))
+        except discord.Forbidden as e:
+            raise PermanentDeliveryError(f"DM ke {recipient.id} ditolak: {e}")
+
+    async def handle_dm_failure(self, payload: Dict[str, Any], error: Exception):
+        """DM gagal permanen: beri tahu di channel perintah, dan kirim file key ke generator untuk lisensi bulk."""
+        recipient_id = payload["recipient_id"]
+        keys = payload["keys"]
+        log.error(f"Gagal mengirim DM {len(keys)} lisensi ke {recipient_id}: {error}")
+        try:
+            if len(keys) > 1:
+                # Jangan sampai key hilang: kirim file ke generator sebagai cadangan
+                generator = await self.get_user(payload["generator_id"])
+                DISCORD_API_CALLS.inc("send_dm")
+                await generator.send(
+                    f"⚠️ DM ke <@{recipient_id}> gagal, berikut {len(keys)} lisensi `{payload['script_name']}` untuk diteruskan manual.",
+                    file=license_file(payload)
+                )
+            channel = self.bot.get_channel(payload["notify_channel_id"])
+            if channel:
+                DISCORD_API_CALLS.inc("send_message")
+                await channel.send(f"⚠️ Tidak bisa mengirim DM ke <@{recipient_id}>, pastikan DM terbuka!", delete_after=15)
+        except Exception as e:
+            log.error(f"Gagal mengirim pemberitahuan DM gagal untuk {recipient_id}: {e}")
+
+    async def deliver_inline(self, items: List[Tuple[str, Dict[str, Any]]]):
+        """Mengirim item langsung tanpa outbox (satu kali percobaan)."""
+        purchase_logs = [payload for kind, payload in items if kind == PURCHASE_LOG]
+        if purchase_logs:
+            try:
+                await self.send_purchase_logs(purchase_logs)
+                OUTBOX_DELIVERIES.inc(PURCHASE_LOG, "ok", amount=len(purchase_logs))
+            except Exception as e:
+                OUTBOX_DELIVERIES.inc(PURCHASE_LOG, "failed", amount=len(purchase_logs))
+                log.error(f"Gagal mengirim log pembelian: {e}")
+        purchase_events = [payload for kind, payload in items if kind == PURCHASE_EVENT]
+        if purchase_events and self.db_pool:
+            await add_purchase_events_db(self.db_pool, purchase_events)
+        for kind, payload in items:
+            if kind != LICENSE_DM:
+                continue
+            try:
+                await self.send_license_dm(payload)
+                OUTBOX_DELIVERIES.inc(LICENSE_DM, "ok")
+            except Exception as e:
+                OUTBOX_DELIVERIES.inc(LICENSE_DM, "failed")
+                await self.handle_dm_failure(payload, e)
+
+# Fungsi setup untuk Cog
+async def setup(bot: commands.Bot):
+    await bot.add_cog(OutboxCog(bot))
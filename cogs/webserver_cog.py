@@ -1,14 +1,15 @@
 import discord
 from discord.ext import commands
-from aiohttp import web
-import json
 import logging
 import asyncio
-from datetime import datetime
+import time
 
 # Impor dari file lain
-from config import SCRIPT_CHANNEL_ID, UTC_PLUS_7, WEB_SERVER_PORT
-from database import fetch_script_by_license
+from config import SCRIPT_CHANNEL_ID, WEB_SERVER_PORT, WEB_SERVER_ENABLED, SCRIPT_CATALOG_REFRESH_MINUTES, CATALOG_PUBLISH, WEB_REUSE_PORT, WEB_LISTEN_FD, WEB_DRAIN_TIMEOUT, WEB_DRAIN_READY_DELAY
+from database import replace_script_catalog_db, update_script_catalog_db
+from script_api import ScriptAPI, load_catalog_from_db
+from utils.script_catalog import ScriptCatalog, ScriptEntry, message_attachments, payload_attachments
+from utils.metrics import DISCORD_API_CALLS
 
 log = logging.getLogger(__name__)
 
@@ -16,68 +17,164 @@ class WebserverCog(commands.Cog):
     def __init__(self, bot: commands.Bot, db_pool):
         self.bot = bot
         self.db_pool = db_pool
-        self.runner = None
-        self.site = None
-        self.web_server_task = None
+        # Logika API ada di ScriptAPI; cog ini menjaga katalog dari channel Discord
+        self.api = ScriptAPI(db_pool, fallback_lookup=self.scan_script_entry)
+        self.warm_up_task = None
+        self.catalog_task = None
+        self.prefetch_task = None
+        self.publish_tasks = set()
+        # Perubahan pesan (message_id, attachments; None = dihapus) yang datang selama build_script_catalog
+        self.pending_catalog_events = None
         log.info("Webserver Cog loaded.")
 
     async def start_webserver(self):
-        """Menjalankan webserver aiohttp untuk API."""
+        """Menjalankan webserver aiohttp untuk API; warm-up DB (dengan retry) berjalan di background.
+
+        /ready tetap 503 sampai warm-up berhasil dan katalog siap.
+        """
         if not self.db_pool:
             log.error("Tidak bisa start webserver, database pool tidak tersedia.")
             return
+        self.warm_up_task = asyncio.create_task(self.api.warm_up_with_retry())
+        await self.api.start("0.0.0.0", WEB_SERVER_PORT, reuse_port=WEB_REUSE_PORT, listen_fd=WEB_LISTEN_FD)
 
-        app = web.Application()
-        # Simpan state yang diperlukan (pool DB, instance bot) di app
-        app["bot"] = self.bot
-        app["db_pool"] = self.db_pool
-        app.router.add_post("/get_script", self.handle_request_route) # Endpoint API
-
-        self.runner = web.AppRunner(app)
-        await self.runner.setup()
-        self.site = web.TCPSite(self.runner, "0.0.0.0", WEB_SERVER_PORT)
+    async def stop_webserver(self):
+        """Menghentikan webserver aiohttp (drain request in-flight dulu)."""
+        await self.api.drain()
+
+    async def get_script_channel(self, bot_instance: commands.Bot):
+        """Mengambil script channel dari cache, atau via API jika belum ada."""
+        script_channel = bot_instance.get_channel(SCRIPT_CHANNEL_ID)
+        if not script_channel:
+            DISCORD_API_CALLS.inc("fetch_channel")
+            script_channel = await bot_instance.fetch_channel(SCRIPT_CHANNEL_ID)
+        return script_channel
+
+    async def prefetch_catalog(self):
+        """Memuat katalog terakhir dari tabel script_catalog supaya API siap sebelum scan channel selesai."""
+        started = time.perf_counter()
+        catalog = await load_catalog_from_db(self.db_pool)
+        # Jangan menimpa katalog hasil scan channel jika scan sudah selesai lebih dulu
+        if catalog is not None and len(catalog) and not self.api.catalog.ready:
+            self.api.set_catalog(catalog)
+            log.info(f"Katalog script di-prefetch dari database: {len(catalog)} file dalam {time.perf_counter() - started:.2f} detik.")
+
+    async def build_script_catalog(self) -> bool:
+        """Membangun ulang katalog script dari seluruh history channel (full pagination)."""
+        started = time.perf_counter()
         try:
-            await self.site.start()
-            log.info(f"🌐 Webserver API berjalan di http://0.0.0.0:{WEB_SERVER_PORT}...")
-        except Exception as e:
-            log.error(f"❌ Gagal menjalankan webserver di port {WEB_SERVER_PORT}: {e}")
-            await self.cleanup_webserver() # Coba cleanup jika start gagal
+            script_channel = await self.get_script_channel(self.bot)
+            if not isinstance(script_channel, discord.TextChannel):
+                log.error(f"Katalog Error: Script channel {SCRIPT_CHANNEL_ID} bukan text channel.")
+                return False
+
+            catalog = ScriptCatalog()
+            scanned = 0
+            # Edit/hapus selama scan dicatat, karena scan bisa sudah melewati pesan tersebut
+            self.pending_catalog_events = []
+            # Urut dari yang terlama supaya attachment terbaru menimpa yang lama
+            async for message in script_channel.history(limit=None, oldest_first=True):
+                scanned += 1
+                if message.attachments:
+                    catalog.set_message(message.id, message_attachments(message))
+            DISCORD_API_CALLS.inc("channel_history", amount=scanned // 100 + 1) # Satu request per 100 pesan
+            # Terapkan ulang perubahan selama scan (berurutan) lalu swap, tanpa await di antaranya
+            for message_id, attachments in self.pending_catalog_events:
+                if attachments is None:
+                    catalog.remove_message(message_id)
+                else:
+                    catalog.set_message(message_id, attachments)
+            self.pending_catalog_events = None
+            catalog.ready = True
+            self.api.set_catalog(catalog)
+            if CATALOG_PUBLISH:
+                await replace_script_catalog_db(self.db_pool, catalog.entries())
+            log.info(f"Katalog script dibangun: {len(catalog)} file dari {scanned} pesan di channel {SCRIPT_CHANNEL_ID} dalam {time.perf_counter() - started:.2f} detik.")
+            return True
 
-    async def stop_webserver(self):
-        """Menghentikan webserver aiohttp."""
-        if self.site:
-            try:
-                await self.site.stop()
-                log.info("Webserver site stopped.")
-            except Exception as e:
-                log.error(f"Error stopping webserver site: {e}")
-            self.site = None
-        if self.runner:
-            try:
-                await self.runner.cleanup()
-                log.info("Webserver runner cleaned up.")
-            except Exception as e:
-                log.error(f"Error cleaning up webserver runner: {e}")
-            self.runner = None
-        log.info("Webserver dihentikan.")
-
-    async def fetch_script_url(self, bot_instance: commands.Bot, script_name: str):
-        """Mencari URL script Lua berdasarkan nama file di channel."""
+        except discord.NotFound:
+            log.error(f"Katalog Error: Script channel {SCRIPT_CHANNEL_ID} tidak ditemukan.")
+        except discord.Forbidden:
+            log.error(f"Katalog Error: Bot tidak punya izin membaca history script channel {SCRIPT_CHANNEL_ID}.")
+        except Exception as e:
+            log.error(f"Katalog Error: Gagal membangun katalog script: {e}")
+        finally:
+            self.pending_catalog_events = None
+        return False
+
+    async def catalog_refresh_loop(self):
+        """Membangun katalog saat start, lalu refresh berkala (URL CDN Discord punya masa berlaku)."""
+        while True:
+            success = await self.build_script_catalog()
+            # Jika gagal, coba lagi lebih cepat (fallback scan tetap jalan selama katalog belum siap)
+            await asyncio.sleep(SCRIPT_CATALOG_REFRESH_MINUTES * 60 if success else 60)
+
+    def publish_catalog_changes(self, names):
+        """Mengirim perubahan katalog ke tabel script_catalog untuk worker api_server.py."""
+        if not CATALOG_PUBLISH or not names:
+            return
+        changes = {name: self.api.catalog.get(name) for name in names}
+        task = asyncio.create_task(update_script_catalog_db(self.db_pool, changes))
+        self.publish_tasks.add(task)
+        task.add_done_callback(self.publish_tasks.discard)
+
+    def apply_catalog_event(self, message_id: int, attachments) -> set:
+        """Menerapkan perubahan pesan ke katalog aktif (attachments None = pesan dihapus).
+
+        Selama build_script_catalog berjalan, perubahan juga dicatat untuk diterapkan ke katalog baru.
+        """
+        if self.pending_catalog_events is not None:
+            self.pending_catalog_events.append((message_id, attachments))
+        if attachments is None:
+            return self.api.catalog.remove_message(message_id)
+        return self.api.catalog.set_message(message_id, attachments)
+
+    # --- Listener untuk menjaga katalog tetap up-to-date ---
+    @commands.Cog.listener()
+    async def on_message(self, message: discord.Message):
+        if message.channel.id == SCRIPT_CHANNEL_ID and message.attachments:
+            self.publish_catalog_changes(self.apply_catalog_event(message.id, message_attachments(message)))
+            log.info(f"Katalog: {len(message.attachments)} attachment baru dari pesan {message.id}.")
+
+    @commands.Cog.listener()
+    async def on_raw_message_edit(self, payload: discord.RawMessageUpdateEvent):
+        # Versi raw dipakai karena pesan lama di channel script biasanya tidak ada di cache
+        if payload.channel_id != SCRIPT_CHANNEL_ID:
+            return
+        attachments = payload_attachments(payload.data)
+        if attachments is not None:
+            self.publish_catalog_changes(self.apply_catalog_event(payload.message_id, attachments))
+            log.info(f"Katalog: attachment pesan {payload.message_id} diperbarui.")
+
+    @commands.Cog.listener()
+    async def on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent):
+        if payload.channel_id == SCRIPT_CHANNEL_ID:
+            self.publish_catalog_changes(self.apply_catalog_event(payload.message_id, None))
+
+    @commands.Cog.listener()
+    async def on_raw_bulk_message_delete(self, payload: discord.RawBulkMessageDeleteEvent):
+        if payload.channel_id == SCRIPT_CHANNEL_ID:
+            changed = set()
+            for message_id in payload.message_ids:
+                changed |= self.apply_catalog_event(message_id, None)
+            self.publish_catalog_changes(changed)
+
+    async def scan_script_entry(self, script_name: str):
+        """Mencari attachment script dengan scan 50 pesan terakhir di channel (tanpa katalog)."""
         try:
-            script_channel = bot_instance.get_channel(SCRIPT_CHANNEL_ID)
-            if not script_channel:
-                script_channel = await bot_instance.fetch_channel(SCRIPT_CHANNEL_ID)
+            script_channel = await self.get_script_channel(self.bot)
 
             if not isinstance(script_channel, discord.TextChannel):
                 log.error(f"API Discord Error: Script channel {SCRIPT_CHANNEL_ID} bukan text channel.")
                 return None
 
-            async for message in script_channel.history(limit=50): # Tingkatkan limit jika perlu
+            DISCORD_API_CALLS.inc("channel_history")
+            async for message in script_channel.history(limit=50):
                 if message.attachments:
                     for attachment in message.attachments:
                         if attachment.filename.lower() == script_name.lower():
                             log.info(f"API Req Info: Script URL ditemukan untuk '{script_name}': {attachment.url}")
-                            return attachment.url
+                            return ScriptEntry(attachment.filename, attachment.url, message.id, attachment.id)
             log.warning(f"API Req Warning: File '{script_name}' tidak ditemukan di channel {SCRIPT_CHANNEL_ID}.")
             return None
 
@@ -91,74 +188,33 @@ class WebserverCog(commands.Cog):
             log.error(f"API Discord Error: Gagal mengambil script URL: {e}")
             return None
 
-    async def handle_request_route(self, request: web.Request):
-        """Router aiohttp yang memanggil handler logic."""
-        # Ambil pool DB dan bot dari app context
-        db_pool = request.app["db_pool"]
-        bot_instance = request.app["bot"]
-        remote_ip = request.remote
-
-        # 1. Parse Request Body
-        try:
-            data = await request.json()
-            license_key_from_request = data.get("license_key")
-            script_request = data.get("script_request") # Nama file script yang diminta
-
-            if not license_key_from_request or not script_request:
-                log.warning(f"API Req Warning: license_key atau script_request kosong. IP: {remote_ip}")
-                return web.Response(text="INVALID", status=400)
-        except json.JSONDecodeError:
-            log.warning(f"API Req Warning: Payload JSON tidak valid. IP: {remote_ip}")
-            return web.Response(text="INVALID", status=400)
-        except Exception as e:
-            log.error(f"API Req Error: Gagal parse request body: {e}. IP: {remote_ip}")
-            return web.Response(text="INVALID", status=500)
-
-        # 2. Validasi Lisensi via Database (menggunakan license_key)
-        allowed_script = await fetch_script_by_license(db_pool, license_key_from_request)
-
-        if allowed_script is None:
-            log.info(f"API Req Info: Lisensi '{license_key_from_request}' tidak valid. IP: {remote_ip}")
-            return web.Response(text="INVALID", status=403)
-
-        # 3. Ambil URL Script berdasarkan permintaan dan izin
-        if allowed_script.lower() == script_request.lower():
-            script_url = await self.fetch_script_url(bot_instance, script_request)
-            if script_url:
-                return web.Response(text=script_url)
-            else:
-                return web.Response(text="SCRIPT_NOT_FOUND", status=404)
-        else:
-            log.info(f"API Req Info: Lisensi '{license_key_from_request}' tidak valid untuk script '{script_request}'. Diizinkan: '{allowed_script}'. IP: {remote_ip}")
-            return web.Response(text="UNAUTHORIZED_SCRIPT", status=403)
-
     # --- Lifecycle Methods ---
     async def cog_load(self):
         """Dipanggil saat Cog dimuat."""
-        # Start web server dalam task terpisah
-        self.web_server_task = asyncio.create_task(self.start_webserver())
+        # Scan channel dimulai lebih dulu (paling lama); sampai selesai request memakai katalog
+        # hasil prefetch dari database, atau fallback scan
+        self.catalog_task = asyncio.create_task(self.catalog_refresh_loop())
+        if CATALOG_PUBLISH:
+            self.prefetch_task = asyncio.create_task(self.prefetch_catalog())
+        if WEB_SERVER_ENABLED:
+            # Ditunggu: port sudah listen saat setup_hook selesai
+            await self.start_webserver()
+        else:
+            log.info("WEB_SERVER_ENABLED=false: API dilayani api_server.py, bot hanya menjaga katalog.")
 
     async def cog_unload(self):
         """Dipanggil saat Cog di-unload (misalnya saat bot dimatikan)."""
+        for task in (self.catalog_task, self.prefetch_task, self.warm_up_task):
+            if task:
+                task.cancel()
         log.info("Mencoba menghentikan webserver...")
-        if self.web_server_task and not self.web_server_task.done():
-            # Beri kesempatan task selesai, tapi jangan blok selamanya
-            try:
-                await asyncio.wait_for(self.stop_webserver(), timeout=10.0)
-            except asyncio.TimeoutError:
-                log.warning("Timeout saat menunggu webserver berhenti.")
-            except Exception as e:
-                log.error(f"Error saat stop_webserver: {e}")
-            # Batalkan task jika masih berjalan setelah stop (safety net)
-            self.web_server_task.cancel()
-            try:
-                await self.web_server_task # Tunggu pembatalan
-            except asyncio.CancelledError:
-                log.info("Task webserver dibatalkan.")
-            except Exception as e:
-                log.error(f"Error setelah membatalkan task webserver: {e}")
-        else:
-            await self.stop_webserver() # Panggil stop jika task sudah selesai atau tidak ada
+        try:
+            # Beri kesempatan request in-flight selesai, tapi jangan blok selamanya
+            await asyncio.wait_for(self.stop_webserver(), timeout=WEB_DRAIN_READY_DELAY + WEB_DRAIN_TIMEOUT + 10.0)
+        except asyncio.TimeoutError:
+            log.warning("Timeout saat menunggu webserver berhenti.")
+        except Exception as e:
+            log.error(f"Error saat stop_webserver: {e}")
 
 # Fungsi setup untuk Cog
 async def setup(bot: commands.Bot):
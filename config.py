@@ -27,25 +27,156 @@ def get_env_var_int(var_name: str, required: bool = True, default: int | None =
         log.error(f"Environment variable '{var_name}' harus berupa angka integer.")
         raise ValueError(f"Environment variable '{var_name}' harus berupa angka integer.")
 
+def get_env_var_bool(var_name: str, required: bool = True, default: bool | None = None) -> bool | None:
+    """Mendapatkan environment variable sebagai boolean (true/false, 1/0, yes/no)."""
+    str_val = get_env_var(var_name, required, str(default) if default is not None else None)
+    if str_val is None:
+        return None
+    if str_val.strip().lower() in ("1", "true", "yes", "on"):
+        return True
+    if str_val.strip().lower() in ("0", "false", "no", "off"):
+        return False
+    log.error(f"Environment variable '{var_name}' harus berupa boolean (true/false).")
+    raise ValueError(f"Environment variable '{var_name}' harus berupa boolean (true/false).")
+
+def get_env_var_float(var_name: str, required: bool = True, default: float | None = None) -> float | None:
+    """Mendapatkan environment variable sebagai float."""
+    str_val = get_env_var(var_name, required, str(default) if default is not None else None)
+    if str_val is None:
+        return None
+    try:
+        return float(str_val)
+    except ValueError:
+        log.error(f"Environment variable '{var_name}' harus berupa angka.")
+        raise ValueError(f"Environment variable '{var_name}' harus berupa angka.")
+
 # --- Konfigurasi Bot ---
-TOKEN = get_env_var("TOKEN")
+# TOKEN dan ID Discord di bawah hanya wajib untuk bot (dicek di bot.py saat start);
+# api_server.py juga mengimpor config tapi tidak memakainya.
+TOKEN = get_env_var("TOKEN", required=False)
 COMMAND_PREFIX = get_env_var("COMMAND_PREFIX", required=False, default="!")
 
 # --- Konfigurasi Database ---
 SUPABASE_DB_URL = get_env_var("SUPABASE_DB_URL")
+# Sesuaikan dengan batas pooler Supabase. Untuk pooler mode transaction (port 6543)
+# set DB_STATEMENT_CACHE_SIZE=0 dan DB_PREPARE_STATEMENTS=false.
+DB_POOL_MIN_SIZE = get_env_var_int("DB_POOL_MIN_SIZE", required=False, default=1)
+DB_POOL_MAX_SIZE = get_env_var_int("DB_POOL_MAX_SIZE", required=False, default=10)
+DB_POOL_MAX_INACTIVE_LIFETIME = get_env_var_float("DB_POOL_MAX_INACTIVE_LIFETIME", required=False, default=300.0) # Detik
+DB_STATEMENT_CACHE_SIZE = get_env_var_int("DB_STATEMENT_CACHE_SIZE", required=False, default=100)
+DB_COMMAND_TIMEOUT = get_env_var_float("DB_COMMAND_TIMEOUT", required=False, default=60.0) # Detik
+DB_CONNECT_TIMEOUT = get_env_var_float("DB_CONNECT_TIMEOUT", required=False, default=10.0) # Detik
+DB_PREPARE_STATEMENTS = get_env_var_bool("DB_PREPARE_STATEMENTS", required=False, default=True)
+
+# --- Konfigurasi Cache Lisensi ---
+# Cache LRU di depan fetch_script_by_license (0 = nonaktif)
+LICENSE_CACHE_SIZE = get_env_var_int("LICENSE_CACHE_SIZE", required=False, default=10000)
+LICENSE_CACHE_TTL = get_env_var_float("LICENSE_CACHE_TTL", required=False, default=60.0)                   # Detik, key valid
+LICENSE_CACHE_NEGATIVE_TTL = get_env_var_float("LICENSE_CACHE_NEGATIVE_TTL", required=False, default=30.0) # Detik, key tidak dikenal
 
 # --- Konfigurasi Discord IDs (WAJIB PAKAI ID!) ---
 # Cara mendapatkan ID: https://support.discord.com/hc/en-us/articles/206346498-Where-can-I-find-my-User-Server-Message-ID
-ADMIN_ROLE_ID = get_env_var_int("ADMIN_ROLE_ID")         # Ganti dengan ID peran Owner/Admin
-SALES_ROLE_ID = get_env_var_int("SALES_ROLE_ID")         # Ganti dengan ID peran Sales Man
-SCRIPT_CHANNEL_ID = get_env_var_int("SCRIPT_CHANNEL_ID") # Channel file .lua
-PURCHASE_LOG_CHANNEL_ID = get_env_var_int("PURCHASE_LOG_CHANNEL_ID") # Channel log pembelian baru
-PURCHASED_LICENSE_ROLE_ID = get_env_var_int("PURCHASED_LICENSE_ROLE_ID") # Ganti dengan ID peran yang diberikan setelah pembelian
+ADMIN_ROLE_ID = get_env_var_int("ADMIN_ROLE_ID", required=False)         # Ganti dengan ID peran Owner/Admin
+SALES_ROLE_ID = get_env_var_int("SALES_ROLE_ID", required=False)         # Ganti dengan ID peran Sales Man
+SCRIPT_CHANNEL_ID = get_env_var_int("SCRIPT_CHANNEL_ID", required=False) # Channel file .lua
+PURCHASE_LOG_CHANNEL_ID = get_env_var_int("PURCHASE_LOG_CHANNEL_ID", required=False) # Channel log pembelian baru
+PURCHASED_LICENSE_ROLE_ID = get_env_var_int("PURCHASED_LICENSE_ROLE_ID", required=False) # Ganti dengan ID peran yang diberikan setelah pembelian
+# --- Konfigurasi Logging ---
+LOG_LEVEL = get_env_var("LOG_LEVEL", required=False, default="INFO")
+LOG_QUEUE = get_env_var_bool("LOG_QUEUE", required=False, default=False) # Format & tulis log di thread latar
+LOG_QUEUE_SIZE = get_env_var_int("LOG_QUEUE_SIZE", required=False, default=10000) # Record dibuang jika antrean penuh
+LOG_JSON = get_env_var_bool("LOG_JSON", required=False, default=False) # Output JSON Lines
+LOG_SAMPLE_RATES = get_env_var("LOG_SAMPLE_RATES", required=False, default="") # Mis. "/get_script=0.01,/get_scripts=0.1"
 # --- Konfigurasi Lain ---
 UTC_PLUS_7 = timezone(timedelta(hours=7))
-LICENSE_DURATION_DAYS = 30 # Durasi lisensi dalam hari
+LICENSE_DURATION_DAYS = get_env_var_int("LICENSE_DURATION_DAYS", required=False, default=30) # Durasi lisensi dalam hari (0 = tanpa batas waktu)
+LICENSE_SWEEP_INTERVAL_MINUTES = get_env_var_int("LICENSE_SWEEP_INTERVAL_MINUTES", required=False, default=60) # Jeda antar pembersihan lisensi kedaluwarsa
+LICENSE_SWEEP_BATCH_SIZE = get_env_var_int("LICENSE_SWEEP_BATCH_SIZE", required=False, default=1000) # Lisensi per batch DELETE
+LICENSE_ARCHIVE_EXPIRED = get_env_var_bool("LICENSE_ARCHIVE_EXPIRED", required=False, default=True) # Simpan lisensi kedaluwarsa ke licenses_expired
+# Tahap "contract" key lisensi: migrasi 13 menghapus kolom key plaintext dan key_hash menjadi primary key,
+# kode hanya menulis/membaca key_hash. Aktifkan di SEMUA proses (bot dan api_server) sekaligus, setelah
+# tidak ada lagi instance versi lama yang berjalan. Selama false, key ditulis dua kali (key dan key_hash).
+LICENSE_KEY_HASH_ONLY = get_env_var_bool("LICENSE_KEY_HASH_ONLY", required=False, default=False)
+BULK_LICENSE_MAX = get_env_var_int("BULK_LICENSE_MAX", required=False, default=500) # Maksimal key per !generate_licenses
+PURCHASE_REPORT_MAX_ROWS = get_env_var_int("PURCHASE_REPORT_MAX_ROWS", required=False, default=100000) # Maksimal baris CSV !purchase_report
 
 # --- Konfigurasi Webserver ---
 WEB_SERVER_PORT = int(os.environ.get('PORT', 5000)) # Port dari Koyeb atau default
+# Set false jika API dilayani oleh api_server.py (proses terpisah), bot hanya menjaga katalog
+WEB_SERVER_ENABLED = get_env_var_bool("WEB_SERVER_ENABLED", required=False, default=True)
+METRICS_TOKEN = get_env_var("METRICS_TOKEN", required=False, default="") # Jika diisi, /metrics butuh header Authorization: Bearer <token>
+API_WORKERS = get_env_var_int("API_WORKERS", required=False, default=0) # Jumlah proses worker api_server.py (0 = jumlah CPU)
+API_WORKER_MAX_RESTARTS = get_env_var_int("API_WORKER_MAX_RESTARTS", required=False, default=5) # Crash beruntun per worker sebelum api_server menyerah (exit 1)
+API_WORKER_RESTART_MAX_DELAY = get_env_var_float("API_WORKER_RESTART_MAX_DELAY", required=False, default=60.0) # Batas backoff restart worker (detik)
+WEB_REUSE_PORT = get_env_var_bool("WEB_REUSE_PORT", required=False, default=False) # SO_REUSEPORT: proses baru bisa bind port sebelum proses lama selesai
+WEB_LISTEN_FD = get_env_var_int("WEB_LISTEN_FD", required=False, default=None) # Pakai socket listen yang diwariskan (socket handoff) alih-alih bind port
+WEB_DRAIN_TIMEOUT = get_env_var_float("WEB_DRAIN_TIMEOUT", required=False, default=25.0) # Batas waktu request in-flight selesai saat shutdown
+WEB_DRAIN_READY_DELAY = get_env_var_float("WEB_DRAIN_READY_DELAY", required=False, default=0.0) # Tetap listen sekian detik setelah /ready 503 (beri waktu load balancer)
+BATCH_VALIDATE_MAX_ITEMS = get_env_var_int("BATCH_VALIDATE_MAX_ITEMS", required=False, default=50) # Maksimal item per /get_scripts
+# Jalur request /get_script: decoder JSON, batas ukuran body, format ringkas, keep-alive dan backlog
+API_JSON_DECODER = get_env_var("API_JSON_DECODER", required=False, default="auto").lower() # auto (orjson jika ada) / orjson / json
+API_MAX_BODY_BYTES = get_env_var_int("API_MAX_BODY_BYTES", required=False, default=2048) # Body /get_script lebih besar ditolak 413
+API_BATCH_MAX_BODY_BYTES = get_env_var_int("API_BATCH_MAX_BODY_BYTES", required=False, default=BATCH_VALIDATE_MAX_ITEMS * 1024) # client_max_size aplikasi
+API_COMPACT_REQUESTS = get_env_var_bool("API_COMPACT_REQUESTS", required=False, default=True) # Terima form-urlencoded dan GET + header X-License-Key
+API_KEEPALIVE_TIMEOUT = get_env_var_float("API_KEEPALIVE_TIMEOUT", required=False, default=75.0) # Detik koneksi idle dibiarkan terbuka (diumumkan di header Keep-Alive)
+API_LISTEN_BACKLOG = get_env_var_int("API_LISTEN_BACKLOG", required=False, default=1024) # Antrian koneksi listen socket (default aiohttp 128)
+
+# Mode respon /get_script: "url" (kirim URL CDN Discord) atau "content" (kirim isi script langsung)
+SCRIPT_SERVE_MODE = get_env_var("SCRIPT_SERVE_MODE", required=False, default="url").lower()
+SCRIPT_BLOB_CACHE_DIR = get_env_var("SCRIPT_BLOB_CACHE_DIR", required=False, default=".script_cache") # Kosongkan untuk cache memori saja
+SCRIPT_BLOB_CACHE_MAX_BYTES = get_env_var_int("SCRIPT_BLOB_CACHE_MAX_BYTES", required=False, default=64 * 1024 * 1024)
+
+# --- Konfigurasi Cache Member Discord ---
+# Mode lean: tanpa chunking member saat start, member di-fetch saat dibutuhkan dan disimpan di LRU kecil
+LEAN_MEMBER_CACHE = get_env_var_bool("LEAN_MEMBER_CACHE", required=False, default=False)
+MEMBER_CACHE_MAX = get_env_var_int("MEMBER_CACHE_MAX", required=False, default=1000)
+
+# --- Konfigurasi Snapshot Lisensi (validasi lokal, tahan saat database bermasalah) ---
+LICENSE_SNAPSHOT_ENABLED = get_env_var_bool("LICENSE_SNAPSHOT_ENABLED", required=False, default=False)
+LICENSE_SNAPSHOT_POLL_SECONDS = get_env_var_float("LICENSE_SNAPSHOT_POLL_SECONDS", required=False, default=5.0) # Polling lisensi baru (created_at)
+LICENSE_SNAPSHOT_RELOAD_MINUTES = get_env_var_int("LICENSE_SNAPSHOT_RELOAD_MINUTES", required=False, default=60) # Load penuh (menangkap lisensi yang dihapus)
+
+# --- Konfigurasi Pemakaian Lisensi (write-behind: dicatat di memori, di-flush berkala ke license_usage) ---
+LICENSE_USAGE_ENABLED = get_env_var_bool("LICENSE_USAGE_ENABLED", required=False, default=True)
+LICENSE_USAGE_FLUSH_SECONDS = get_env_var_float("LICENSE_USAGE_FLUSH_SECONDS", required=False, default=5.0)
+LICENSE_USAGE_MAX_KEYS = get_env_var_int("LICENSE_USAGE_MAX_KEYS", required=False, default=50000) # Batas key di buffer per proses
+LICENSE_USAGE_SHARING_IPS = get_env_var_int("LICENSE_USAGE_SHARING_IPS", required=False, default=5) # Perkiraan IP unik untuk dicurigai dibagikan
+
+# --- Konfigurasi Outbox (log pembelian & DM lisensi dikirim di background) ---
+OUTBOX_ENABLED = get_env_var_bool("OUTBOX_ENABLED", required=False, default=True)
+OUTBOX_DM_WORKERS = get_env_var_int("OUTBOX_DM_WORKERS", required=False, default=2)
+OUTBOX_POLL_SECONDS = get_env_var_float("OUTBOX_POLL_SECONDS", required=False, default=5.0)     # Polling cadangan jika tidak ada wakeup
+OUTBOX_MAX_ATTEMPTS = get_env_var_int("OUTBOX_MAX_ATTEMPTS", required=False, default=8)          # Setelah ini item ditandai gagal permanen
+OUTBOX_LEASE_SECONDS = get_env_var_float("OUTBOX_LEASE_SECONDS", required=False, default=300.0) # Item yang diambil tapi tidak selesai diambil ulang setelah ini
+
+# --- Konfigurasi Rate Limit (token bucket in-memory per proses) ---
+RATE_LIMIT_ENABLED = get_env_var_bool("RATE_LIMIT_ENABLED", required=False, default=True)
+RATE_LIMIT_IP_RATE = get_env_var_float("RATE_LIMIT_IP_RATE", required=False, default=20.0)   # Request/detik per IP
+RATE_LIMIT_IP_BURST = get_env_var_float("RATE_LIMIT_IP_BURST", required=False, default=60.0)
+RATE_LIMIT_KEY_RATE = get_env_var_float("RATE_LIMIT_KEY_RATE", required=False, default=2.0)  # Request/detik per key lisensi
+RATE_LIMIT_KEY_BURST = get_env_var_float("RATE_LIMIT_KEY_BURST", required=False, default=10.0)
+RATE_LIMIT_MAX_KEYS = get_env_var_int("RATE_LIMIT_MAX_KEYS", required=False, default=100000) # Batas bucket di memori
+# Jumlah proxy tepercaya di depan API yang menambahkan entry ke X-Forwarded-For (0 = abaikan header).
+# IP klien diambil dari entry ke-N dari kanan; entry di sebelah kirinya bisa dipalsukan klien.
+TRUSTED_PROXY_HOPS = get_env_var_int("TRUSTED_PROXY_HOPS", required=False, default=0)
+# Kompatibilitas: RATE_LIMIT_TRUST_FORWARDED=true sama dengan satu proxy (Koyeb)
+RATE_LIMIT_TRUST_FORWARDED = get_env_var_bool("RATE_LIMIT_TRUST_FORWARDED", required=False, default=False)
+if RATE_LIMIT_TRUST_FORWARDED and not TRUSTED_PROXY_HOPS:
+    TRUSTED_PROXY_HOPS = 1
+# Bucket per IP. Default hanya aktif jika TRUSTED_PROXY_HOPS diatur: di belakang proxy (Koyeb) tanpa
+# TRUSTED_PROXY_HOPS, IP yang terlihat adalah IP proxy dan semua klien berbagi satu bucket.
+# Set true untuk deploy tanpa proxy (request.remote = IP klien). Bucket per key tetap aktif.
+RATE_LIMIT_IP_ENABLED = RATE_LIMIT_ENABLED and get_env_var_bool("RATE_LIMIT_IP_ENABLED", required=False, default=TRUSTED_PROXY_HOPS > 0)
+# Batch /get_scripts memakai satu token IP per item: batch lebih besar dari burst tidak akan pernah lolos
+if RATE_LIMIT_IP_ENABLED and BATCH_VALIDATE_MAX_ITEMS > RATE_LIMIT_IP_BURST:
+    log.warning(f"BATCH_VALIDATE_MAX_ITEMS ({BATCH_VALIDATE_MAX_ITEMS}) melebihi RATE_LIMIT_IP_BURST, dibatasi menjadi {int(RATE_LIMIT_IP_BURST)}.")
+    BATCH_VALIDATE_MAX_ITEMS = int(RATE_LIMIT_IP_BURST)
+
+# --- Konfigurasi Katalog Script ---
+# URL attachment Discord punya masa berlaku, jadi katalog dibangun ulang berkala
+SCRIPT_CATALOG_REFRESH_MINUTES = get_env_var_int("SCRIPT_CATALOG_REFRESH_MINUTES", required=False, default=360)
+# Simpan katalog ke tabel script_catalog + NOTIFY supaya worker api_server.py ikut ter-update
+CATALOG_PUBLISH = get_env_var_bool("CATALOG_PUBLISH", required=False, default=False)
+API_CATALOG_RELOAD_SECONDS = get_env_var_int("API_CATALOG_RELOAD_SECONDS", required=False, default=300) # Reload penuh di worker (cadangan NOTIFY)
 
 log.info("Konfigurasi dimuat.")
@@ -1,32 +1,148 @@
 import asyncpg
+import json
 import logging
-from typing import Optional, Dict, Any
-from datetime import datetime
+import time
+from typing import Optional, Dict, Any, List, Tuple
+from datetime import datetime, timedelta, timezone
+
+from config import (
+    LICENSE_CACHE_SIZE, LICENSE_CACHE_TTL, LICENSE_CACHE_NEGATIVE_TTL,
+    DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DB_POOL_MAX_INACTIVE_LIFETIME,
+    DB_STATEMENT_CACHE_SIZE, DB_COMMAND_TIMEOUT, DB_CONNECT_TIMEOUT, DB_PREPARE_STATEMENTS,
+    LICENSE_KEY_HASH_ONLY
+)
+from utils.cache import TTLCache, TOMBSTONE
+from utils.license_keys import KEY_DIGEST_SQL, KEY_ID_SQL, license_key_digest
+from utils.license_usage import IP_SKETCH_SIZE, UsageEntry
+from utils.license_snapshot import LicenseSnapshot, SNAPSHOT_HASH_SQL
+from utils.metrics import REGISTRY
 
 log = logging.getLogger(__name__)
 
+# Cache hasil validasi lisensi: key -> script_name, atau TOMBSTONE untuk key tidak dikenal
+license_cache = TTLCache(LICENSE_CACHE_SIZE, LICENSE_CACHE_TTL, LICENSE_CACHE_NEGATIVE_TTL)
+REGISTRY.gauge("license_cache_entries", "Jumlah entry di license_cache", lambda: len(license_cache))
+REGISTRY.gauge("license_cache_hits", "Jumlah cache hit license_cache sejak start", lambda: license_cache.hits)
+REGISTRY.gauge("license_cache_misses", "Jumlah cache miss license_cache sejak start", lambda: license_cache.misses)
+REGISTRY.gauge("license_cache_evictions", "Jumlah eviction license_cache sejak start", lambda: license_cache.evictions)
+
+# Snapshot lokal seluruh tabel licenses (LICENSE_SNAPSHOT_ENABLED); diganti utuh saat load penuh
+license_snapshot = LicenseSnapshot()
+REGISTRY.gauge("license_snapshot_keys", "Jumlah key di snapshot lisensi lokal", lambda: len(license_snapshot))
+REGISTRY.gauge("license_snapshot_age_seconds", "Umur load penuh snapshot lisensi",
+               lambda: time.time() - license_snapshot.loaded_at if license_snapshot.ready else 0)
+
+# --- SQL Hot Path (di-prepare sekali per koneksi) ---
+
+# Key lisensi dicari lewat digest SHA-256 (key_hash, lihat utils/license_keys.py).
+# Tahap expand (migrasi 8/9): key plaintext masih ditulis dan menjadi primary key, baris dari
+# instance lama yang belum punya key_hash dicari lewat fallback key. Dengan LICENSE_KEY_HASH_ONLY
+# (migrasi 13) kolom key sudah tidak ada: hanya key_hash yang ditulis dan dibaca.
+if LICENSE_KEY_HASH_ONLY:
+    LICENSE_KEY_COLUMNS: Tuple[str, ...] = ("key_hash",)
+    LICENSE_DIGEST_SQL = "key_hash"
+    LICENSE_MATCH_SQL = "key_hash = $1"
+    LICENSE_MATCH_ANY_SQL = "key_hash = ANY($1::bytea[])"
+else:
+    LICENSE_KEY_COLUMNS = ("key", "key_hash")
+    LICENSE_DIGEST_SQL = KEY_DIGEST_SQL
+    LICENSE_MATCH_SQL = "(key = $1 OR key_hash = $2)"
+    LICENSE_MATCH_ANY_SQL = "(key = ANY($1::varchar[]) OR key_hash = ANY($2::bytea[]))"
+
+def license_key_args(key: str) -> Tuple[Any, ...]:
+    """Nilai kolom LICENSE_KEY_COLUMNS untuk satu key (urutan sama dengan parameter SQL)."""
+    digest = license_key_digest(key)
+    return (digest,) if LICENSE_KEY_HASH_ONLY else (key, digest)
+
+def _key_params(first: int) -> str:
+    return ", ".join(f"${first + i}" for i in range(len(LICENSE_KEY_COLUMNS)))
+
+_KEY_COUNT = len(LICENSE_KEY_COLUMNS)
+
+# Lisensi kedaluwarsa dianggap tidak ada; expires_at NULL berarti tanpa batas waktu
+FETCH_LICENSE_SQL = f"""
+SELECT script_name, expires_at FROM licenses
+WHERE {LICENSE_MATCH_SQL} AND (expires_at IS NULL OR expires_at > NOW());
+"""
+
+# Parameter terakhir = durasi dalam hari; NULL menghasilkan expires_at NULL (tanpa batas waktu)
+ADD_LICENSE_SQL = f"""
+INSERT INTO licenses ({", ".join(LICENSE_KEY_COLUMNS)}, script_name, expires_at)
+VALUES ({_key_params(1)}, ${_KEY_COUNT + 1}, NOW() + make_interval(days => ${_KEY_COUNT + 2}::int))
+ON CONFLICT ({LICENSE_KEY_COLUMNS[0]}) DO NOTHING; -- Jika key sudah ada, abaikan
+"""
+
+ADD_LICENSE_WITH_SALES_LIMIT_SQL = f"""
+WITH dec AS (
+    UPDATE sales_limits
+    SET current_limit = current_limit - 1
+    WHERE sales_user_id = $1 AND current_limit > 0
+    RETURNING current_limit
+), ins AS (
+    INSERT INTO licenses ({", ".join(LICENSE_KEY_COLUMNS)}, script_name, expires_at)
+    SELECT {_key_params(2)}, ${_KEY_COUNT + 2}, NOW() + make_interval(days => ${_KEY_COUNT + 3}::int) FROM dec
+    RETURNING 1
+)
+SELECT dec.current_limit FROM dec, ins;
+"""
+
+PREPARED_STATEMENTS: Dict[str, str] = {
+    "fetch_license": FETCH_LICENSE_SQL,
+    "add_license": ADD_LICENSE_SQL,
+    "add_license_with_sales_limit": ADD_LICENSE_WITH_SALES_LIMIT_SQL,
+}
+
+class PreparedConnection(asyncpg.Connection):
+    """Koneksi asyncpg yang menyimpan prepared statement dari PREPARED_STATEMENTS."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared: Dict[str, asyncpg.prepared_stmt.PreparedStatement] = {}
+
+async def _init_connection(connection: PreparedConnection):
+    """Init hook pool: prepare statement hot path sekali untuk tiap koneksi baru."""
+    if not DB_PREPARE_STATEMENTS:
+        return
+    for name, sql in PREPARED_STATEMENTS.items():
+        try:
+            connection.prepared[name] = await connection.prepare(sql)
+        except Exception as e:
+            # Mis. tabel belum ada: statement ini dijalankan sebagai SQL biasa
+            log.warning(f"Gagal prepare statement '{name}': {e}")
+
+async def _fetchrow(connection, name: str, *args):
+    stmt = connection.prepared.get(name)
+    if stmt is not None:
+        return await stmt.fetchrow(*args)
+    return await connection.fetchrow(PREPARED_STATEMENTS[name], *args)
+
+async def _fetchval(connection, name: str, *args):
+    stmt = connection.prepared.get(name)
+    if stmt is not None:
+        return await stmt.fetchval(*args)
+    return await connection.fetchval(PREPARED_STATEMENTS[name], *args)
+
 # --- Fungsi Helper Database ---
 
 async def get_db_pool(database_url: str) -> Optional[asyncpg.Pool]:
-    """Membuat dan mengembalikan database connection pool."""
+    """Membuat dan mengembalikan database connection pool (ukuran dan timeout dari config)."""
     pool = None
     try:
         pool = await asyncpg.create_pool(
             database_url,
-            min_size=1,
-            max_size=10,
-            command_timeout=60 # Timeout untuk command
+            min_size=DB_POOL_MIN_SIZE,
+            max_size=DB_POOL_MAX_SIZE,
+            max_inactive_connection_lifetime=DB_POOL_MAX_INACTIVE_LIFETIME,
+            statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+            command_timeout=DB_COMMAND_TIMEOUT, # Timeout untuk command
+            timeout=DB_CONNECT_TIMEOUT, # Timeout untuk membuka koneksi
+            connection_class=PreparedConnection,
+            init=_init_connection
         )
-        # Uji koneksi
-        async with pool.acquire() as connection:
-            val = await connection.fetchval('SELECT 1')
-            if val == 1:
-                log.info("Koneksi database pool Supabase berhasil dibuat dan diverifikasi.")
-                return pool
-            else:
-                log.error("Verifikasi koneksi database pool gagal.")
-                await pool.close()
-                return None
+        # create_pool sudah membuka min_size koneksi (paralel) dan menjalankan init hook,
+        # jadi tidak perlu query verifikasi terpisah
+        log.info(f"Koneksi database pool Supabase berhasil dibuat ({pool.get_size()} koneksi siap).")
+        return pool
     except Exception as e:
         log.error(f"Gagal membuat koneksi database pool: {e}")
         if pool:
@@ -44,73 +160,337 @@ async def close_db_pool(pool: asyncpg.Pool):
 
 # --- Operasi Tabel Licenses (TANPA user_id) ---
 
-async def create_licenses_table(pool):
-    async with pool.acquire() as conn:
-        await conn.execute('''
-            CREATE TABLE IF NOT EXISTS licenses (
-                key VARCHAR(255) PRIMARY KEY,
-                script_name VARCHAR(255) NOT NULL,
-                created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
-            )
-        ''')
-        log.info("Tabel 'licenses' berhasil dibuat atau sudah ada.")
-
-async def add_license(pool: asyncpg.Pool, key: str, script_name: str) -> bool:
-    """Menyimpan lisensi ke database."""
-    sql = """
-    INSERT INTO licenses (key, script_name)
-    VALUES ($1, $2)
-    ON CONFLICT (key) DO NOTHING; -- Jika key sudah ada, abaikan
-    """
+async def add_license(pool: asyncpg.Pool, key: str, script_name: str, duration_days: Optional[int] = None) -> bool:
+    """Menyimpan lisensi ke database (duration_days=None: tanpa batas waktu)."""
     try:
         async with pool.acquire() as connection:
-            await connection.execute(sql, key, script_name)
+            await _fetchval(connection, "add_license", *license_key_args(key), script_name, duration_days)
         log.info(f"Lisensi '{key}' untuk '{script_name}' disimpan ke database.")
         return True
     except Exception as e:
         log.error(f"Gagal menyimpan lisensi '{key}' ke database: {e}")
         return False
+    finally:
+        # Buang tombstone lama supaya key baru langsung valid
+        license_cache.invalidate(key)
+
+async def add_licenses_bulk(pool: asyncpg.Pool, keys: List[str], script_name: str, sales_user_id: Optional[str] = None,
+                            duration_days: Optional[int] = None) -> bool:
+    """Menyimpan banyak lisensi sekaligus dalam satu transaksi.
+
+    Jika sales_user_id diisi, limit sales dikurangi sebanyak len(keys) di transaksi yang sama,
+    jadi limit otomatis kembali jika insert gagal.
+    """
+    decrement_sql = """
+    UPDATE sales_limits
+    SET current_limit = current_limit - $2
+    WHERE sales_user_id = $1 AND current_limit >= $2
+    RETURNING current_limit;
+    """
+    expires_at = datetime.now(timezone.utc) + timedelta(days=duration_days) if duration_days else None
+    try:
+        async with pool.acquire() as connection:
+            async with connection.transaction():
+                if sales_user_id is not None:
+                    new_limit = await connection.fetchval(decrement_sql, sales_user_id, len(keys))
+                    if new_limit is None:
+                        log.warning(f"Limit sales {sales_user_id} tidak cukup untuk {len(keys)} lisensi.")
+                        return False
+                # COPY: satu round-trip untuk semua baris; key duplikat membatalkan seluruh transaksi
+                await connection.copy_records_to_table(
+                    'licenses',
+                    records=[(*license_key_args(key), script_name, expires_at) for key in keys],
+                    columns=[*LICENSE_KEY_COLUMNS, 'script_name', 'expires_at']
+                )
+        log.info(f"{len(keys)} lisensi untuk '{script_name}' disimpan ke database (bulk).")
+        return True
+    except Exception as e:
+        log.error(f"Gagal menyimpan {len(keys)} lisensi bulk untuk '{script_name}' ke database: {e}")
+        return False
+    finally:
+        for key in keys:
+            license_cache.invalidate(key)
+
+def _license_cache_ttl(row) -> Optional[float]:
+    """TTL cache untuk lisensi yang akan kedaluwarsa: tidak boleh melewati expires_at."""
+    if not row or row['expires_at'] is None:
+        return None
+    remaining = (row['expires_at'] - datetime.now(timezone.utc)).total_seconds()
+    return max(0.0, min(LICENSE_CACHE_TTL, remaining))
 
 async def fetch_script_by_license(pool: asyncpg.Pool, key: str) -> Optional[str]:
-    """Mengambil nama script dari database berdasarkan key lisensi."""
-    sql = "SELECT script_name FROM licenses WHERE key = $1;"
+    """Mengambil nama script dari database berdasarkan key lisensi (lewat snapshot dan license_cache)."""
+    digest = license_key_digest(key)
+    if license_snapshot.ready:
+        script_name = license_snapshot.get(digest)
+        if script_name is not None:
+            return script_name
+        # Tidak ada di snapshot: mungkin key baru sejak polling terakhir, cek ke DB
+    found, cached = license_cache.get(key)
+    if found:
+        return None if cached is TOMBSTONE else cached
+
     try:
         async with pool.acquire() as connection:
-            result = await connection.fetchrow(sql, key)
-            return result['script_name'] if result else None
+            result = await _fetchrow(connection, "fetch_license", *license_key_args(key))
     except Exception as e:
+        # Error database tidak di-cache, supaya request berikutnya mencoba lagi
         log.error(f"Gagal mengambil script berdasarkan key '{key}' dari database: {e}")
         return None
 
-# --- Operasi Tabel Sales Limits (TIDAK BERUBAH) ---
+    script_name = result['script_name'] if result else None
+    license_cache.set(key, TOMBSTONE if script_name is None else script_name, ttl=_license_cache_ttl(result))
+    return script_name
+
+async def fetch_scripts_by_licenses(pool: asyncpg.Pool, keys: List[str]) -> Optional[Dict[str, Optional[str]]]:
+    """Mengambil nama script untuk banyak key sekaligus (satu query ANY untuk key yang tidak ada di cache).
 
-async def get_sales_limit_db(pool: asyncpg.Pool, sales_user_id: str) -> Optional[int]:
-    """Mendapatkan limit sales dari database."""
-    sql = "SELECT current_limit FROM sales_limits WHERE sales_user_id = $1;"
+    Mengembalikan dict key -> script_name (None jika key tidak dikenal), atau None jika error database.
+    """
+    results: Dict[str, Optional[str]] = {}
+    missing: Dict[bytes, str] = {} # digest -> key
+    for key in dict.fromkeys(keys):
+        digest = license_key_digest(key)
+        if license_snapshot.ready:
+            script_name = license_snapshot.get(digest)
+            if script_name is not None:
+                results[key] = script_name
+                continue
+        found, cached = license_cache.get(key)
+        if found:
+            results[key] = None if cached is TOMBSTONE else cached
+        else:
+            missing[digest] = key
+    if not missing:
+        return results
+
+    sql = f"""
+    SELECT {LICENSE_DIGEST_SQL} AS key_hash, script_name, expires_at FROM licenses
+    WHERE {LICENSE_MATCH_ANY_SQL} AND (expires_at IS NULL OR expires_at > NOW());
+    """
+    args = [list(column) for column in zip(*(license_key_args(key) for key in missing.values()))]
     try:
         async with pool.acquire() as connection:
-            result = await connection.fetchval(sql, sales_user_id)
-            return result if result is not None else 0
+            rows = await connection.fetch(sql, *args)
     except Exception as e:
-        log.error(f"Gagal mengambil limit sales dari database untuk {sales_user_id}: {e}")
+        log.error(f"Gagal mengambil script untuk {len(missing)} key dari database: {e}")
         return None
 
-async def decrement_sales_limit_db(pool: asyncpg.Pool, sales_user_id: str) -> bool:
-    """Mengurangi limit sales di database secara aman."""
+    found_rows = {bytes(row['key_hash']): row for row in rows}
+    for digest, key in missing.items():
+        row = found_rows.get(digest)
+        script_name = row['script_name'] if row else None
+        license_cache.set(key, TOMBSTONE if script_name is None else script_name, ttl=_license_cache_ttl(row))
+        results[key] = script_name
+    return results
+
+async def load_license_snapshot_db(pool: asyncpg.Pool, batch_size: int = 50000) -> Optional[LicenseSnapshot]:
+    """Memuat seluruh lisensi aktif ke snapshot baru.
+
+    Hash dihitung dan diurutkan di Postgres, jadi baris bisa langsung di-append ke array
+    tanpa sort di Python. Baris di-stream dengan cursor supaya memori tetap kecil.
+    """
+    sql = f"""
+    SELECT {SNAPSHOT_HASH_SQL.format(digest=LICENSE_DIGEST_SQL)} AS hash, script_name, expires_at
+    FROM licenses
+    WHERE expires_at IS NULL OR expires_at > NOW()
+    ORDER BY 1;
+    """
+    snapshot = LicenseSnapshot()
+    try:
+        async with pool.acquire() as connection:
+            async with connection.transaction(isolation='repeatable_read', readonly=True):
+                # Waktu mulai transaksi = batas polling berikutnya (baris yang lebih baru belum terlihat)
+                snapshot.watermark = await connection.fetchval("SELECT NOW();")
+                async for row in connection.cursor(sql, prefetch=batch_size):
+                    snapshot.append_sorted(row['hash'], row['script_name'], row['expires_at'])
+    except Exception as e:
+        log.error(f"Gagal memuat snapshot lisensi: {e}")
+        return None
+    snapshot.loaded_at = time.time()
+    snapshot.ready = True
+    return snapshot
+
+async def fetch_licenses_since_db(pool: asyncpg.Pool, since: datetime) -> Optional[List[asyncpg.Record]]:
+    """Lisensi dengan created_at >= since (polling incremental snapshot)."""
+    sql = f"SELECT {LICENSE_DIGEST_SQL} AS key_hash, script_name, expires_at, created_at FROM licenses WHERE created_at >= $1 ORDER BY created_at;"
+    try:
+        async with pool.acquire() as connection:
+            return await connection.fetch(sql, since)
+    except Exception as e:
+        log.error(f"Gagal mengambil lisensi baru untuk snapshot: {e}")
+        return None
+
+# Overlap polling: transaksi yang mulai (created_at) sebelum watermark bisa commit setelahnya
+SNAPSHOT_POLL_OVERLAP = timedelta(seconds=60)
+
+async def reload_license_snapshot(pool: asyncpg.Pool) -> bool:
+    """Load penuh snapshot lisensi dan ganti snapshot aktif."""
+    global license_snapshot
+    started = time.perf_counter()
+    snapshot = await load_license_snapshot_db(pool)
+    if snapshot is None:
+        return False
+    license_snapshot = snapshot
+    log.info(f"Snapshot lisensi dimuat: {len(snapshot)} key, {snapshot.memory_bytes() / 1e6:.1f} MB "
+             f"dalam {time.perf_counter() - started:.2f} detik.")
+    return True
+
+async def poll_license_snapshot(pool: asyncpg.Pool) -> bool:
+    """Menambahkan lisensi baru (berdasarkan created_at) ke snapshot aktif."""
+    snapshot = license_snapshot
+    if not snapshot.ready:
+        return False
+    rows = await fetch_licenses_since_db(pool, snapshot.watermark - SNAPSHOT_POLL_OVERLAP)
+    if rows is None:
+        return False
+    for row in rows:
+        snapshot.add(row['key_hash'], row['script_name'], row['expires_at'])
+        if row['created_at'] > snapshot.watermark:
+            snapshot.watermark = row['created_at']
+    return True
+
+async def sweep_expired_licenses_db(pool: asyncpg.Pool, batch_size: int, archive: bool = True) -> Optional[int]:
+    """Menghapus (dan opsional mengarsipkan ke licenses_expired) satu batch lisensi kedaluwarsa.
+
+    Batch kecil + SKIP LOCKED menjaga lock tetap singkat; panggil berulang sampai hasilnya < batch_size.
+    Return jumlah lisensi yang dihapus, atau None jika error.
+    """
+    key_columns = ", ".join(LICENSE_KEY_COLUMNS)
+    sql = f"""
+    WITH expired AS (
+        DELETE FROM licenses
+        WHERE ctid = ANY(ARRAY(
+            SELECT ctid FROM licenses
+            WHERE expires_at <= NOW()
+            ORDER BY expires_at
+            LIMIT $1
+            FOR UPDATE SKIP LOCKED
+        ))
+        RETURNING {key_columns}, script_name, created_at, expires_at
+    ), archived AS (
+        INSERT INTO licenses_expired ({key_columns}, script_name, created_at, expires_at)
+        SELECT {key_columns}, script_name, created_at, expires_at FROM expired WHERE $2::boolean
+    )
+    SELECT COUNT(*) FROM expired;
+    """
+    try:
+        async with pool.acquire() as connection:
+            return await connection.fetchval(sql, batch_size, archive)
+    except Exception as e:
+        log.error(f"Gagal menghapus lisensi kedaluwarsa: {e}")
+        return None
+
+# --- Operasi Tabel License Usage (pemakaian lisensi, di-flush dari buffer write-behind) ---
+
+# Perkiraan IP unik dari sketch KMV (sama dengan estimate_distinct di utils/license_usage.py)
+IP_ESTIMATE_SQL = f"""
+CASE WHEN cardinality(u.ip_sketch) < {IP_SKETCH_SIZE} THEN cardinality(u.ip_sketch)
+     ELSE round({IP_SKETCH_SIZE - 1} * 9223372036854775808::numeric / GREATEST(u.ip_sketch[{IP_SKETCH_SIZE}], 1))
+END
+"""
+
+async def flush_license_usage_db(pool: asyncpg.Pool, entries: Dict[str, UsageEntry]) -> bool:
+    """Upsert isi buffer pemakaian dalam satu statement (unnest array, satu round-trip).
+
+    Baris diurutkan berdasarkan key_hash supaya flush paralel dari beberapa worker tidak deadlock.
+    Sketch IP lama dan baru digabung di SQL dengan mengambil IP_SKETCH_SIZE hash terkecil.
+    """
+    rows = sorted((license_key_digest(key), entry) for key, entry in entries.items())
     sql = """
-    UPDATE sales_limits
-    SET current_limit = current_limit - 1
-    WHERE sales_user_id = $1 AND current_limit > 0
-    RETURNING current_limit;
+    INSERT INTO license_usage AS u (key_hash, uses, first_seen, last_seen, ip_sketch)
+    SELECT b.key_hash, b.uses, b.first_seen, b.last_seen, b.ip_sketch::bigint[]
+    FROM unnest($1::bytea[], $2::bigint[], $3::timestamptz[], $4::timestamptz[], $5::text[])
+        AS b(key_hash, uses, first_seen, last_seen, ip_sketch)
+    ON CONFLICT (key_hash) DO UPDATE SET
+        uses = u.uses + EXCLUDED.uses,
+        last_seen = GREATEST(u.last_seen, EXCLUDED.last_seen),
+        ip_sketch = ARRAY(
+            SELECT DISTINCT v FROM unnest(u.ip_sketch || EXCLUDED.ip_sketch) AS v ORDER BY v LIMIT $6
+        );
     """
     try:
         async with pool.acquire() as connection:
-            new_limit = await connection.fetchval(sql, sales_user_id)
-            return True if new_limit is not None else False
+            await connection.execute(
+                sql,
+                [digest for digest, entry in rows],
+                [entry.uses for digest, entry in rows],
+                [entry.first_seen for digest, entry in rows],
+                [entry.last_seen for digest, entry in rows],
+                ["{" + ",".join(map(str, entry.sketch)) + "}" for digest, entry in rows],
+                IP_SKETCH_SIZE
+            )
+        return True
     except Exception as e:
-        log.error(f"Gagal mengurangi limit sales di database untuk {sales_user_id}: {e}")
+        log.error(f"Gagal menyimpan pemakaian {len(rows)} lisensi ke database: {e}")
         return False
 
+async def fetch_license_usage_report_db(pool: asyncpg.Pool, limit: int, stale_days: int,
+                                        sharing_ips: int) -> Optional[Dict[str, Any]]:
+    """Laporan pemakaian: key paling sering dipakai, key yang dicurigai dibagikan, dan jumlah lisensi tidak aktif.
+
+    Key ditampilkan sebagai key_id (lihat utils/license_keys.license_key_id).
+    """
+    key_id = KEY_ID_SQL.format(digest="u.key_hash")
+    top_sql = f"""
+    SELECT {key_id} AS key_id, l.script_name, u.uses, u.last_seen, {IP_ESTIMATE_SQL} AS ips
+    FROM license_usage u LEFT JOIN licenses l USING (key_hash)
+    ORDER BY u.uses DESC
+    LIMIT $1;
+    """
+    sharing_sql = f"""
+    SELECT * FROM (
+        SELECT {key_id} AS key_id, l.script_name, u.uses, u.last_seen, {IP_ESTIMATE_SQL} AS ips
+        FROM license_usage u JOIN licenses l USING (key_hash)
+    ) s
+    WHERE ips >= $2
+    ORDER BY ips DESC, uses DESC
+    LIMIT $1;
+    """
+    stale_sql = """
+    SELECT COUNT(*) AS total,
+           COUNT(*) FILTER (WHERE u.key_hash IS NULL) AS never_used,
+           COUNT(*) FILTER (WHERE u.last_seen < NOW() - make_interval(days => $1::int)) AS stale
+    FROM licenses l LEFT JOIN license_usage u USING (key_hash);
+    """
+    try:
+        async with pool.acquire() as connection:
+            return {
+                "top": await connection.fetch(top_sql, limit),
+                "sharing": await connection.fetch(sharing_sql, limit, sharing_ips),
+                "stale": await connection.fetchrow(stale_sql, stale_days),
+            }
+    except Exception as e:
+        log.error(f"Gagal mengambil laporan pemakaian lisensi: {e}")
+        return None
+
+# --- Operasi Tabel Sales Limits ---
+
+# Nilai kembali add_license_with_sales_limit jika limit sales sudah habis
+SALES_LIMIT_EXHAUSTED = -1
+
+async def add_license_with_sales_limit(pool: asyncpg.Pool, sales_user_id: str, key: str, script_name: str,
+                                       duration_days: Optional[int] = None) -> Optional[int]:
+    """Cek limit, kurangi limit dan simpan lisensi dalam satu statement (satu round-trip, atomik).
+
+    Mengembalikan sisa limit baru, SALES_LIMIT_EXHAUSTED jika limit habis, atau None jika error.
+    Jika insert gagal (mis. key duplikat) seluruh statement dibatalkan, jadi limit tidak hilang.
+    """
+    try:
+        async with pool.acquire() as connection:
+            new_limit = await _fetchval(connection, "add_license_with_sales_limit", sales_user_id, *license_key_args(key),
+                                        script_name, duration_days)
+    except Exception as e:
+        log.error(f"Gagal menyimpan lisensi '{key}' dengan limit sales {sales_user_id}: {e}")
+        return None
+    finally:
+        license_cache.invalidate(key)
+
+    if new_limit is None:
+        return SALES_LIMIT_EXHAUSTED
+    log.info(f"Lisensi '{key}' untuk '{script_name}' disimpan, sisa limit sales {sales_user_id}: {new_limit}.")
+    return new_limit
+
 async def set_sales_limit_db(pool: asyncpg.Pool, sales_user_id: str, new_limit: int) -> bool:
     """Menetapkan limit sales baru (untuk command admin)."""
     if new_limit < 0:
@@ -129,4 +509,322 @@ async def set_sales_limit_db(pool: asyncpg.Pool, sales_user_id: str, new_limit:
         return True
     except Exception as e:
         log.error(f"Gagal menetapkan limit sales di database untuk {sales_user_id}: {e}")
-        return False
\ No newline at end of file
+        return False
+# --- Operasi Tabel Script Catalog (dibagikan bot ke worker API) ---
+
+# Channel LISTEN/NOTIFY untuk memberi tahu worker API bahwa katalog berubah
+SCRIPT_CATALOG_CHANNEL = "script_catalog"
+
+async def replace_script_catalog_db(pool: asyncpg.Pool, entries: List[Any]) -> bool:
+    """Mengganti seluruh isi tabel script_catalog (setelah katalog dibangun ulang) dan memberi tahu worker."""
+    try:
+        async with pool.acquire() as connection:
+            async with connection.transaction():
+                await connection.execute("DELETE FROM script_catalog;")
+                await connection.copy_records_to_table(
+                    'script_catalog',
+                    records=[(e.filename.lower(), e.filename, e.url, e.message_id, e.attachment_id) for e in entries],
+                    columns=['name', 'filename', 'url', 'message_id', 'attachment_id']
+                )
+                await connection.execute("SELECT pg_notify($1, '*');", SCRIPT_CATALOG_CHANNEL)
+        log.info(f"Katalog script dipublikasikan ke database: {len(entries)} file.")
+        return True
+    except Exception as e:
+        log.error(f"Gagal mempublikasikan katalog script ke database: {e}")
+        return False
+
+async def update_script_catalog_db(pool: asyncpg.Pool, changes: Dict[str, Any]) -> bool:
+    """Menyimpan perubahan katalog (nama -> entry terbaru, atau None jika dihapus) dan memberi tahu worker."""
+    upsert_sql = """
+    INSERT INTO script_catalog (name, filename, url, message_id, attachment_id, updated_at)
+    VALUES ($1, $2, $3, $4, $5, NOW())
+    ON CONFLICT (name) DO UPDATE SET
+        filename = EXCLUDED.filename,
+        url = EXCLUDED.url,
+        message_id = EXCLUDED.message_id,
+        attachment_id = EXCLUDED.attachment_id,
+        updated_at = NOW();
+    """
+    upserts = [(name, e.filename, e.url, e.message_id, e.attachment_id) for name, e in changes.items() if e is not None]
+    deletes = [name for name, e in changes.items() if e is None]
+    try:
+        async with pool.acquire() as connection:
+            async with connection.transaction():
+                if upserts:
+                    await connection.executemany(upsert_sql, upserts)
+                if deletes:
+                    await connection.execute("DELETE FROM script_catalog WHERE name = ANY($1::varchar[]);", deletes)
+                await connection.execute("SELECT pg_notify($1, $2);", SCRIPT_CATALOG_CHANNEL, ",".join(changes))
+        return True
+    except Exception as e:
+        log.error(f"Gagal menyimpan perubahan katalog script ke database: {e}")
+        return False
+
+async def fetch_script_catalog_db(pool: asyncpg.Pool) -> Optional[List[asyncpg.Record]]:
+    """Mengambil seluruh isi tabel script_catalog."""
+    sql = "SELECT filename, url, message_id, attachment_id FROM script_catalog;"
+    try:
+        async with pool.acquire() as connection:
+            return await connection.fetch(sql)
+    except Exception as e:
+        log.error(f"Gagal mengambil katalog script dari database: {e}")
+        return None
+
+# --- Operasi Tabel Outbox (pengiriman log pembelian & DM lisensi di background) ---
+
+async def enqueue_outbox_db(pool: asyncpg.Pool, items: List[Tuple[str, Dict[str, Any]]]) -> bool:
+    """Menyimpan item outbox (kind, payload) dalam satu round-trip."""
+    sql = """
+    INSERT INTO outbox (kind, payload)
+    SELECT * FROM unnest($1::varchar[], $2::jsonb[]);
+    """
+    try:
+        async with pool.acquire() as connection:
+            await connection.execute(sql, [kind for kind, _ in items], [json.dumps(payload) for _, payload in items])
+        return True
+    except Exception as e:
+        log.error(f"Gagal menyimpan {len(items)} item outbox ke database: {e}")
+        return False
+
+async def claim_outbox_db(pool: asyncpg.Pool, kinds: List[str], limit: int, lease_seconds: float) -> Optional[List[asyncpg.Record]]:
+    """Mengambil item outbox yang sudah jatuh tempo dan menyewanya selama lease_seconds.
+
+    Item yang tidak diselesaikan sebelum lease habis (mis. bot crash) akan diambil ulang.
+    SKIP LOCKED membuat beberapa worker tidak saling menunggu.
+    """
+    sql = """
+    UPDATE outbox SET attempts = attempts + 1, next_attempt_at = NOW() + make_interval(secs => $3)
+    WHERE id IN (
+        SELECT id FROM outbox
+        WHERE kind = ANY($1::varchar[]) AND next_attempt_at <= NOW()
+        ORDER BY id
+        LIMIT $2
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING id, kind, payload, attempts;
+    """
+    try:
+        async with pool.acquire() as connection:
+            rows = await connection.fetch(sql, kinds, limit, float(lease_seconds))
+        return sorted(rows, key=lambda row: row['id'])
+    except Exception as e:
+        log.error(f"Gagal mengambil item outbox dari database: {e}")
+        return None
+
+async def complete_outbox_db(pool: asyncpg.Pool, ids: List[int]) -> bool:
+    """Menghapus item outbox yang sudah terkirim."""
+    try:
+        async with pool.acquire() as connection:
+            await connection.execute("DELETE FROM outbox WHERE id = ANY($1::bigint[]);", ids)
+        return True
+    except Exception as e:
+        log.error(f"Gagal menghapus item outbox {ids}: {e}")
+        return False
+
+# Item gagal permanen tidak pernah dihapus: key plaintext di payload diganti ID pendek
+# (sama dengan license_key_id), cukup untuk dicocokkan dengan laporan tanpa menyimpan key.
+REDACTED_OUTBOX_PAYLOAD_SQL = """
+payload - 'keys' || jsonb_build_object('key_ids', (
+    SELECT jsonb_agg(encode(substr(sha256(convert_to(k, 'UTF8')), 1, 6), 'hex'))
+    FROM jsonb_array_elements_text(payload->'keys') AS k
+))
+"""
+
+async def retry_outbox_db(pool: asyncpg.Pool, ids: List[int], delay_seconds: Optional[float], error: str) -> bool:
+    """Menjadwalkan ulang item outbox yang gagal; delay_seconds=None menandai item sebagai gagal permanen (payload diredaksi)."""
+    sql = f"""
+    UPDATE outbox
+    SET next_attempt_at = CASE WHEN $2::float8 IS NULL THEN 'infinity'::timestamptz ELSE NOW() + make_interval(secs => $2) END,
+        payload = CASE WHEN $2::float8 IS NULL AND payload ? 'keys' THEN {REDACTED_OUTBOX_PAYLOAD_SQL} ELSE payload END,
+        last_error = $3
+    WHERE id = ANY($1::bigint[]);
+    """
+    try:
+        async with pool.acquire() as connection:
+            await connection.execute(sql, ids, delay_seconds, error[:1000])
+        return True
+    except Exception as e:
+        log.error(f"Gagal menjadwalkan ulang item outbox {ids}: {e}")
+        return False
+
+# --- Operasi Tabel Purchase Events (riwayat generate lisensi, append-only) ---
+
+# Tabel dibuat di migrations.py. Dipartisi per bulan: query rentang tanggal hanya
+# menyentuh partisi yang relevan, dan BRIN pada created_at sangat kecil untuk data
+# yang di-insert berurutan waktu.
+async def ensure_purchase_event_partitions(pool: asyncpg.Pool, now: datetime, months_ahead: int = 1) -> bool:
+    """Membuat partisi bulanan purchase_events (batas bulan UTC) untuk bulan ini sampai months_ahead bulan ke depan.
+
+    Jika partisi default sudah berisi baris untuk bulan tersebut (mis. partisi telat dibuat),
+    CREATE ... PARTITION OF akan gagal; partisi default dilepas dulu, baris dipindah ke
+    partisi baru, lalu default dipasang lagi, semuanya dalam satu transaksi.
+    """
+    now = now.astimezone(timezone.utc)
+    year, month = now.year, now.month
+    try:
+        async with pool.acquire() as connection:
+            for _ in range(months_ahead + 1):
+                next_year, next_month = (year + 1, 1) if month == 12 else (year, month + 1)
+                name = f"purchase_events_{year:04d}_{month:02d}"
+                start = datetime(year, month, 1, tzinfo=timezone.utc)
+                end = datetime(next_year, next_month, 1, tzinfo=timezone.utc)
+                year, month = next_year, next_month
+                if await connection.fetchval("SELECT to_regclass($1) IS NOT NULL;", name):
+                    continue
+                # Batas ditulis sebagai timestamptz UTC eksplisit, tidak bergantung timezone session
+                create_sql = (
+                    f"CREATE TABLE {name} PARTITION OF purchase_events "
+                    f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}');"
+                )
+                async with connection.transaction():
+                    stranded = await connection.fetchval(
+                        "SELECT EXISTS (SELECT 1 FROM purchase_events_default WHERE created_at >= $1 AND created_at < $2);",
+                        start, end
+                    )
+                    if not stranded:
+                        await connection.execute(create_sql)
+                        continue
+                    log.warning(f"Partisi default purchase_events berisi baris untuk {name}, memindahkan ke partisi baru...")
+                    await connection.execute("ALTER TABLE purchase_events DETACH PARTITION purchase_events_default;")
+                    await connection.execute(create_sql)
+                    moved = await connection.execute(f"""
+                        WITH moved AS (
+                            DELETE FROM purchase_events_default WHERE created_at >= $1 AND created_at < $2
+                            RETURNING created_at, generator_id, recipient_id, license_key, license_key_hash, script_name
+                        )
+                        INSERT INTO {name} (created_at, generator_id, recipient_id, license_key, license_key_hash, script_name)
+                        SELECT * FROM moved;
+                    """, start, end)
+                    await connection.execute("ALTER TABLE purchase_events ATTACH PARTITION purchase_events_default DEFAULT;")
+                    log.info(f"Partisi {name} dibuat, {moved.split()[-1]} baris dipindah dari partisi default.")
+        return True
+    except Exception as e:
+        log.error(f"Gagal membuat partisi purchase_events: {e}")
+        return False
+
+async def archive_purchase_events_db(pool: asyncpg.Pool, kind: str, limit: int) -> Optional[int]:
+    """Memindahkan sampai `limit` item outbox `kind` ke purchase_events dalam satu statement.
+
+    Satu item berisi digest semua key dari satu perintah generate; satu baris per key.
+    Return jumlah item outbox yang dipindahkan, atau None jika gagal.
+    """
+    sql = """
+    WITH moved AS (
+        DELETE FROM outbox
+        WHERE id IN (
+            SELECT id FROM outbox
+            WHERE kind = $1 AND next_attempt_at <= NOW()
+            ORDER BY id
+            LIMIT $2
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING payload
+    ), inserted AS (
+        INSERT INTO purchase_events (created_at, generator_id, recipient_id, license_key_hash, script_name)
+        SELECT (payload->>'created_at')::timestamptz, (payload->>'generator_id')::bigint,
+               (payload->>'recipient_id')::bigint, k.key_hash, payload->>'script_name'
+        FROM moved, LATERAL (
+            SELECT decode(h, 'hex') FROM jsonb_array_elements_text(payload->'key_hashes') AS h
+            UNION ALL
+            -- Item dari instance versi lama masih berisi key plaintext
+            SELECT sha256(convert_to(k, 'UTF8')) FROM jsonb_array_elements_text(payload->'keys') AS k
+        ) AS k(key_hash)
+    )
+    SELECT COUNT(*) FROM moved;
+    """
+    try:
+        async with pool.acquire() as connection:
+            return await connection.fetchval(sql, kind, limit)
+    except Exception as e:
+        log.error(f"Gagal memindahkan purchase events dari outbox: {e}")
+        return None
+
+async def redact_purchase_event_keys_db(pool: asyncpg.Pool, batch_size: int) -> Optional[int]:
+    """Mengganti key plaintext yang masih ditulis instance versi lama dengan digest, baris tertua dulu.
+
+    Return jumlah baris yang diproses (panggil berulang sampai < batch_size), atau None jika gagal.
+    """
+    sql = """
+    WITH batch AS (
+        UPDATE purchase_events
+        SET license_key_hash = sha256(convert_to(license_key, 'UTF8')), license_key = NULL
+        WHERE license_key IS NOT NULL AND created_at <= (
+            SELECT MAX(created_at) FROM (
+                SELECT created_at FROM purchase_events WHERE license_key IS NOT NULL ORDER BY created_at LIMIT $1
+            ) oldest
+        )
+        RETURNING 1
+    )
+    SELECT COUNT(*) FROM batch;
+    """
+    try:
+        async with pool.acquire() as connection:
+            return await connection.fetchval(sql, batch_size)
+    except Exception as e:
+        log.error(f"Gagal meredaksi key plaintext di purchase_events: {e}")
+        return None
+
+def _purchase_event_filters(start: datetime, end: datetime, generator_id: Optional[int], script_name: Optional[str]):
+    conditions = ["created_at >= $1", "created_at < $2"]
+    args: List[Any] = [start, end]
+    if generator_id is not None:
+        args.append(generator_id)
+        conditions.append(f"generator_id = ${len(args)}")
+    if script_name is not None:
+        args.append(script_name)
+        conditions.append(f"script_name = ${len(args)}")
+    return " AND ".join(conditions), args
+
+async def fetch_purchase_summary_db(pool: asyncpg.Pool, start: datetime, end: datetime,
+                                    generator_id: Optional[int] = None, script_name: Optional[str] = None) -> Optional[List[asyncpg.Record]]:
+    """Jumlah lisensi per generator dan script dalam rentang [start, end)."""
+    where, args = _purchase_event_filters(start, end, generator_id, script_name)
+    sql = f"""
+    SELECT generator_id, script_name, COUNT(*) AS total, COUNT(DISTINCT recipient_id) AS recipients
+    FROM purchase_events WHERE {where}
+    GROUP BY generator_id, script_name
+    ORDER BY total DESC;
+    """
+    try:
+        async with pool.acquire() as connection:
+            return await connection.fetch(sql, *args)
+    except Exception as e:
+        log.error(f"Gagal mengambil ringkasan purchase events: {e}")
+        return None
+
+async def fetch_purchase_events_db(pool: asyncpg.Pool, start: datetime, end: datetime,
+                                   generator_id: Optional[int] = None, script_name: Optional[str] = None,
+                                   limit: int = 100000) -> Optional[List[asyncpg.Record]]:
+    """Daftar purchase event dalam rentang [start, end), urut waktu. Key ditampilkan sebagai key_id."""
+    where, args = _purchase_event_filters(start, end, generator_id, script_name)
+    args.append(limit)
+    key_id = KEY_ID_SQL.format(digest="COALESCE(license_key_hash, sha256(convert_to(license_key, 'UTF8')))")
+    sql = f"""
+    SELECT created_at, generator_id, recipient_id, {key_id} AS key_id, script_name
+    FROM purchase_events WHERE {where}
+    ORDER BY created_at
+    LIMIT ${len(args)};
+    """
+    try:
+        async with pool.acquire() as connection:
+            return await connection.fetch(sql, *args)
+    except Exception as e:
+        log.error(f"Gagal mengambil purchase events: {e}")
+        return None
+
+async def add_purchase_events_db(pool: asyncpg.Pool, payloads: List[Dict[str, Any]]) -> bool:
+    """Menyimpan purchase event langsung (tanpa outbox) dengan COPY."""
+    records = [
+        (datetime.fromisoformat(p['created_at']), p['generator_id'], p['recipient_id'], bytes.fromhex(key_hash), p['script_name'])
+        for p in payloads for key_hash in p['key_hashes']
+    ]
+    try:
+        async with pool.acquire() as connection:
+            await connection.copy_records_to_table(
+                'purchase_events', records=records,
+                columns=['created_at', 'generator_id', 'recipient_id', 'license_key_hash', 'script_name']
+            )
+        return True
+    except Exception as e:
+        log.error(f"Gagal menyimpan {len(records)} purchase events: {e}")
+        return False
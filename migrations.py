@@ -0,0 +1,258 @@
+import asyncpg
+import logging
+from typing import List, NamedTuple, Optional
+
+from config import LICENSE_KEY_HASH_ONLY
+
+log = logging.getLogger(__name__)
+
+# Kunci pg_advisory_xact_lock: hanya satu instance (bot / worker API) yang menjalankan migrasi
+MIGRATION_LOCK_ID = 727_146_001
+# Jumlah baris per transaksi untuk migrasi dengan backfill
+MIGRATION_BACKFILL_BATCH_SIZE = 5000
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    sql: str
+    # Statement backfill ($1 = ukuran batch, return jumlah baris yang diproses). Dijalankan berulang,
+    # satu transaksi pendek per batch, sampai return 0; baru setelah itu sql dijalankan dan migrasi dicatat.
+    backfill: Optional[str] = None
+    # Migrasi "contract" (menghapus kolom yang masih dipakai versi lama): hanya dijalankan jika
+    # LICENSE_KEY_HASH_ONLY aktif, selain itu dilewati dan dicoba lagi saat start berikutnya.
+    contract: bool = False
+
+# Backfill key_hash dari key plaintext (migrasi 9, diulang di migrasi 13 untuk baris dari instance lama)
+LICENSE_KEY_HASH_BACKFILL = '''
+    WITH active AS (
+        UPDATE licenses SET key_hash = sha256(convert_to(key, 'UTF8'))
+        WHERE ctid = ANY(ARRAY(
+            SELECT ctid FROM licenses WHERE key_hash IS NULL LIMIT $1 FOR UPDATE SKIP LOCKED
+        ))
+        RETURNING 1
+    ), expired AS (
+        UPDATE licenses_expired SET key_hash = sha256(convert_to(key, 'UTF8'))
+        WHERE ctid = ANY(ARRAY(
+            SELECT ctid FROM licenses_expired WHERE key_hash IS NULL LIMIT $1 FOR UPDATE SKIP LOCKED
+        ))
+        RETURNING 1
+    )
+    SELECT (SELECT COUNT(*) FROM active) + (SELECT COUNT(*) FROM expired);
+'''
+
+# --- Daftar Migrasi ---
+# Hanya boleh ditambah di akhir; migrasi yang sudah dirilis tidak boleh diubah.
+# Semua memakai IF NOT EXISTS supaya aman untuk database lama yang tabelnya dibuat manual.
+MIGRATIONS: List[Migration] = [
+    Migration(1, "create_licenses", '''
+        CREATE TABLE IF NOT EXISTS licenses (
+            key VARCHAR(255) PRIMARY KEY,
+            script_name VARCHAR(255) NOT NULL,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+        );
+    '''),
+    Migration(2, "create_sales_limits", '''
+        CREATE TABLE IF NOT EXISTS sales_limits (
+            sales_user_id VARCHAR(255) PRIMARY KEY,
+            current_limit INTEGER NOT NULL DEFAULT 0 CHECK (current_limit >= 0)
+        );
+    '''),
+    Migration(3, "license_expiry", '''
+        ALTER TABLE licenses ADD COLUMN IF NOT EXISTS expires_at TIMESTAMP WITH TIME ZONE;
+        -- Partial index: sweeper hanya memindai lisensi yang punya masa berlaku
+        CREATE INDEX IF NOT EXISTS licenses_expires_at_idx ON licenses (expires_at) WHERE expires_at IS NOT NULL;
+        CREATE TABLE IF NOT EXISTS licenses_expired (
+            key VARCHAR(255) NOT NULL,
+            script_name VARCHAR(255) NOT NULL,
+            created_at TIMESTAMP WITH TIME ZONE,
+            expires_at TIMESTAMP WITH TIME ZONE,
+            archived_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+        );
+        CREATE INDEX IF NOT EXISTS licenses_expired_key_idx ON licenses_expired (key);
+    '''),
+    Migration(4, "licenses_reporting_indexes", '''
+        CREATE INDEX IF NOT EXISTS licenses_script_name_created_at_idx ON licenses (script_name, created_at);
+        CREATE INDEX IF NOT EXISTS licenses_created_at_brin ON licenses USING BRIN (created_at);
+    '''),
+    Migration(5, "create_script_catalog", '''
+        CREATE TABLE IF NOT EXISTS script_catalog (
+            name VARCHAR(255) PRIMARY KEY,
+            filename VARCHAR(255) NOT NULL,
+            url TEXT NOT NULL,
+            message_id BIGINT NOT NULL,
+            attachment_id BIGINT NOT NULL,
+            updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+        );
+    '''),
+    Migration(6, "create_outbox", '''
+        CREATE TABLE IF NOT EXISTS outbox (
+            id BIGSERIAL PRIMARY KEY,
+            kind VARCHAR(32) NOT NULL,
+            payload JSONB NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+            last_error TEXT,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+        );
+        CREATE INDEX IF NOT EXISTS outbox_kind_next_attempt_idx ON outbox (kind, next_attempt_at);
+    '''),
+    # Partisi bulanan dibuat saat runtime oleh ensure_purchase_event_partitions
+    Migration(7, "create_purchase_events", '''
+        CREATE TABLE IF NOT EXISTS purchase_events (
+            created_at TIMESTAMP WITH TIME ZONE NOT NULL,
+            generator_id BIGINT NOT NULL,
+            recipient_id BIGINT NOT NULL,
+            license_key VARCHAR(255) NOT NULL,
+            script_name VARCHAR(255) NOT NULL
+        ) PARTITION BY RANGE (created_at);
+        CREATE TABLE IF NOT EXISTS purchase_events_default PARTITION OF purchase_events DEFAULT;
+        CREATE INDEX IF NOT EXISTS purchase_events_created_at_brin ON purchase_events USING BRIN (created_at);
+        CREATE INDEX IF NOT EXISTS purchase_events_generator_idx ON purchase_events (generator_id, created_at);
+        CREATE INDEX IF NOT EXISTS purchase_events_script_idx ON purchase_events (script_name, created_at);
+    '''),
+    # Key lisensi disimpan juga sebagai digest SHA-256 (bytea 32 byte), tahap "expand":
+    # kolom key dan primary key-nya tetap ada supaya instance versi lama yang masih berjalan
+    # (mengisi key saja) tidak rusak. Kode menulis keduanya dan membaca key_hash dengan
+    # fallback ke key, sampai LICENSE_KEY_HASH_ONLY diaktifkan (migrasi 13).
+    Migration(8, "license_key_hash", '''
+        ALTER TABLE licenses ADD COLUMN IF NOT EXISTS key_hash BYTEA;
+        CREATE UNIQUE INDEX IF NOT EXISTS licenses_key_hash_idx ON licenses (key_hash);
+        ALTER TABLE licenses_expired ADD COLUMN IF NOT EXISTS key_hash BYTEA;
+        -- Index sementara untuk backfill, supaya tiap batch tidak memindai ulang seluruh tabel
+        CREATE INDEX IF NOT EXISTS licenses_key_hash_missing_idx ON licenses (created_at) WHERE key_hash IS NULL;
+        CREATE INDEX IF NOT EXISTS licenses_expired_key_hash_missing_idx ON licenses_expired (archived_at) WHERE key_hash IS NULL;
+    '''),
+    # Backfill digest baris lama per batch (key plaintext tidak diubah).
+    Migration(9, "license_key_hash_backfill", '''
+        DROP INDEX IF EXISTS licenses_key_hash_missing_idx;
+        DROP INDEX IF EXISTS licenses_expired_key_hash_missing_idx;
+        CREATE INDEX IF NOT EXISTS licenses_expired_key_hash_idx ON licenses_expired (key_hash);
+    ''', backfill=LICENSE_KEY_HASH_BACKFILL),
+    # Di-upsert tiap beberapa detik: tanpa index sekunder + fillfactor supaya update bisa HOT.
+    # Laporan menampilkan ID dari key_hash (utils/license_keys.license_key_id), bukan potongan key.
+    Migration(10, "create_license_usage", '''
+        CREATE TABLE IF NOT EXISTS license_usage (
+            key_hash BYTEA PRIMARY KEY,
+            uses BIGINT NOT NULL DEFAULT 0,
+            first_seen TIMESTAMP WITH TIME ZONE NOT NULL,
+            last_seen TIMESTAMP WITH TIME ZONE NOT NULL,
+            ip_sketch BIGINT[] NOT NULL DEFAULT '{}'
+        ) WITH (fillfactor = 80);
+    '''),
+    # purchase_events menyimpan digest key (license_key_hash), bukan plaintext. license_key hanya
+    # boleh NULL supaya instance versi lama yang masih menulis plaintext tetap jalan; sisa plaintext
+    # dari instance lama dibersihkan berkala oleh redact_purchase_event_keys_db.
+    Migration(11, "purchase_events_key_hash", '''
+        ALTER TABLE purchase_events ADD COLUMN IF NOT EXISTS license_key_hash BYTEA;
+        ALTER TABLE purchase_events ALTER COLUMN license_key DROP NOT NULL;
+        -- Tetap dipakai setelah backfill: biasanya kosong, jadi pembersihan berkala murah
+        CREATE INDEX IF NOT EXISTS purchase_events_plaintext_key_idx ON purchase_events (created_at) WHERE license_key IS NOT NULL;
+    '''),
+    # Backfill per batch (baris tertua dulu) lalu redaksi payload outbox yang gagal permanen:
+    # key plaintext diganti ID pendek, karena item tersebut tidak pernah dihapus.
+    Migration(12, "purchase_events_key_hash_backfill", '''
+        UPDATE outbox
+        SET payload = payload - 'keys' || jsonb_build_object('key_ids', (
+            SELECT jsonb_agg(encode(substr(sha256(convert_to(k, 'UTF8')), 1, 6), 'hex'))
+            FROM jsonb_array_elements_text(payload->'keys') AS k
+        ))
+        WHERE next_attempt_at = 'infinity' AND payload ? 'keys';
+    ''', backfill='''
+        WITH batch AS (
+            UPDATE purchase_events
+            SET license_key_hash = sha256(convert_to(license_key, 'UTF8')), license_key = NULL
+            WHERE license_key IS NOT NULL AND created_at <= (
+                SELECT MAX(created_at) FROM (
+                    SELECT created_at FROM purchase_events WHERE license_key IS NOT NULL ORDER BY created_at LIMIT $1
+                ) oldest
+            )
+            RETURNING 1
+        )
+        SELECT COUNT(*) FROM batch;
+    '''),
+    # Tahap "contract" migrasi 8/9 (hanya dengan LICENSE_KEY_HASH_ONLY): backfill ulang baris yang
+    # ditulis instance lama selama rollout, lalu kolom key plaintext dihapus dan key_hash menjadi
+    # primary key. Tabel dikunci dulu supaya tidak ada insert berisi key saja di antara
+    # backfill terakhir dan SET NOT NULL.
+    Migration(13, "license_key_hash_contract", '''
+        LOCK TABLE licenses, licenses_expired IN ACCESS EXCLUSIVE MODE;
+        UPDATE licenses SET key_hash = sha256(convert_to(key, 'UTF8')) WHERE key_hash IS NULL;
+        UPDATE licenses_expired SET key_hash = sha256(convert_to(key, 'UTF8')) WHERE key_hash IS NULL;
+        ALTER TABLE licenses DROP CONSTRAINT IF EXISTS licenses_pkey;
+        ALTER TABLE licenses DROP COLUMN IF EXISTS key;
+        ALTER TABLE licenses ALTER COLUMN key_hash SET NOT NULL;
+        ALTER TABLE licenses ADD CONSTRAINT licenses_pkey PRIMARY KEY USING INDEX licenses_key_hash_idx;
+        DROP INDEX IF EXISTS licenses_expired_key_idx;
+        ALTER TABLE licenses_expired DROP COLUMN IF EXISTS key;
+        ALTER TABLE licenses_expired ALTER COLUMN key_hash SET NOT NULL;
+    ''', backfill=LICENSE_KEY_HASH_BACKFILL, contract=True),
+]
+
+async def _lock_and_check(connection, version: int) -> bool:
+    """Ambil advisory lock transaksi; True jika migrasi version sudah diterapkan (oleh instance lain)."""
+    await connection.execute("SELECT pg_advisory_xact_lock($1);", MIGRATION_LOCK_ID)
+    return await connection.fetchval("SELECT 1 FROM schema_migrations WHERE version = $1;", version) is not None
+
+async def _run_backfill(connection, migration: Migration):
+    """Menjalankan backfill migrasi per batch, masing-masing dalam transaksi pendek sendiri.
+
+    Tiap batch memegang advisory lock yang sama, jadi aman walau beberapa instance start bersamaan.
+    """
+    total = 0
+    while True:
+        async with connection.transaction():
+            if await _lock_and_check(connection, migration.version):
+                return
+            processed = await connection.fetchval(migration.backfill, MIGRATION_BACKFILL_BATCH_SIZE)
+        if not processed:
+            break
+        total += processed
+        log.info(f"Backfill migrasi {migration.version}: {total} baris diproses...")
+    log.info(f"Backfill migrasi {migration.version} selesai ({total} baris).")
+
+async def run_migrations(pool: asyncpg.Pool) -> bool:
+    """Menjalankan migrasi yang belum diterapkan, masing-masing dalam transaksi dengan advisory lock.
+
+    Lock level transaksi (bukan session) supaya tetap aman di belakang pooler mode transaksi.
+    Instance lain menunggu lock lalu melihat migrasi sudah diterapkan. Migrasi dengan backfill
+    memproses data lama per batch dulu sebelum bagian schema-nya dijalankan.
+    """
+    try:
+        async with pool.acquire() as connection:
+            async with connection.transaction():
+                await connection.execute("SELECT pg_advisory_xact_lock($1);", MIGRATION_LOCK_ID)
+                await connection.execute('''
+                    CREATE TABLE IF NOT EXISTS schema_migrations (
+                        version INTEGER PRIMARY KEY,
+                        name VARCHAR(255) NOT NULL,
+                        applied_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+                    )
+                ''')
+                applied = {row['version'] for row in await connection.fetch("SELECT version FROM schema_migrations;")}
+            pending = [m for m in MIGRATIONS if m.version not in applied]
+            deferred = [m for m in pending if m.contract and not LICENSE_KEY_HASH_ONLY]
+            for migration in deferred:
+                log.info(f"Migrasi {migration.version} ({migration.name}) ditunda sampai LICENSE_KEY_HASH_ONLY diaktifkan.")
+            pending = [m for m in pending if m not in deferred]
+            for migration in pending:
+                log.info(f"Menjalankan migrasi {migration.version}: {migration.name}...")
+                if migration.backfill:
+                    await _run_backfill(connection, migration)
+                async with connection.transaction():
+                    if await _lock_and_check(connection, migration.version):
+                        continue
+                    await connection.execute(migration.sql)
+                    await connection.execute(
+                        "INSERT INTO schema_migrations (version, name) VALUES ($1, $2);",
+                        migration.version, migration.name
+                    )
+        if pending:
+            log.info(f"{len(pending)} migrasi database diterapkan (versi terbaru: {pending[-1].version}).")
+            # Koneksi lama mungkin gagal prepare statement sebelum tabel/kolom ada; buat ulang
+            await pool.expire_connections()
+        else:
+            log.info("Skema database sudah versi terbaru.")
+        return True
+    except Exception as e:
+        log.error(f"Gagal menjalankan migrasi database: {e}")
+        return False
@@ -0,0 +1,642 @@
+import aiohttp
+from aiohttp import web
+import asyncio
+import logging
+import math
+import socket
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from urllib.parse import unquote_plus
+
+# Impor dari file lain
+from config import (
+    BATCH_VALIDATE_MAX_ITEMS, SCRIPT_SERVE_MODE, SCRIPT_BLOB_CACHE_DIR, SCRIPT_BLOB_CACHE_MAX_BYTES, METRICS_TOKEN,
+    RATE_LIMIT_ENABLED, RATE_LIMIT_IP_RATE, RATE_LIMIT_IP_BURST, RATE_LIMIT_KEY_RATE, RATE_LIMIT_KEY_BURST,
+    RATE_LIMIT_MAX_KEYS, RATE_LIMIT_IP_ENABLED, TRUSTED_PROXY_HOPS, WEB_DRAIN_TIMEOUT, WEB_DRAIN_READY_DELAY,
+    LICENSE_SNAPSHOT_ENABLED, LICENSE_SNAPSHOT_POLL_SECONDS, LICENSE_SNAPSHOT_RELOAD_MINUTES,
+    LICENSE_USAGE_ENABLED, LICENSE_USAGE_FLUSH_SECONDS, LICENSE_USAGE_MAX_KEYS,
+    API_JSON_DECODER, API_MAX_BODY_BYTES, API_BATCH_MAX_BODY_BYTES, API_COMPACT_REQUESTS,
+    API_KEEPALIVE_TIMEOUT, API_LISTEN_BACKLOG
+)
+from database import (
+    fetch_script_by_license, fetch_scripts_by_licenses, fetch_script_catalog_db,
+    reload_license_snapshot, poll_license_snapshot, flush_license_usage_db
+)
+from utils.script_catalog import ScriptCatalog, ScriptEntry, catalog_from_entries
+from utils.blob_cache import BlobCache
+from utils.singleflight import SingleFlight
+from utils.metrics import REGISTRY
+from utils.rate_limit import TokenBucketLimiter
+from utils.license_usage import UsageBuffer
+from utils.fast_json import get_json_codec
+
+log = logging.getLogger(__name__)
+
+# Log per-request memakai %-style (diformat hanya jika lolos filter) dan extra route
+# supaya bisa di-sampling lewat LOG_SAMPLE_RATES
+GET_SCRIPT_LOG = {"route": "/get_script"}
+GET_SCRIPTS_LOG = {"route": "/get_scripts"}
+
+# --- Metrics (dirender di /metrics) ---
+API_REQUESTS = REGISTRY.counter("license_api_requests_total", "Jumlah request API per route dan hasil respon", ("route", "result"))
+API_LATENCY = REGISTRY.histogram("license_api_request_seconds", "Latency total request API per route", ("route",))
+API_PHASE_LATENCY = REGISTRY.histogram("license_api_phase_seconds", "Latency per fase di jalur validasi", ("phase",))
+DB_POOL_SIZE = REGISTRY.gauge("db_pool_connections", "Jumlah koneksi terbuka di pool asyncpg")
+DB_POOL_IN_USE = REGISTRY.gauge("db_pool_connections_in_use", "Jumlah koneksi pool yang sedang dipakai")
+DB_POOL_IDLE = REGISTRY.gauge("db_pool_connections_idle", "Jumlah koneksi pool yang idle")
+DB_POOL_MAX = REGISTRY.gauge("db_pool_connections_max", "Ukuran maksimal pool asyncpg")
+CATALOG_SCRIPTS = REGISTRY.gauge("script_catalog_entries", "Jumlah file script di katalog")
+RATE_LIMIT_BUCKETS = REGISTRY.gauge("license_api_rate_limit_buckets", "Jumlah bucket rate limit aktif (IP + key)")
+SINGLEFLIGHT_SHARED = REGISTRY.gauge("license_api_singleflight_shared", "Lookup yang menumpang hasil lookup in-flight lain")
+USAGE_BUFFER_KEYS = REGISTRY.gauge("license_usage_buffer_keys", "Jumlah key di buffer pemakaian yang belum di-flush")
+USAGE_DROPPED = REGISTRY.gauge("license_usage_dropped", "Pemakaian lisensi yang dibuang karena buffer penuh sejak start")
+USAGE_FLUSHES = REGISTRY.counter("license_usage_flushes_total", "Flush buffer pemakaian ke database per hasil", ("result",))
+
+# Route untuk monitoring/health check: tidak dihitung di metrics dan tidak kena rate limit
+INTERNAL_ROUTES = ("/metrics", "/ready")
+
+# Varian ringkas /get_script (API_COMPACT_REQUESTS): body form-urlencoded, atau GET dengan header
+FORM_CONTENT_TYPE = "application/x-www-form-urlencoded"
+LICENSE_KEY_HEADER = "X-License-Key"
+SCRIPT_REQUEST_HEADER = "X-Script-Request"
+
+@web.middleware
+async def metrics_middleware(request: web.Request, handler):
+    """Mencatat jumlah request per hasil (INVALID, UNAUTHORIZED_SCRIPT, SCRIPT_NOT_FOUND, 200, ...) dan latency.
+
+    Label route memakai pola route terdaftar; path lain (404, scanner) digabung ke "unmatched"
+    supaya jumlah series tetap terbatas.
+    """
+    if request.path in INTERNAL_ROUTES:
+        return await handler(request)
+    resource = request.match_info.route.resource
+    route = resource.canonical if resource is not None else "unmatched"
+    start = time.perf_counter()
+    try:
+        response = await handler(request)
+    except web.HTTPException as e:
+        API_REQUESTS.inc(route, str(e.status))
+        raise
+    except Exception:
+        API_REQUESTS.inc(route, "500")
+        raise
+    finally:
+        API_LATENCY.observe(time.perf_counter() - start, route)
+    if response.status in (200, 304) or not isinstance(response, web.Response) or response.text is None:
+        result = str(response.status)
+    else:
+        result = response.text
+    API_REQUESTS.inc(route, result)
+    return response
+
+def client_ip(request: web.Request) -> str:
+    """IP klien untuk rate limit dan statistik pemakaian.
+
+    Tanpa proxy tepercaya (TRUSTED_PROXY_HOPS=0) X-Forwarded-For diabaikan. Dengan N proxy, dipakai
+    entry ke-N dari kanan (ditambahkan proxy terluar); entry lebih kiri dikirim klien dan bisa dipalsukan.
+    """
+    if TRUSTED_PROXY_HOPS:
+        forwarded = request.headers.getall("X-Forwarded-For", ())
+        hops = [hop.strip() for value in forwarded for hop in value.split(",")]
+        if len(hops) >= TRUSTED_PROXY_HOPS and hops[-TRUSTED_PROXY_HOPS]:
+            return hops[-TRUSTED_PROXY_HOPS]
+    return request.remote or ""
+
+def accepts_gzip(accept_encoding: str) -> bool:
+    """True jika header Accept-Encoding mengizinkan gzip (q > 0, lewat gzip/x-gzip atau "*").
+
+    "gzip;q=0" berarti ditolak. gzip juga tidak dipilih jika identity diberi q lebih tinggi.
+    """
+    qualities: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0 # q tidak valid: anggap tidak diterima
+        qualities[coding] = q
+    gzip_q = qualities.get("gzip", qualities.get("x-gzip", qualities.get("*", 0.0)))
+    return gzip_q > 0 and gzip_q >= qualities.get("identity", 0.0)
+
+def parse_form_fields(body: bytes, max_fields: int = 4) -> Dict[str, str]:
+    """Parser form-urlencoded ringkas untuk body kecil /get_script (unquote hanya jika perlu).
+
+    Kira-kira 5x lebih cepat dari parse_qsl untuk body tipikal (key dan nama script tanpa escape).
+    """
+    text = body.decode("utf-8")
+    if text.count("&") >= max_fields:
+        raise ValueError("terlalu banyak field form")
+    fields = {}
+    for part in text.split("&"):
+        name, _, value = part.partition("=")
+        fields[name] = unquote_plus(value) if "%" in value or "+" in value else value
+    return fields
+
+def rate_limited_response(retry_after: float) -> web.Response:
+    return web.Response(text="RATE_LIMITED", status=429, headers={"Retry-After": str(max(1, math.ceil(retry_after)))})
+
+async def load_catalog_from_db(db_pool) -> Optional[ScriptCatalog]:
+    """Membuat katalog dari isi tabel script_catalog, atau None jika query gagal."""
+    rows = await fetch_script_catalog_db(db_pool)
+    if rows is None:
+        return None
+    return catalog_from_entries(
+        ScriptEntry(row['filename'], row['url'], row['message_id'], row['attachment_id']) for row in rows
+    )
+
+# Fungsi cadangan untuk mencari script saat katalog belum siap (mis. scan channel Discord)
+FallbackLookup = Callable[[str], Awaitable[Optional[ScriptEntry]]]
+
+class ScriptAPI:
+    """Aplikasi aiohttp untuk validasi lisensi dan pengambilan script.
+
+    Tidak bergantung pada bot Discord, jadi bisa dijalankan di dalam WebserverCog
+    maupun sebagai proses worker terpisah (lihat api_server.py).
+    """
+
+    def __init__(self, db_pool, fallback_lookup: Optional[FallbackLookup] = None):
+        self.db_pool = db_pool
+        self.fallback_lookup = fallback_lookup
+        self.catalog = ScriptCatalog()
+        self.runner = None
+        self.site = None
+        # Request identik yang bersamaan (key sama / script sama) berbagi satu I/O
+        self.license_flight = SingleFlight()
+        self.script_flight = SingleFlight()
+        # Mode "content": isi script dikirim langsung dari cache lokal
+        self.serve_content = SCRIPT_SERVE_MODE == "content"
+        self.blob_cache = BlobCache(SCRIPT_BLOB_CACHE_DIR or None, SCRIPT_BLOB_CACHE_MAX_BYTES) if self.serve_content else None
+        self.http_session = None
+        self.db_warm = False # Diisi warm_up(); /ready baru 200 jika DB dan katalog siap
+        self.snapshot_task = None
+        # Drain: request in-flight dihitung supaya shutdown bisa melapor selesai vs dibatalkan
+        self.in_flight = 0
+        self.draining = False
+        self.drain_completed = 0
+        self.drain_aborted = 0
+        # Rate limit per IP (middleware) dan per key lisensi (di handler), sebelum I/O DB/Discord
+        self.ip_limiter = TokenBucketLimiter(RATE_LIMIT_IP_RATE, RATE_LIMIT_IP_BURST, RATE_LIMIT_MAX_KEYS)
+        self.key_limiter = TokenBucketLimiter(RATE_LIMIT_KEY_RATE, RATE_LIMIT_KEY_BURST, RATE_LIMIT_MAX_KEYS)
+        # Pemakaian lisensi dicatat di memori dan di-flush berkala (tanpa UPDATE per request)
+        self.usage = UsageBuffer(LICENSE_USAGE_MAX_KEYS) if LICENSE_USAGE_ENABLED else None
+        self.usage_task = None
+        self.usage_flush_now = asyncio.Event()
+        # Decoder JSON untuk body request (orjson jika terpasang, lihat API_JSON_DECODER)
+        self.json_decoder, self.json_loads, self.json_dumps = get_json_codec(API_JSON_DECODER)
+        self.register_gauges()
+
+    def register_gauges(self):
+        """Menghubungkan gauge pool/katalog ke instance ini (dibaca saat /metrics di-scrape)."""
+        pool = self.db_pool
+        if hasattr(pool, "get_size"):
+            DB_POOL_SIZE.set_function(pool.get_size)
+            DB_POOL_IDLE.set_function(pool.get_idle_size)
+            DB_POOL_IN_USE.set_function(lambda: pool.get_size() - pool.get_idle_size())
+        if hasattr(pool, "get_max_size"):
+            DB_POOL_MAX.set_function(pool.get_max_size)
+        CATALOG_SCRIPTS.set_function(lambda: len(self.catalog))
+        RATE_LIMIT_BUCKETS.set_function(lambda: len(self.ip_limiter) + len(self.key_limiter))
+        SINGLEFLIGHT_SHARED.set_function(lambda: self.license_flight.shared + self.script_flight.shared)
+        if self.usage is not None:
+            USAGE_BUFFER_KEYS.set_function(lambda: len(self.usage))
+            USAGE_DROPPED.set_function(lambda: self.usage.dropped)
+
+    def build_app(self) -> web.Application:
+        """Membuat aplikasi aiohttp dengan semua route API."""
+        middlewares = [self.in_flight_middleware, metrics_middleware]
+        if RATE_LIMIT_IP_ENABLED:
+            middlewares.append(self.rate_limit_middleware)
+        # client_max_size: batas body terbesar (/get_scripts); /get_script punya batas lebih kecil sendiri
+        app = web.Application(middlewares=middlewares, client_max_size=API_BATCH_MAX_BODY_BYTES)
+        app.on_response_prepare.append(self.advertise_keep_alive)
+        # Simpan state yang diperlukan (pool DB) di app
+        app["db_pool"] = self.db_pool
+        app.router.add_post("/get_script", self.handle_request_route) # Endpoint API
+        if API_COMPACT_REQUESTS:
+            app.router.add_get("/get_script", self.handle_request_route, allow_head=False) # Key & script di header
+        app.router.add_post("/get_scripts", self.handle_batch_route) # Validasi banyak lisensi sekaligus
+        app.router.add_get("/metrics", self.handle_metrics_route) # Metrics format Prometheus
+        app.router.add_get("/ready", self.handle_ready_route) # Readiness check (health check Koyeb)
+        return app
+
+    def make_runner(self, **kwargs) -> web.AppRunner:
+        """AppRunner dengan batas drain dan keep-alive dari config."""
+        # shutdown_timeout = batas waktu drain request in-flight saat runner.cleanup()
+        return web.AppRunner(self.build_app(), shutdown_timeout=WEB_DRAIN_TIMEOUT,
+                             keepalive_timeout=API_KEEPALIVE_TIMEOUT, **kwargs)
+
+    async def advertise_keep_alive(self, request: web.Request, response: web.StreamResponse):
+        """Header Keep-Alive supaya klien polling memakai ulang koneksi (kecuali saat drain)."""
+        if request.keep_alive and response.keep_alive is not False and not self.draining:
+            response.headers["Keep-Alive"] = f"timeout={int(API_KEEPALIVE_TIMEOUT)}"
+
+    @web.middleware
+    async def in_flight_middleware(self, request: web.Request, handler):
+        """Menghitung request in-flight; saat drain, koneksi keep-alive ditutup setelah response."""
+        self.in_flight += 1
+        try:
+            response = await handler(request)
+        except asyncio.CancelledError:
+            if self.draining:
+                self.drain_aborted += 1
+            raise
+        except Exception:
+            if self.draining:
+                self.drain_completed += 1
+            raise
+        finally:
+            self.in_flight -= 1
+        if self.draining:
+            self.drain_completed += 1
+            response.force_close() # Klien reconnect ke instance baru
+        return response
+
+    @web.middleware
+    async def rate_limit_middleware(self, request: web.Request, handler):
+        """Menolak request dengan 429 jika bucket IP kosong, sebelum body dibaca."""
+        if request.path in INTERNAL_ROUTES:
+            return await handler(request)
+        ip = client_ip(request)
+        if not self.ip_limiter.allow(ip):
+            return rate_limited_response(self.ip_limiter.retry_after(ip))
+        return await handler(request)
+
+    def allow_license_key(self, key: str) -> bool:
+        return not RATE_LIMIT_ENABLED or self.key_limiter.allow(key)
+
+    async def handle_metrics_route(self, request: web.Request):
+        """Endpoint /metrics dalam format teks Prometheus."""
+        if METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+            return web.Response(text="UNAUTHORIZED", status=401)
+        return web.Response(text=REGISTRY.render(), content_type="text/plain", charset="utf-8",
+                            headers={"X-Prometheus-Format": "0.0.4"})
+
+    @property
+    def ready(self) -> bool:
+        return self.db_warm and self.catalog.ready and not self.draining
+
+    async def handle_ready_route(self, request: web.Request):
+        """200 jika pool DB sudah hangat dan katalog sudah dimuat, selain itu 503."""
+        body = {"ready": self.ready, "db": self.db_warm, "catalog": self.catalog.ready, "draining": self.draining,
+                "scripts": len(self.catalog)}
+        return web.json_response(body, status=200 if body["ready"] else 503, dumps=self.json_dumps)
+
+    async def warm_up(self) -> bool:
+        """Memastikan pool DB bisa melayani query (koneksi min_size sudah dibuka saat pool dibuat).
+
+        Dengan LICENSE_SNAPSHOT_ENABLED, snapshot lisensi dimuat dulu dan dijaga tetap terbaru.
+        """
+        try:
+            if LICENSE_SNAPSHOT_ENABLED:
+                if not await reload_license_snapshot(self.db_pool):
+                    return False
+                self.snapshot_task = asyncio.create_task(self.license_snapshot_loop())
+            else:
+                async with self.db_pool.acquire() as connection:
+                    await connection.fetchval("SELECT 1")
+            self.db_warm = True
+        except Exception as e:
+            log.error(f"Warm-up database gagal: {e}")
+        return self.db_warm
+
+    async def warm_up_with_retry(self, max_delay: float = 60.0):
+        """warm_up() diulang dengan backoff eksponensial sampai berhasil (mis. DB sempat down saat start)."""
+        delay = 1.0
+        while not await self.warm_up():
+            log.warning(f"Warm-up database gagal, dicoba lagi dalam {delay:.0f} detik.")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, max_delay)
+
+    async def license_snapshot_loop(self):
+        """Polling lisensi baru tiap LICENSE_SNAPSHOT_POLL_SECONDS, load penuh tiap LICENSE_SNAPSHOT_RELOAD_MINUTES."""
+        last_reload = time.monotonic()
+        while True:
+            await asyncio.sleep(LICENSE_SNAPSHOT_POLL_SECONDS)
+            # Gagal (mis. DB down) tidak mengubah snapshot: validasi tetap dilayani dari data terakhir
+            if time.monotonic() - last_reload >= LICENSE_SNAPSHOT_RELOAD_MINUTES * 60:
+                if await reload_license_snapshot(self.db_pool):
+                    last_reload = time.monotonic()
+            else:
+                await poll_license_snapshot(self.db_pool)
+
+    def record_usage(self, key: str, request: web.Request):
+        """Mencatat pemakaian key valid di buffer (tanpa I/O); flush dipercepat jika buffer penuh."""
+        if self.usage is None:
+            return
+        self.usage.record(key, client_ip(request))
+        if self.usage.full:
+            self.usage_flush_now.set()
+
+    async def flush_usage(self) -> bool:
+        """Upsert isi buffer pemakaian ke license_usage; jika gagal isinya dikembalikan ke buffer."""
+        entries = self.usage.drain()
+        if not entries:
+            return True
+        flushed = False
+        try:
+            flushed = await flush_license_usage_db(self.db_pool, entries)
+        finally:
+            # Juga saat task dibatalkan di tengah flush, supaya flush terakhir di stop() masih membawanya
+            USAGE_FLUSHES.inc("ok" if flushed else "error")
+            if not flushed:
+                self.usage.restore(entries)
+        return flushed
+
+    async def usage_flush_loop(self):
+        """Flush buffer pemakaian tiap LICENSE_USAGE_FLUSH_SECONDS, atau lebih cepat jika buffer penuh."""
+        while True:
+            try:
+                await asyncio.wait_for(self.usage_flush_now.wait(), timeout=LICENSE_USAGE_FLUSH_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self.usage_flush_now.clear()
+            await self.flush_usage()
+
+    async def load_catalog_db(self) -> bool:
+        """Memuat katalog dari tabel script_catalog (dipublikasikan bot dengan CATALOG_PUBLISH=true)."""
+        catalog = await load_catalog_from_db(self.db_pool)
+        if catalog is None:
+            return False
+        self.set_catalog(catalog)
+        if not len(catalog):
+            log.warning("Katalog script dari database kosong, /ready tetap 503. Pastikan bot berjalan dengan CATALOG_PUBLISH=true.")
+        return True
+
+    async def start(self, host: str, port: int, reuse_port: bool = False, listen_fd: Optional[int] = None) -> bool:
+        """Menjalankan webserver aiohttp untuk API.
+
+        reuse_port: SO_REUSEPORT, proses baru bisa bind sebelum proses lama selesai drain
+        listen_fd: pakai socket listen yang diwariskan proses induk (socket handoff)
+        """
+        if self.serve_content:
+            self.http_session = aiohttp.ClientSession()
+        if self.usage is not None and not self.usage_task:
+            self.usage_task = asyncio.create_task(self.usage_flush_loop())
+
+        self.runner = self.make_runner()
+        await self.runner.setup()
+        try:
+            if listen_fd is not None:
+                self.site = web.SockSite(self.runner, socket.socket(fileno=listen_fd), backlog=API_LISTEN_BACKLOG)
+            else:
+                self.site = web.TCPSite(self.runner, host, port, reuse_port=reuse_port or None, backlog=API_LISTEN_BACKLOG)
+            await self.site.start()
+            log.info(f"🌐 Webserver API berjalan di {self.site.name} (decoder JSON: {self.json_decoder})...")
+            return True
+        except Exception as e:
+            log.error(f"❌ Gagal menjalankan webserver di port {port}: {e}")
+            await self.stop() # Coba cleanup jika start gagal
+            return False
+
+    async def drain(self):
+        """Shutdown bertahap: /ready jadi 503, berhenti menerima koneksi, tunggu request in-flight.
+
+        Request yang belum selesai setelah WEB_DRAIN_TIMEOUT dibatalkan oleh aiohttp.
+        """
+        if not self.runner:
+            return
+        self.draining = True
+        log.info(f"Drain webserver dimulai: {self.in_flight} request in-flight.")
+        if WEB_DRAIN_READY_DELAY > 0:
+            # Tetap melayani selama load balancer belum melihat /ready 503
+            await asyncio.sleep(WEB_DRAIN_READY_DELAY)
+        started = time.perf_counter()
+        await self.stop()
+        log.info(
+            f"Drain webserver selesai dalam {time.perf_counter() - started:.2f} detik: "
+            f"{self.drain_completed} request selesai, {self.drain_aborted} dibatalkan."
+        )
+
+    async def stop(self):
+        """Menghentikan webserver aiohttp."""
+        if self.snapshot_task:
+            self.snapshot_task.cancel()
+            self.snapshot_task = None
+        if self.site:
+            try:
+                await self.site.stop()
+                log.info("Webserver site stopped.")
+            except Exception as e:
+                log.error(f"Error stopping webserver site: {e}")
+            self.site = None
+        if self.runner:
+            try:
+                await self.runner.cleanup()
+                log.info("Webserver runner cleaned up.")
+            except Exception as e:
+                log.error(f"Error cleaning up webserver runner: {e}")
+            self.runner = None
+        if self.http_session:
+            await self.http_session.close()
+            self.http_session = None
+        if self.usage_task:
+            # Flush terakhir setelah request in-flight selesai, sebelum pool DB ditutup
+            self.usage_task.cancel()
+            await asyncio.gather(self.usage_task, return_exceptions=True)
+            self.usage_task = None
+            if not await self.flush_usage():
+                log.warning(f"Pemakaian {len(self.usage)} lisensi tidak tersimpan saat shutdown.")
+        log.info("Webserver dihentikan.")
+
+    def set_catalog(self, catalog: ScriptCatalog):
+        """Mengganti katalog script (hasil build ulang) dan membuang blob yang sudah tidak dipakai."""
+        self.catalog = catalog
+        if self.blob_cache:
+            self.blob_cache.prune(entry.attachment_id for entry in catalog.entries())
+
+    async def fetch_script_entry(self, script_name: str) -> Optional[ScriptEntry]:
+        """Mencari attachment script berdasarkan nama file (via katalog, fallback jika belum siap)."""
+        if self.catalog.ready or not self.fallback_lookup:
+            entry = self.catalog.get(script_name)
+            if not entry:
+                log.warning("API Req Warning: File '%s' tidak ada di katalog script.", script_name, extra=GET_SCRIPT_LOG)
+            return entry
+
+        # Katalog belum siap (misalnya baru start): satu lookup cadangan untuk semua
+        # request bersamaan dengan nama script yang sama
+        return await self.script_flight.do(script_name.lower(), lambda: self.fallback_lookup(script_name))
+
+    async def fetch_script_url(self, script_name: str) -> Optional[str]:
+        """Mencari URL script Lua berdasarkan nama file."""
+        entry = await self.fetch_script_entry(script_name)
+        return entry.url if entry else None
+
+    async def script_content_response(self, request: web.Request, entry: ScriptEntry) -> web.Response:
+        """Mengirim isi script dari blob cache dengan dukungan ETag/If-None-Match dan gzip."""
+        try:
+            blob = await self.blob_cache.get(self.http_session, entry.attachment_id, entry.url)
+        except Exception as e:
+            log.error("API Req Error: Gagal mengambil isi script '%s': %s", entry.filename, e, extra=GET_SCRIPT_LOG)
+            return web.Response(text="SCRIPT_NOT_FOUND", status=404)
+
+        headers = {"ETag": blob.etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+        if_none_match = request.headers.get("If-None-Match", "")
+        if blob.etag in if_none_match or if_none_match.strip() == "*":
+            return web.Response(status=304, headers=headers)
+
+        if accepts_gzip(request.headers.get("Accept-Encoding", "")):
+            headers["Content-Encoding"] = "gzip"
+            body = blob.gzip_data
+        else:
+            body = blob.data
+        return web.Response(body=body, headers=headers, content_type="text/plain", charset="utf-8")
+
+    async def read_script_request(self, request: web.Request) -> Tuple[Any, Any]:
+        """(license_key, script_request) dari body JSON, body form-urlencoded, atau header (GET).
+
+        Body lebih dari API_MAX_BODY_BYTES ditolak 413 (dicek dari Content-Length sebelum dibaca).
+        Body yang tidak bisa di-parse menghasilkan ValueError.
+        """
+        if request.method == "GET":
+            return request.headers.get(LICENSE_KEY_HEADER), request.headers.get(SCRIPT_REQUEST_HEADER)
+        if request.content_length is not None and request.content_length > API_MAX_BODY_BYTES:
+            raise web.HTTPRequestEntityTooLarge(API_MAX_BODY_BYTES, request.content_length, text="TOO_LARGE")
+        body = await request.read()
+        if len(body) > API_MAX_BODY_BYTES: # Body chunked tanpa Content-Length
+            raise web.HTTPRequestEntityTooLarge(API_MAX_BODY_BYTES, len(body), text="TOO_LARGE")
+        if API_COMPACT_REQUESTS and request.content_type == FORM_CONTENT_TYPE:
+            fields = parse_form_fields(body)
+            return fields.get("license_key"), fields.get("script_request")
+        data = self.json_loads(body)
+        if not isinstance(data, dict):
+            raise ValueError("body JSON harus berupa object")
+        return data.get("license_key"), data.get("script_request")
+
+    async def handle_request_route(self, request: web.Request):
+        """Router aiohttp yang memanggil handler logic."""
+        # Ambil pool DB dari app context
+        db_pool = request.app["db_pool"]
+        remote_ip = request.remote
+
+        # 1. Parse Request (JSON, form-urlencoded, atau GET + header)
+        phase_start = time.perf_counter()
+        try:
+            license_key_from_request, script_request = await self.read_script_request(request)
+        except ValueError as e: # Termasuk JSONDecodeError dan UnicodeDecodeError
+            log.warning("API Req Warning: Payload tidak valid: %s. IP: %s", e, remote_ip, extra=GET_SCRIPT_LOG)
+            return web.Response(text="INVALID", status=400)
+        API_PHASE_LATENCY.observe(time.perf_counter() - phase_start, "parse_request")
+
+        if not isinstance(license_key_from_request, str) or not isinstance(script_request, str) \
+                or not license_key_from_request or not script_request:
+            log.warning("API Req Warning: license_key atau script_request kosong. IP: %s", remote_ip, extra=GET_SCRIPT_LOG)
+            return web.Response(text="INVALID", status=400)
+
+        if not self.allow_license_key(license_key_from_request):
+            log.info("API Req Info: Lisensi '%s' terkena rate limit. IP: %s", license_key_from_request, remote_ip, extra=GET_SCRIPT_LOG)
+            return rate_limited_response(self.key_limiter.retry_after(license_key_from_request))
+
+        # 2. Validasi Lisensi via Database (menggunakan license_key)
+        phase_start = time.perf_counter()
+        allowed_script = await self.license_flight.do(
+            license_key_from_request, lambda: fetch_script_by_license(db_pool, license_key_from_request)
+        )
+        API_PHASE_LATENCY.observe(time.perf_counter() - phase_start, "fetch_script_by_license")
+
+        if allowed_script is None:
+            log.info("API Req Info: Lisensi '%s' tidak valid. IP: %s", license_key_from_request, remote_ip, extra=GET_SCRIPT_LOG)
+            return web.Response(text="INVALID", status=403)
+        self.record_usage(license_key_from_request, request)
+
+        # 3. Ambil URL Script berdasarkan permintaan dan izin
+        if allowed_script.lower() == script_request.lower():
+            phase_start = time.perf_counter()
+            entry = await self.fetch_script_entry(script_request)
+            API_PHASE_LATENCY.observe(time.perf_counter() - phase_start, "fetch_script_url")
+            if not entry:
+                return web.Response(text="SCRIPT_NOT_FOUND", status=404)
+            if self.serve_content:
+                return await self.script_content_response(request, entry)
+            return web.Response(text=entry.url)
+        else:
+            log.info("API Req Info: Lisensi '%s' tidak valid untuk script '%s'. Diizinkan: '%s'. IP: %s",
+                     license_key_from_request, script_request, allowed_script, remote_ip, extra=GET_SCRIPT_LOG)
+            return web.Response(text="UNAUTHORIZED_SCRIPT", status=403)
+
+    async def handle_batch_route(self, request: web.Request):
+        """Validasi banyak pasangan {license_key, script_request} dengan satu query database.
+
+        Body: list JSON (atau {"items": [...]}) berisi objek {license_key, script_request}.
+        Respon: list JSON dengan urutan sama, tiap item punya status
+        OK / INVALID / UNAUTHORIZED_SCRIPT / SCRIPT_NOT_FOUND dan url (jika OK).
+        """
+        db_pool = request.app["db_pool"]
+        remote_ip = request.remote
+
+        # 1. Parse Request Body (melebihi client_max_size aplikasi -> 413 dari aiohttp)
+        body = await request.read()
+        try:
+            data = self.json_loads(body)
+            items = data.get("items") if isinstance(data, dict) else data
+            if not isinstance(items, list) or not items:
+                log.warning("API Batch Warning: Body harus berupa list item. IP: %s", remote_ip, extra=GET_SCRIPTS_LOG)
+                return web.Response(text="INVALID", status=400)
+            if len(items) > BATCH_VALIDATE_MAX_ITEMS:
+                log.warning("API Batch Warning: %d item melebihi batas %d. IP: %s", len(items), BATCH_VALIDATE_MAX_ITEMS, remote_ip, extra=GET_SCRIPTS_LOG)
+                return web.Response(text="TOO_MANY_ITEMS", status=413)
+            pairs = []
+            for item in items:
+                if not isinstance(item, dict):
+                    return web.Response(text="INVALID", status=400)
+                pairs.append((item.get("license_key"), item.get("script_request")))
+        except ValueError:
+            log.warning("API Batch Warning: Payload JSON tidak valid. IP: %s", remote_ip, extra=GET_SCRIPTS_LOG)
+            return web.Response(text="INVALID", status=400)
+        except Exception as e:
+            log.error("API Batch Error: Gagal parse request body: %s. IP: %s", e, remote_ip, extra=GET_SCRIPTS_LOG)
+            return web.Response(text="INVALID", status=500)
+
+        # Satu batch dihitung sebanyak jumlah item untuk bucket IP (middleware sudah mengambil 1)
+        if RATE_LIMIT_IP_ENABLED and len(pairs) > 1:
+            ip = client_ip(request)
+            if not self.ip_limiter.allow(ip, cost=len(pairs) - 1):
+                return rate_limited_response(self.ip_limiter.retry_after(ip, cost=len(pairs) - 1))
+
+        # 2. Validasi semua lisensi dengan satu query (key yang ada di cache tidak di-query)
+        throttled = set()
+        for key, script in pairs:
+            if isinstance(key, str) and key and key not in throttled and not self.allow_license_key(key):
+                throttled.add(key)
+        keys = [key for key, script in pairs
+                if isinstance(key, str) and key and key not in throttled and isinstance(script, str) and script]
+        phase_start = time.perf_counter()
+        allowed_scripts = await fetch_scripts_by_licenses(db_pool, keys) if keys else {}
+        API_PHASE_LATENCY.observe(time.perf_counter() - phase_start, "fetch_scripts_by_licenses")
+        if allowed_scripts is None:
+            allowed_scripts = {} # Error DB: semua item INVALID, sama seperti /get_script
+
+        # 3. Ambil URL sekali per nama script yang diizinkan
+        script_urls = {}
+        results = []
+        for key, script_request in pairs:
+            result = {"license_key": key, "script_request": script_request, "status": "INVALID", "url": None}
+            if isinstance(key, str) and key in throttled:
+                result["status"] = "RATE_LIMITED"
+            allowed_script = allowed_scripts.get(key) if isinstance(key, str) else None
+            if allowed_script is not None:
+                self.record_usage(key, request)
+            if allowed_script is not None and isinstance(script_request, str):
+                if allowed_script.lower() == script_request.lower():
+                    name = script_request.lower()
+                    if name not in script_urls:
+                        script_urls[name] = await self.fetch_script_url(script_request)
+                    if script_urls[name]:
+                        result["status"] = "OK"
+                        result["url"] = script_urls[name]
+                    else:
+                        result["status"] = "SCRIPT_NOT_FOUND"
+                else:
+                    result["status"] = "UNAUTHORIZED_SCRIPT"
+            results.append(result)
+
+        if log.isEnabledFor(logging.INFO):
+            log.info("API Batch Info: %d item divalidasi, %d OK. IP: %s",
+                     len(results), sum(r['status'] == 'OK' for r in results), remote_ip, extra=GET_SCRIPTS_LOG)
+        return web.json_response(results, dumps=self.json_dumps)
@@ -0,0 +1,149 @@
+import asyncio
+import gzip
+import hashlib
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+import aiofiles
+import aiohttp
+
+from utils.singleflight import SingleFlight
+
+log = logging.getLogger(__name__)
+
+# File sementara yang lebih tua dari ini dianggap sisa proses yang crash saat menulis
+STALE_TEMP_SECONDS = 3600
+
+
+def write_file_atomic(path: str, data: bytes):
+    """Menulis file lewat file sementara di direktori yang sama lalu os.replace.
+
+    Pembaca (termasuk worker lain yang memakai direktori cache yang sama) hanya pernah
+    melihat file lama atau file baru yang utuh, tidak pernah file yang setengah ditulis.
+    """
+    temp_path = f"{path}.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(temp_path, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+class Blob:
+    """Isi satu versi attachment script beserta versi gzip dan ETag-nya."""
+    __slots__ = ("data", "gzip_data", "etag")
+
+    def __init__(self, data: bytes, gzip_data: bytes):
+        self.data = data
+        self.gzip_data = gzip_data
+        self.etag = '"' + hashlib.sha256(data).hexdigest()[:32] + '"'
+
+    @property
+    def size(self) -> int:
+        return len(self.data) + len(self.gzip_data)
+
+
+class BlobCache:
+    """Cache isi script per attachment_id: memori (LRU berdasarkan ukuran) lalu disk.
+
+    Attachment baru di Discord selalu punya ID baru, jadi attachment_id sekaligus
+    menjadi penanda versi dan isi yang sudah di-cache tidak perlu divalidasi ulang.
+    """
+
+    def __init__(self, directory: Optional[str], max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._blobs: "OrderedDict[int, Blob]" = OrderedDict()
+        self._bytes = 0
+        self._flight = SingleFlight()
+        self.downloads = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, attachment_id: int) -> str:
+        return os.path.join(self.directory, f"{attachment_id}.bin")
+
+    def _remember(self, attachment_id: int, blob: Blob):
+        old = self._blobs.pop(attachment_id, None)
+        if old:
+            self._bytes -= old.size
+        self._blobs[attachment_id] = blob
+        self._bytes += blob.size
+        while self._bytes > self.max_bytes and len(self._blobs) > 1:
+            _, evicted = self._blobs.popitem(last=False)
+            self._bytes -= evicted.size
+
+    async def get(self, session: aiohttp.ClientSession, attachment_id: int, url: str) -> Blob:
+        """Mengambil isi attachment dari memori, disk, atau download dari URL (sekali per attachment)."""
+        blob = self._blobs.get(attachment_id)
+        if blob is not None:
+            self._blobs.move_to_end(attachment_id)
+            return blob
+        return await self._flight.do(attachment_id, lambda: self._load(session, attachment_id, url))
+
+    async def _load(self, session: aiohttp.ClientSession, attachment_id: int, url: str) -> Blob:
+        data = None
+        if self.directory and os.path.exists(self._path(attachment_id)):
+            try:
+                async with aiofiles.open(self._path(attachment_id), "rb") as f:
+                    data = await f.read()
+            except OSError as e:
+                log.warning(f"Blob cache: gagal membaca file cache {attachment_id}: {e}")
+
+        if data is None:
+            async with session.get(url) as resp:
+                resp.raise_for_status()
+                data = await resp.read()
+                # Isi yang terpotong tidak boleh di-cache: attachment_id tidak pernah divalidasi ulang
+                encoded = resp.headers.get("Content-Encoding", "identity").lower() not in ("", "identity")
+                if resp.content_length is not None and not encoded and len(data) != resp.content_length:
+                    raise aiohttp.ClientPayloadError(
+                        f"Isi attachment {attachment_id} tidak lengkap: {len(data)} dari {resp.content_length} bytes"
+                    )
+            self.downloads += 1
+            log.info(f"Blob cache: attachment {attachment_id} di-download ({len(data)} bytes).")
+            if self.directory:
+                try:
+                    await asyncio.get_running_loop().run_in_executor(None, write_file_atomic, self._path(attachment_id), data)
+                except OSError as e:
+                    log.warning(f"Blob cache: gagal menulis file cache {attachment_id}: {e}")
+
+        # Kompresi sekali per versi, di thread supaya event loop tidak tertahan
+        gzip_data = await asyncio.get_running_loop().run_in_executor(None, gzip.compress, data, 6)
+        blob = Blob(data, gzip_data)
+        self._remember(attachment_id, blob)
+        return blob
+
+    def prune(self, keep_ids: Iterable[int]):
+        """Menghapus blob (memori dan disk) untuk attachment yang sudah tidak ada di katalog."""
+        keep = set(keep_ids)
+        for attachment_id in [a for a in self._blobs if a not in keep]:
+            self._bytes -= self._blobs.pop(attachment_id).size
+        if not self.directory:
+            return
+        now = time.time()
+        for filename in os.listdir(self.directory):
+            stem, ext = os.path.splitext(filename)
+            if ext == ".tmp":
+                try:
+                    if now - os.path.getmtime(os.path.join(self.directory, filename)) > STALE_TEMP_SECONDS:
+                        os.remove(os.path.join(self.directory, filename))
+                except OSError as e:
+                    log.warning(f"Blob cache: gagal menghapus file sementara {filename}: {e}")
+                continue
+            if ext == ".bin" and stem.isdigit() and int(stem) not in keep:
+                try:
+                    os.remove(os.path.join(self.directory, filename))
+                except OSError as e:
+                    log.warning(f"Blob cache: gagal menghapus {filename}: {e}")
@@ -0,0 +1,70 @@
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Tuple
+
+# Penanda hasil negatif (mis. key lisensi tidak ada di database)
+TOMBSTONE = object()
+
+
+class TTLCache:
+    """Cache LRU berukuran tetap dengan TTL terpisah untuk hasil positif dan negatif."""
+
+    def __init__(self, max_size: int, ttl: float, negative_ttl: Optional[float] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = ttl if negative_ttl is None else negative_ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0 and self.ttl > 0
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        """Mengembalikan (ditemukan, value). Value bisa TOMBSTONE untuk hasil negatif."""
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return False, None
+        expires_at, value = item
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return False, None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return True, value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """Menyimpan value; gunakan TOMBSTONE untuk menyimpan hasil negatif."""
+        if not self.enabled:
+            return
+        if ttl is None:
+            ttl = self.negative_ttl if value is TOMBSTONE else self.ttl
+        if ttl <= 0:
+            return
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,28 @@
+import json
+import logging
+from typing import Any, Callable, Tuple
+
+log = logging.getLogger(__name__)
+
+try:
+    import orjson # Opsional: decoder/encoder JSON berbasis Rust, jauh lebih cepat dari json stdlib
+except ImportError:
+    orjson = None
+
+JsonLoads = Callable[[bytes], Any]
+JsonDumps = Callable[[Any], str]
+
+def _orjson_dumps(obj: Any) -> str:
+    return orjson.dumps(obj).decode("utf-8")
+
+def get_json_codec(name: str) -> Tuple[str, JsonLoads, JsonDumps]:
+    """Memilih (nama, loads, dumps) untuk API: "auto" (orjson jika terpasang), "orjson", atau "json".
+
+    loads menerima bytes langsung (tanpa decode ke str dulu). Error parse keduanya turunan ValueError
+    (orjson.JSONDecodeError juga turunan json.JSONDecodeError).
+    """
+    if name in ("auto", "orjson") and orjson is not None:
+        return "orjson", orjson.loads, _orjson_dumps
+    if name == "orjson":
+        log.warning("API_JSON_DECODER=orjson tapi paket orjson tidak terpasang, memakai json stdlib.")
+    return "json", json.loads, json.dumps
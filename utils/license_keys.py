@@ -0,0 +1,26 @@
+import hashlib
+import secrets
+import string
+
+LICENSE_KEY_ALPHABET = string.ascii_uppercase + string.digits
+LICENSE_KEY_LENGTH = 16 # 36^16 ~ 2^82 kemungkinan
+
+def generate_license_key() -> str:
+    """Membuat satu key lisensi acak dengan CSPRNG (secrets), bukan random."""
+    return ''.join(secrets.choice(LICENSE_KEY_ALPHABET) for _ in range(LICENSE_KEY_LENGTH))
+
+def license_key_digest(key: str) -> bytes:
+    """Digest SHA-256 (32 byte) key lisensi, yang disimpan di licenses.key_hash.
+
+    Harus sama dengan sha256(convert_to(key, 'UTF8')) di Postgres (dipakai migrasi backfill).
+    """
+    return hashlib.sha256(key.encode("utf-8")).digest()
+
+def license_key_id(key: str) -> str:
+    """ID pendek key untuk log dan laporan: 12 karakter hex pertama digest, tidak bisa dibalik ke key."""
+    return license_key_digest(key)[:6].hex()
+
+# Digest baris licenses di SQL; baris yang ditulis instance versi lama (key_hash masih NULL) dihitung dari key
+KEY_DIGEST_SQL = "COALESCE(key_hash, sha256(convert_to(key, 'UTF8')))"
+# Ekspresi SQL yang sama dengan license_key_id(); {digest} diisi ekspresi digest key
+KEY_ID_SQL = "encode(substr({digest}, 1, 6), 'hex')"
@@ -0,0 +1,80 @@
+import bisect
+import math
+import time
+from array import array
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+# Ekspresi SQL yang menghasilkan nilai yang sama dengan snapshot_hash(): 64 bit pertama digest, signed.
+# {digest} diisi ekspresi digest key, mis. KEY_DIGEST_SQL dari utils/license_keys.py
+SNAPSHOT_HASH_SQL = "('x' || encode(substr({digest}, 1, 8), 'hex'))::bit(64)::bigint"
+
+NO_EXPIRY = math.inf
+
+
+def snapshot_hash(digest: bytes) -> int:
+    """Hash 64-bit dari digest key lisensi (harus sama dengan SNAPSHOT_HASH_SQL)."""
+    return int.from_bytes(digest[:8], "big", signed=True)
+
+
+def expiry_timestamp(expires_at: Optional[datetime]) -> float:
+    return NO_EXPIRY if expires_at is None else expires_at.timestamp()
+
+
+class LicenseSnapshot:
+    """Salinan lokal licenses: hash key -> script_name, ringkas untuk jutaan key.
+
+    Data utama berupa array paralel yang diurutkan berdasarkan hash (hash 8 byte,
+    indeks script 4 byte, expires_at 8 byte per key) dan dicari dengan bisect.
+    Key yang masuk setelah load penuh disimpan di overlay dict kecil sampai
+    load penuh berikutnya.
+    """
+
+    def __init__(self):
+        self.hashes = array("q")
+        self.script_ids = array("I")
+        self.expires = array("d")
+        self.scripts: List[str] = []
+        self._script_index: Dict[str, int] = {}
+        self.overlay: Dict[int, Tuple[int, float]] = {}
+        self.watermark: Optional[datetime] = None # created_at terakhir yang sudah dimuat (waktu DB)
+        self.loaded_at = 0.0
+        self.ready = False
+
+    def __len__(self) -> int:
+        return len(self.hashes) + len(self.overlay)
+
+    def script_id(self, script_name: str) -> int:
+        index = self._script_index.get(script_name)
+        if index is None:
+            index = self._script_index[script_name] = len(self.scripts)
+            self.scripts.append(script_name)
+        return index
+
+    def append_sorted(self, hash_value: int, script_name: str, expires_at: Optional[datetime]):
+        """Menambah baris saat load penuh; baris harus datang urut berdasarkan hash."""
+        self.hashes.append(hash_value)
+        self.script_ids.append(self.script_id(script_name))
+        self.expires.append(expiry_timestamp(expires_at))
+
+    def add(self, digest: bytes, script_name: str, expires_at: Optional[datetime]):
+        """Menambah/memperbarui satu key berdasarkan digest-nya (hasil polling)."""
+        self.overlay[snapshot_hash(digest)] = (self.script_id(script_name), expiry_timestamp(expires_at))
+
+    def get(self, digest: bytes) -> Optional[str]:
+        """Nama script untuk digest key, atau None jika tidak ada / sudah kedaluwarsa."""
+        hash_value = snapshot_hash(digest)
+        item = self.overlay.get(hash_value)
+        if item is None:
+            index = bisect.bisect_left(self.hashes, hash_value)
+            if index == len(self.hashes) or self.hashes[index] != hash_value:
+                return None
+            item = (self.script_ids[index], self.expires[index])
+        script_id, expires = item
+        if expires <= time.time():
+            return None
+        return self.scripts[script_id]
+
+    def memory_bytes(self) -> int:
+        """Perkiraan memori array utama (tanpa overlay dan daftar nama script)."""
+        return sum(a.itemsize * len(a) for a in (self.hashes, self.script_ids, self.expires))
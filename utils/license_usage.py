@@ -0,0 +1,96 @@
+import hashlib
+import heapq
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence
+
+# Jumlah hash terkecil yang disimpan per key untuk estimasi jumlah IP unik (KMV sketch)
+IP_SKETCH_SIZE = 16
+_HASH_SPACE = 2 ** 63
+
+
+def ip_hash(ip: str) -> int:
+    """Hash 63-bit positif dari alamat IP (muat di kolom bigint Postgres)."""
+    return int.from_bytes(hashlib.blake2b(ip.encode("utf-8"), digest_size=8).digest(), "big") >> 1
+
+
+def estimate_distinct(sketch: Sequence[int], size: int = IP_SKETCH_SIZE) -> int:
+    """Perkiraan jumlah nilai unik dari sketch KMV (tepat jika nilai unik < size)."""
+    if len(sketch) < size:
+        return len(sketch)
+    return round((size - 1) * _HASH_SPACE / max(sketch[size - 1], 1))
+
+
+class UsageEntry:
+    __slots__ = ("uses", "first_seen", "last_seen", "sketch")
+
+    def __init__(self, now: datetime):
+        self.uses = 0
+        self.first_seen = now
+        self.last_seen = now
+        self.sketch: List[int] = [] # Terurut naik, maksimal IP_SKETCH_SIZE nilai
+
+    def add_ip(self, value: int):
+        sketch = self.sketch
+        if len(sketch) == IP_SKETCH_SIZE and value >= sketch[-1]:
+            return
+        if value in sketch:
+            return
+        sketch.append(value)
+        sketch.sort()
+        del sketch[IP_SKETCH_SIZE:]
+
+
+class UsageBuffer:
+    """Buffer pemakaian lisensi di memori (write-behind): key -> jumlah pakai, waktu terakhir, sketch IP.
+
+    record() hanya mengubah dict, tanpa I/O; isi buffer diambil dengan drain() lalu di-upsert
+    sekaligus ke database. Jumlah key dibatasi max_keys; key baru saat buffer penuh dibuang
+    dan dihitung di dropped.
+    """
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self.entries: Dict[str, UsageEntry] = {}
+        self.recorded = 0
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @property
+    def full(self) -> bool:
+        return len(self.entries) >= self.max_keys
+
+    def record(self, key: str, ip: Optional[str], now: Optional[datetime] = None) -> bool:
+        """Mencatat satu pemakaian key; False jika dibuang karena buffer penuh."""
+        entry = self.entries.get(key)
+        if entry is None:
+            if self.full:
+                self.dropped += 1
+                return False
+            entry = self.entries[key] = UsageEntry(now or datetime.now(timezone.utc))
+        entry.uses += 1
+        entry.last_seen = now or datetime.now(timezone.utc)
+        if ip:
+            entry.add_ip(ip_hash(ip))
+        self.recorded += 1
+        return True
+
+    def drain(self) -> Dict[str, UsageEntry]:
+        """Mengambil seluruh isi buffer dan mengosongkannya."""
+        entries, self.entries = self.entries, {}
+        return entries
+
+    def restore(self, entries: Dict[str, UsageEntry]):
+        """Mengembalikan hasil drain() yang gagal di-flush (digabung dengan pemakaian baru)."""
+        for key, old in entries.items():
+            entry = self.entries.get(key)
+            if entry is None:
+                if self.full:
+                    self.dropped += old.uses
+                    continue
+                self.entries[key] = old
+                continue
+            entry.uses += old.uses
+            entry.first_seen = min(entry.first_seen, old.first_seen)
+            entry.sketch = heapq.nsmallest(IP_SKETCH_SIZE, set(entry.sketch) | set(old.sketch))
@@ -1,21 +1,133 @@
+import atexit
+import copy
+import json
 import logging
+import logging.handlers
+import os
+import queue
+import random
 import sys
+from datetime import datetime, timezone
+from typing import Dict, Optional
 
-def setup_logging():
-    """Konfigurasi logging dasar."""
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
-        datefmt="%Y-%m-%d %H:%M:%S",
-        stream=sys.stdout # Log ke console
-        # Jika ingin log ke file juga:
-        # handlers=[
-        #     logging.FileHandler("bot.log"),
-        #     logging.StreamHandler(sys.stdout)
-        # ]
-    )
+from utils.metrics import REGISTRY
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_listener_pid = None # Thread listener tidak ikut ter-fork ke proses worker
+_dropped_records = 0
+
+REGISTRY.gauge("log_records_dropped", "Log record yang dibuang karena antrean logging penuh", lambda: _dropped_records)
+
+
+class JsonFormatter(logging.Formatter):
+    """Format log sebagai satu objek JSON per baris (JSON Lines)."""
+
+    # Atribut bawaan LogRecord; atribut lain berasal dari extra={...}
+    _RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in self._RESERVED and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class RouteSamplingFilter(logging.Filter):
+    """Sampling log INFO/DEBUG per route (extra={"route": ...}); WARNING ke atas selalu lolos."""
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.INFO:
+            return True
+        rate = self.rates.get(getattr(record, "route", None))
+        return rate is None or random.random() < rate
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler yang menunda format pesan ke thread listener dan membuang record saat antrean penuh."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Antrean in-process: tidak perlu format/pickle di thread pemanggil (event loop)
+        return copy.copy(record)
+
+    def enqueue(self, record: logging.LogRecord):
+        global _dropped_records
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _dropped_records += 1
+
+
+def parse_sample_rates(value: str) -> Dict[str, float]:
+    """Parse "route=rate,route2=rate2" (mis. "/get_script=0.01") menjadi dict."""
+    rates = {}
+    for item in filter(None, (part.strip() for part in (value or "").split(","))):
+        route, _, rate = item.partition("=")
+        try:
+            rates[route.strip()] = max(0.0, min(1.0, float(rate)))
+        except ValueError:
+            print(f"Format LOG_SAMPLE_RATES tidak valid: '{item}'", file=sys.stderr)
+    return rates
+
+
+def setup_logging(level: str = "INFO", use_queue: bool = False, json_output: bool = False,
+                  sample_rates: str = "", queue_size: int = 10000):
+    """Konfigurasi logging.
+
+    use_queue: format dan tulis log di thread latar (QueueHandler/QueueListener)
+    json_output: output JSON Lines alih-alih teks
+    sample_rates: rate sampling log INFO per route, mis. "/get_script=0.01,/get_scripts=0.1"
+    """
+    global _listener, _listener_pid
+
+    if json_output:
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(
+            "%(asctime)s [%(levelname)s] %(name)s: %(message)s",
+            datefmt="%Y-%m-%d %H:%M:%S",
+        )
+    stream_handler = logging.StreamHandler(sys.stdout) # Log ke console
+    stream_handler.setFormatter(formatter)
+    # Jika ingin log ke file juga, tambahkan logging.FileHandler("bot.log") di sini
+
+    if use_queue:
+        if _listener is not None and _listener_pid == os.getpid():
+            _listener.stop()
+        log_queue = queue.Queue(maxsize=queue_size)
+        handler = DeferredQueueHandler(log_queue)
+        _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+        _listener_pid = os.getpid()
+        _listener.start()
+        atexit.register(stop_logging)
+    else:
+        handler = stream_handler
+    rates = parse_sample_rates(sample_rates)
+    if rates:
+        handler.addFilter(RouteSamplingFilter(rates))
+
+    logging.basicConfig(level=getattr(logging, level.upper(), logging.INFO), handlers=[handler], force=True)
     # Mengurangi log dari library pihak ketiga yang terlalu 'cerewet'
     logging.getLogger("discord").setLevel(logging.WARNING)
     logging.getLogger("asyncio").setLevel(logging.WARNING)
     logging.getLogger("asyncpg").setLevel(logging.WARNING)
     logging.getLogger("aiohttp.access").setLevel(logging.WARNING)
+
+
+def stop_logging():
+    """Menghentikan listener antrean logging dan menulis sisa record."""
+    global _listener
+    if _listener is not None and _listener_pid == os.getpid():
+        _listener.stop()
+    _listener = None
@@ -0,0 +1,58 @@
+import re
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import discord
+from discord.ext import commands
+
+_MEMBER_ID_RE = re.compile(r"<@!?([0-9]{15,20})>$|([0-9]{15,20})$")
+
+
+class MemberLRU:
+    """Cache member terbatas (LRU) untuk mode lean, pengganti cache member penuh discord.py."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._data: "OrderedDict[Tuple[int, int], discord.Member]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, guild_id: int, user_id: int) -> Optional[discord.Member]:
+        member = self._data.get((guild_id, user_id))
+        if member is None:
+            self.misses += 1
+            return None
+        self._data.move_to_end((guild_id, user_id))
+        self.hits += 1
+        return member
+
+    def put(self, member: discord.Member):
+        if self.max_size <= 0:
+            return
+        key = (member.guild.id, member.id)
+        self._data[key] = member
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+
+class CachedMemberConverter(commands.MemberConverter):
+    """MemberConverter yang memakai bot.member_lru sebelum query ke gateway/HTTP.
+
+    Tanpa member_lru (mode lean mati) perilakunya sama dengan MemberConverter biasa.
+    """
+
+    async def convert(self, ctx: commands.Context, argument: str) -> discord.Member:
+        cache: Optional[MemberLRU] = getattr(ctx.bot, "member_lru", None)
+        match = _MEMBER_ID_RE.match(argument)
+        if cache is not None and ctx.guild is not None and match:
+            member = cache.get(ctx.guild.id, int(match.group(1) or match.group(2)))
+            if member is not None:
+                return member
+        member = await super().convert(ctx, argument)
+        if cache is not None:
+            cache.put(member)
+        return member
@@ -0,0 +1,158 @@
+import bisect
+import logging
+import os
+import resource
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+log = logging.getLogger(__name__)
+
+# Bucket latency default (detik), cukup rapat di bawah 100 ms untuk jalur cache/katalog
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _escape_label_value(value: str) -> str:
+    """Escape nilai label sesuai format teks Prometheus (backslash, kutip ganda, newline)."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames: Sequence[str], labelvalues: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape_label_value(value)}"' for name, value in zip(labelnames, labelvalues)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    """Counter monotonik dengan label opsional."""
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labelvalues: str, amount: float = 1):
+        self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues: str) -> float:
+        return self._values.get(labelvalues, 0)
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+                for labels, value in sorted(self._values.items())]
+
+
+class Gauge:
+    """Gauge yang nilainya di-set langsung atau dibaca dari fungsi saat scrape."""
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, func: Optional[Callable[[], float]] = None):
+        self.name = name
+        self.help = help_text
+        self.func = func
+        self._value = 0.0
+
+    def set(self, value: float):
+        self._value = value
+
+    def set_function(self, func: Optional[Callable[[], float]]):
+        self.func = func
+
+    def render(self) -> List[str]:
+        value = self._value
+        if self.func is not None:
+            try:
+                value = self.func()
+            except Exception as e:
+                log.debug(f"Gauge {self.name} gagal dibaca: {e}")
+                return []
+        return [f"{self.name} {_format_value(value)}"]
+
+
+class Histogram:
+    """Histogram dengan bucket tetap; observe() hanya bisect + increment."""
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label -> [jumlah per bucket (non-kumulatif, + slot +Inf), total, count]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labelvalues: str):
+        item = self._values.get(labelvalues)
+        if item is None:
+            item = self._values[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        item[0][bisect.bisect_left(self.buckets, value)] += 1
+        item[1] += value
+        item[2] += 1
+
+    def render(self) -> List[str]:
+        lines = []
+        for labels, (counts, total, count) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            label_str = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_str} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_str} {count}")
+        return lines
+
+
+class Registry:
+    """Kumpulan metric yang dirender ke format teks Prometheus."""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+
+    def register(self, metric):
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name: str, help_text: str, func: Optional[Callable[[], float]] = None) -> Gauge:
+        return self.register(Gauge(name, help_text, func))
+
+    def histogram(self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def process_rss_bytes() -> float:
+    """RSS proses saat ini (Linux /proc), fallback ke puncak RSS dari getrusage."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+# Registry global per proses (tiap worker api_server.py punya registry sendiri)
+REGISTRY = Registry()
+REGISTRY.gauge("process_resident_memory_bytes", "Resident memory proses (bytes)", process_rss_bytes)
+
+# Dipakai beberapa cog (webserver, outbox); didefinisikan sekali di sini agar semua berbagi satu counter
+DISCORD_API_CALLS = REGISTRY.counter("discord_api_calls_total", "Jumlah request REST ke Discord per operasi", ("operation",))
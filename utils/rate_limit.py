@@ -0,0 +1,65 @@
+import time
+from typing import Dict, Hashable, List
+
+
+class TokenBucketLimiter:
+    """Rate limiter token bucket in-memory per key (IP atau key lisensi).
+
+    Tiap bucket hanya [token, waktu_update_terakhir]. Bucket yang sudah idle cukup
+    lama untuk terisi penuh kembali dibuang secara berkala, karena hasilnya sama
+    dengan bucket baru.
+    """
+
+    def __init__(self, rate: float, burst: float, max_keys: int = 100000, sweep_interval: float = 60.0):
+        self.rate = rate            # Token per detik
+        self.burst = burst          # Kapasitas bucket
+        self.max_keys = max_keys
+        self.sweep_interval = sweep_interval
+        self._buckets: Dict[Hashable, List[float]] = {}
+        self._last_sweep = time.monotonic()
+        self.allowed = 0
+        self.throttled = 0
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def allow(self, key: Hashable, cost: float = 1.0) -> bool:
+        """Mengambil token untuk key; False jika bucket kosong (request harus ditolak)."""
+        now = time.monotonic()
+        if now - self._last_sweep >= self.sweep_interval or len(self._buckets) >= self.max_keys:
+            self.sweep(now)
+
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [self.burst, now]
+        else:
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+
+        if bucket[0] >= cost:
+            bucket[0] -= cost
+            self.allowed += 1
+            return True
+        self.throttled += 1
+        return False
+
+    def retry_after(self, key: Hashable, cost: float = 1.0) -> float:
+        """Perkiraan detik sampai request berikutnya untuk key diizinkan."""
+        bucket = self._buckets.get(key)
+        if bucket is None or bucket[0] >= cost or self.rate <= 0:
+            return 0.0
+        return (cost - bucket[0]) / self.rate
+
+    def sweep(self, now: float = None):
+        """Membuang bucket idle yang sudah penuh kembali; jika masih terlalu banyak, buang yang terlama."""
+        now = time.monotonic() if now is None else now
+        self._last_sweep = now
+        full_after = self.burst / self.rate if self.rate > 0 else float("inf")
+        idle = [key for key, (_, last) in self._buckets.items() if now - last >= full_after]
+        for key in idle:
+            del self._buckets[key]
+        # Batas keras memori (mis. banjir IP palsu): dict menyimpan urutan insert, buang yang terlama
+        overflow = len(self._buckets) - self.max_keys + self.max_keys // 10
+        if overflow > 0 and len(self._buckets) >= self.max_keys:
+            for key in list(self._buckets)[:overflow]:
+                del self._buckets[key]
@@ -0,0 +1,107 @@
+import logging
+from typing import Dict, Iterable, NamedTuple, Optional, Set, Tuple
+
+log = logging.getLogger(__name__)
+
+
+class ScriptEntry(NamedTuple):
+    """Satu attachment script yang tercatat di katalog."""
+    filename: str
+    url: str
+    message_id: int
+    attachment_id: int
+
+
+class ScriptCatalog:
+    """Index in-memory nama file (lowercase) -> attachment script terbaru.
+
+    Semua attachment per nama file disimpan berdasarkan message_id supaya
+    saat pesan terbaru dihapus, attachment lama dengan nama sama otomatis
+    dipakai lagi (sama seperti hasil scan history dari yang terbaru).
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, Dict[int, ScriptEntry]] = {}  # nama -> {message_id: entry}
+        self._latest: Dict[str, ScriptEntry] = {}              # nama -> entry terbaru (lookup O(1))
+        self._by_message: Dict[int, Tuple[str, ...]] = {}      # message_id -> nama file di pesan itu
+        self.ready = False
+
+    def __len__(self) -> int:
+        return len(self._latest)
+
+    def get(self, script_name: str) -> Optional[ScriptEntry]:
+        """Mengambil entry terbaru untuk nama script (case-insensitive)."""
+        return self._latest.get(script_name.lower())
+
+    def entries(self) -> Tuple[ScriptEntry, ...]:
+        """Semua entry terbaru (satu per nama file)."""
+        return tuple(self._latest.values())
+
+    def _refresh_latest(self, name: str):
+        per_message = self._entries.get(name)
+        if per_message:
+            self._latest[name] = per_message[max(per_message)]
+        else:
+            self._entries.pop(name, None)
+            self._latest.pop(name, None)
+
+    def set_message(self, message_id: int, attachments: Iterable[Tuple[str, str, int]]) -> Set[str]:
+        """Mengganti semua attachment milik satu pesan (filename, url, attachment_id).
+
+        Mengembalikan nama file (lowercase) yang entry-nya mungkin berubah.
+        """
+        changed = self.remove_message(message_id)
+        names = []
+        for filename, url, attachment_id in attachments:
+            name = filename.lower()
+            self._entries.setdefault(name, {})[message_id] = ScriptEntry(filename, url, message_id, attachment_id)
+            names.append(name)
+            self._refresh_latest(name)
+        if names:
+            self._by_message[message_id] = tuple(names)
+        changed.update(names)
+        return changed
+
+    def remove_message(self, message_id: int) -> Set[str]:
+        """Menghapus semua attachment milik satu pesan dari katalog, mengembalikan nama yang terdampak."""
+        names = self._by_message.pop(message_id, ())
+        for name in names:
+            per_message = self._entries.get(name)
+            if per_message:
+                per_message.pop(message_id, None)
+            self._refresh_latest(name)
+        return set(names)
+
+    def clear(self):
+        self._entries.clear()
+        self._latest.clear()
+        self._by_message.clear()
+
+
+def catalog_from_entries(entries: Iterable[ScriptEntry]) -> ScriptCatalog:
+    """Membuat katalog dari daftar entry (mis. hasil baca tabel script_catalog).
+
+    Katalog kosong tidak ditandai ready: tabel kosong biasanya berarti bot belum mempublikasikan
+    katalog (CATALOG_PUBLISH=false), bukan channel yang memang kosong.
+    """
+    by_message: Dict[int, list] = {}
+    for entry in entries:
+        by_message.setdefault(entry.message_id, []).append((entry.filename, entry.url, entry.attachment_id))
+    catalog = ScriptCatalog()
+    for message_id in sorted(by_message):
+        catalog.set_message(message_id, by_message[message_id])
+    catalog.ready = len(catalog) > 0
+    return catalog
+
+
+def message_attachments(message) -> Tuple[Tuple[str, str, int], ...]:
+    """Mengubah attachment discord.Message menjadi tuple untuk ScriptCatalog."""
+    return tuple((a.filename, a.url, a.id) for a in message.attachments)
+
+
+def payload_attachments(data: dict) -> Optional[Tuple[Tuple[str, str, int], ...]]:
+    """Mengambil attachment dari payload raw gateway (None jika tidak ada di payload)."""
+    attachments = data.get("attachments")
+    if attachments is None:
+        return None
+    return tuple((a["filename"], a["url"], int(a["id"])) for a in attachments)
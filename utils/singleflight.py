@@ -0,0 +1,36 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """Menggabungkan panggilan async identik yang berjalan bersamaan menjadi satu.
+
+    Pemanggil dengan key yang sama selama panggilan pertama belum selesai akan
+    menunggu hasil yang sama, bukan menjalankan I/O sendiri.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.calls = 0      # Panggilan yang benar-benar menjalankan I/O
+        self.shared = 0     # Panggilan yang menumpang hasil panggilan lain
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    def _forget(self, key: Hashable, future: asyncio.Future):
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        """Menjalankan func() sekali per key yang sedang in-flight dan membagi hasilnya."""
+        future = self._inflight.get(key)
+        if future is None:
+            self.calls += 1
+            # Task terpisah supaya pembatalan satu request (client disconnect) tidak
+            # membatalkan hasil yang ditunggu request lain
+            future = asyncio.ensure_future(func())
+            self._inflight[key] = future
+            future.add_done_callback(lambda f: self._forget(key, f))
+        else:
+            self.shared += 1
+        return await asyncio.shield(future)